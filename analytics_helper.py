@@ -2,10 +2,103 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
+import os
 import json
 import csv
+import sqlite3
+import threading
 from io import StringIO
 
+import cache_helper
+import settings_helper
+
+DEFAULT_QUERY_STATS_PATH = os.path.join(".cache", "query_stats.db")
+
+
+class PopularQueries:
+    """Process-wide, durable counts of searched title/filter combinations, shared by all sessions"""
+    
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            path = settings_helper.env_str("BOOKVOYAGER_QUERY_STATS_PATH", DEFAULT_QUERY_STATS_PATH)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = None
+        if self.path:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+                self._connection.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS popular_queries (
+                        key TEXT PRIMARY KEY,
+                        request TEXT NOT NULL,
+                        count INTEGER NOT NULL,
+                        last_seen TEXT NOT NULL
+                    )
+                    """
+                )
+                self._connection.commit()
+            except Exception as e:
+                print(f"Error opening query stats at {self.path}: {e}")
+                self._connection = None
+    
+    def record(self, book_title: str, num_books: int = 5, genres: Optional[List[str]] = None,
+               era: Optional[str] = None, reading_level: Optional[str] = None, book_length: Optional[str] = None):
+        """Count one search for a title/filter combination"""
+        if self._connection is None or not book_title:
+            return
+        key = cache_helper.make_cache_key(book_title, num_books, genres, era, reading_level, book_length)
+        request = json.dumps({
+            'book_title': book_title,
+            'num_books': num_books,
+            'genres': genres or [],
+            'era': era,
+            'reading_level': reading_level,
+            'book_length': book_length
+        })
+        try:
+            with self._lock:
+                self._connection.execute(
+                    """
+                    INSERT INTO popular_queries (key, request, count, last_seen) VALUES (?, ?, 1, ?)
+                    ON CONFLICT(key) DO UPDATE SET count = count + 1, last_seen = excluded.last_seen
+                    """,
+                    (key, request, datetime.now().isoformat())
+                )
+                self._connection.commit()
+        except Exception as e:
+            print(f"Error recording popular query: {e}")
+    
+    def top(self, limit: int = 50) -> List[Dict]:
+        """Get the most searched title/filter combinations, most popular first"""
+        if self._connection is None:
+            return []
+        try:
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT request, count FROM popular_queries ORDER BY count DESC, last_seen DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            return [dict(json.loads(request), count=count) for request, count in rows]
+        except Exception as e:
+            print(f"Error reading popular queries: {e}")
+            return []
+
+
+_popular_queries = None
+_popular_queries_lock = threading.Lock()
+
+def get_popular_queries() -> PopularQueries:
+    """Get the process-wide popular query store"""
+    global _popular_queries
+    with _popular_queries_lock:
+        if _popular_queries is None:
+            _popular_queries = PopularQueries()
+        return _popular_queries
+
 class AnalyticsHelper:
     """Helper class for reading analytics, history, and export features"""
     
@@ -36,8 +129,8 @@ class AnalyticsHelper:
         }
         st.session_state.reading_history.append(history_entry)
     
-    def add_to_search_history(self, query: str, num_results: int):
-        """Add a search to search history"""
+    def add_to_search_history(self, query: str, num_results: int, filters: Optional[Dict] = None):
+        """Add a search to search history and to the process-wide popular queries"""
         search_entry = {
             'timestamp': datetime.now().isoformat(),
             'query': query,
@@ -45,6 +138,7 @@ class AnalyticsHelper:
         }
         st.session_state.search_history.append(search_entry)
         st.session_state.reading_stats['total_searches'] += 1
+        get_popular_queries().record(query, num_results, **(filters or {}))
     
     def update_reading_stats(self, genres: List[str]):
         """Update reading statistics"""
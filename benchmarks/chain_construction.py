@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-call chain construction overhead
+
+Compares rebuilding the PromptTemplates, LLMChains and SequentialChain on every
+call (how generate_book_recommendations used to work) with looking the compiled
+chain up in langchain_helper.chain_registry. No LLM calls are made.
+
+Usage:
+    python benchmarks/chain_construction.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain.chains import LLMChain, SequentialChain
+from langchain_core.language_models import FakeListLLM
+
+import langchain_helper
+
+
+def build_per_call(model):
+    """Rebuild both prompt templates and all three chains, as every call used to"""
+    books_prompt = langchain_helper.build_books_prompt()
+    journey_prompt = langchain_helper.build_journey_prompt()
+    books_chain = LLMChain(llm=model, prompt=books_prompt, output_key="book_recommendations")
+    list_chain = LLMChain(llm=model, prompt=journey_prompt, output_key="reading_journey")
+    return SequentialChain(
+        chains=[books_chain, list_chain],
+        input_variables=books_prompt.input_variables,
+        output_variables=['book_recommendations', 'reading_journey']
+    )
+
+
+def build_from_registry(model):
+    """Fetch the compiled chain from the shared registry"""
+    return langchain_helper.chain_registry.get_recommendation_chain(model, 5)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    model = FakeListLLM(responses=["ok"])
+    build_from_registry(model)  # compile once up front, as the first real call would
+
+    per_call = timeit.timeit(lambda: build_per_call(model), number=iterations) / iterations
+    registry = timeit.timeit(lambda: build_from_registry(model), number=iterations) / iterations
+
+    print(f"Iterations:            {iterations}")
+    print(f"Per-call construction: {per_call * 1e6:10.1f} µs/call")
+    print(f"Registry lookup:       {registry * 1e6:10.1f} µs/call")
+    print(f"Speedup:               {per_call / registry:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
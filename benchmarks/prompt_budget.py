@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+A/B benchmark: original books prompt vs compact prompt with a completion cap
+
+For each title both variants are sent back to back:
+
+- full:    the original three-example template, no max_tokens
+- compact: the compact template with max_tokens from PromptBudget
+
+and latency, prompt/completion tokens and parse success (every requested
+book has title, author, year, description and reason) are compared. Runs
+against the fake backend by default, which honours max_tokens but answers
+both prompts alike, so it only shows the effect of the cap; use
+--backend groq (needs GROQ_API_KEY, spends quota) for real numbers.
+
+Usage:
+    python benchmarks/prompt_budget.py [--backend fake|groq] [--num-books 5] [--titles 10]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Make the fake backend's answer time depend on its length, like a real model
+os.environ.setdefault("BOOKVOYAGER_FAKE_LATENCY", "0.2")
+os.environ.setdefault("BOOKVOYAGER_FAKE_TOKENS_PER_SECOND", "400")
+
+import langchain_helper
+import prompt_budget_helper
+
+TITLES = [
+    "The Alchemist", "Dune", "Pride and Prejudice", "The Hobbit", "1984", "Gone Girl",
+    "Sapiens", "The Great Gatsby", "Atomic Habits", "Beloved", "The Road", "Circe"
+]
+BOOK_FIELDS = ("**Author**:", "**Year**:", "**Description**:", "**Why Recommended**:")
+
+
+def count_complete_books(text):
+    """Count entries that have a title and every other field"""
+    entries = re.split(r"\*\*Title\*\*:", text)[1:]
+    return sum(1 for entry in entries if all(field in entry for field in BOOK_FIELDS))
+
+
+def run_variant(model, variant, book_title, num_books):
+    """Send one books prompt and measure it"""
+    filters = langchain_helper.build_filter_text(None, None, None, None)
+    inputs = langchain_helper._chain_inputs(book_title, num_books, filters)
+    if variant == "full":
+        prompt = langchain_helper.build_books_prompt().format(**inputs)
+        runnable = model
+    else:
+        prompt = langchain_helper.build_compact_books_prompt().format(**inputs)
+        runnable = model.bind(max_tokens=prompt_budget_helper.PromptBudget(variant="compact").max_tokens('books', num_books))
+
+    started = time.perf_counter()
+    try:
+        text = runnable.invoke(prompt).content
+    except Exception as e:
+        print(f"  {variant:8} {book_title}: {e}")
+        return None
+    elapsed = time.perf_counter() - started
+    return {
+        'latency': elapsed,
+        'prompt_tokens': prompt_budget_helper.count_tokens(prompt),
+        'completion_tokens': prompt_budget_helper.count_tokens(text),
+        'parsed': count_complete_books(text) >= num_books
+    }
+
+
+def report(variant, results):
+    ok = [result for result in results if result]
+    if not ok:
+        print(f"{variant:8} no successful calls")
+        return
+    latencies = sorted(result['latency'] for result in ok)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(
+        f"{variant:8} calls={len(results):3}  parse ok={sum(r['parsed'] for r in ok) / len(results):6.1%}  "
+        f"latency p50={statistics.median(latencies):6.2f}s p95={p95:6.2f}s  "
+        f"prompt={statistics.mean(r['prompt_tokens'] for r in ok):6.0f} tok  "
+        f"completion={statistics.mean(r['completion_tokens'] for r in ok):6.0f} tok"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the full and compact books prompts")
+    parser.add_argument("--backend", choices=sorted(langchain_helper.LLM_BACKENDS), default="fake")
+    parser.add_argument("--num-books", type=int, default=5)
+    parser.add_argument("--titles", type=int, default=len(TITLES))
+    args = parser.parse_args()
+
+    model = langchain_helper.LLM_BACKENDS[args.backend](langchain_helper.MODEL_NAME)
+    results = {'full': [], 'compact': []}
+    for book_title in (TITLES * (args.titles // len(TITLES) + 1))[:args.titles]:
+        # Interleave the variants so upstream load changes affect both alike
+        for variant in results:
+            results[variant].append(run_variant(model, variant, book_title, args.num_books))
+
+    print(f"Backend: {args.backend}, {args.num_books} books per request")
+    for variant, variant_results in results.items():
+        report(variant, variant_results)
+
+
+if __name__ == "__main__":
+    main()
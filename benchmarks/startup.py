@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: import time and time-to-first-render
+
+Each sample runs in a fresh interpreter so nothing is already imported:
+
+- import: time to `import langchain_helper`
+- first render: interpreter start to the end of the first script run of
+  main.py under streamlit's AppTest (imports + first full page render)
+
+Pass --eager to import LangChain, langchain_groq and the chain classes up
+front, as langchain_helper did at import time before the client and imports
+were made lazy. No LLM calls are made and the cache warm-up is disabled.
+
+Usage:
+    python benchmarks/startup.py [--eager] [runs]
+"""
+
+import os
+import sys
+import json
+import statistics
+import subprocess
+import tempfile
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+EAGER_IMPORTS = """
+from langchain.prompts import PromptTemplate
+from langchain.chains import LLMChain, SequentialChain
+from langchain_groq import ChatGroq
+"""
+
+IMPORT_SCRIPT = """
+import time, json
+started = time.perf_counter()
+{eager}
+import langchain_helper
+print(json.dumps(time.perf_counter() - started))
+"""
+
+RENDER_SCRIPT = """
+import time, json
+started = time.perf_counter()
+{eager}
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("main.py", default_timeout=60).run()
+if app.exception:
+    raise SystemExit(str(app.exception))
+print(json.dumps(time.perf_counter() - started))
+"""
+
+
+def run_sample(script, eager, env):
+    """Run one timing script in a fresh interpreter and return its measurement in seconds"""
+    output = subprocess.run(
+        [sys.executable, "-c", script.format(eager=EAGER_IMPORTS if eager else "")],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if arg != "--eager"]
+    eager = "--eager" in sys.argv[1:]
+    runs = int(args[0]) if args else 5
+
+    with tempfile.TemporaryDirectory() as scratch:
+        env = dict(
+            os.environ,
+            BOOKVOYAGER_WARMUP="false",
+            BOOKVOYAGER_CACHE_PATH="",
+            BOOKVOYAGER_QUERY_STATS_PATH=os.path.join(scratch, "query_stats.db")
+        )
+        imports = [run_sample(IMPORT_SCRIPT, eager, env) for _ in range(runs)]
+        renders = [run_sample(RENDER_SCRIPT, eager, env) for _ in range(runs)]
+
+    print(f"Mode:                  {'eager (previous behaviour)' if eager else 'lazy'}")
+    print(f"Runs:                  {runs}")
+    print(f"Import langchain_helper: {statistics.median(imports) * 1000:8.1f} ms (median)")
+    print(f"Time to first render:  {statistics.median(renders) * 1000:10.1f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+BookVoyager Bulk Recommendation Generator
+Precomputes recommendations for many titles offline and loads them into the cache.
+
+Usage:
+    python bulk_generate.py generate titles.csv -o recommendations.jsonl [--workers 4]
+    python bulk_generate.py load recommendations.jsonl
+
+Input is CSV (a header row with book_title and optionally num_books, genres,
+era, reading_level, book_length; genres separated by ';') or JSONL (one
+request object or bare title per line). Every finished request is appended
+to the output JSONL as soon as it completes, so rerunning the same command
+after a crash skips whatever already succeeded and retries the rest.
+"""
+
+import os
+import sys
+import csv
+import json
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import langchain_helper
+
+BULK_SESSION_ID = "bulk-generate"
+REQUEST_FIELDS = ("book_title", "num_books", "genres", "era", "reading_level", "book_length")
+
+
+def parse_request(entry):
+    """Normalize a CSV row or JSONL entry into generate_book_recommendations keyword arguments"""
+    if isinstance(entry, str):
+        entry = {'book_title': entry}
+    request = {field: entry[field] for field in REQUEST_FIELDS if entry.get(field) not in (None, "")}
+
+    if 'num_books' in request:
+        request['num_books'] = int(request['num_books'])
+    if isinstance(request.get('genres'), str):
+        request['genres'] = [genre.strip() for genre in request['genres'].split(";") if genre.strip()]
+    if isinstance(request.get('book_title'), str):
+        request['book_title'] = request['book_title'].strip()
+    return request
+
+
+def read_requests(path):
+    """Read requests from a CSV or JSONL file"""
+    requests = []
+    with open(path, encoding="utf-8", newline="") as input_file:
+        if path.lower().endswith(".csv"):
+            # Line 1 is the header
+            entries = enumerate(csv.DictReader(input_file), 2)
+        else:
+            entries = ((line_number, line.strip()) for line_number, line in enumerate(input_file, 1))
+
+        for line_number, entry in entries:
+            if isinstance(entry, str):
+                if not entry or entry.startswith("#"):
+                    continue
+                try:
+                    entry = json.loads(entry)
+                except json.JSONDecodeError:
+                    pass  # a bare title
+            try:
+                if not isinstance(entry, (dict, str)):
+                    raise ValueError("Request must be an object or a title")
+                request = parse_request(entry)
+                langchain_helper.validate_recommendation_inputs(
+                    request.get('book_title'), request.get('num_books', 5), request.get('genres'), request.get('era')
+                )
+            except ValueError as e:
+                print(f"⚠️  Skipping line {line_number}: {str(e)}")
+                continue
+            requests.append(request)
+    return requests
+
+
+def request_cache_key(request, mode):
+    """Cache key a request's result is stored under"""
+    return langchain_helper.make_recommendation_cache_key(
+        request.get('book_title', ""), request.get('num_books', 5), request.get('genres'),
+        request.get('era'), request.get('reading_level'), request.get('book_length'), mode=mode
+    )
+
+
+def read_output(path):
+    """Yield the records of an output file, ignoring a final line truncated by a crash"""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as output_file:
+        for line in output_file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def completed_keys(path):
+    """Cache keys that already have a successful result in the output file (the checkpoint)"""
+    return {record['cache_key'] for record in read_output(path) if record.get('result')}
+
+
+def generate_one(request, mode):
+    """Generate recommendations for one request, returning its output record"""
+    record = {
+        'cache_key': request_cache_key(request, mode),
+        'request': request,
+        'model': langchain_helper.CACHE_MODEL_ID,
+        'prompt_version': langchain_helper.PROMPT_VERSION,
+        'mode': mode,
+        'result': None,
+        'error': None
+    }
+    try:
+        result = langchain_helper.generate_book_recommendations(
+            mode=mode, session_id=BULK_SESSION_ID, use_semantic=False, **request
+        )
+        if result.get('stale'):
+            raise Exception("Only a stale cached result was available")
+        record['result'] = result
+    except Exception as e:
+        record['error'] = str(e)
+    record['generated_at'] = datetime.now().isoformat()
+    return record
+
+
+def run_generate(args):
+    """Generate recommendations for every pending request in the input file"""
+    mode = args.mode or langchain_helper.GENERATION_MODE
+    requests = read_requests(args.input)
+    done = completed_keys(args.output)
+
+    pending, seen = [], set(done)
+    for request in requests:
+        key = request_cache_key(request, mode)
+        if key not in seen:
+            seen.add(key)
+            pending.append(request)
+
+    print(f"📚 {len(requests)} requests, {len(requests) - len(pending)} already done or duplicated, {len(pending)} to generate")
+    if not pending:
+        return 0
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(output_dir, exist_ok=True)
+
+    succeeded = failed = 0
+    with open(args.output, "a+", encoding="utf-8") as output_file:
+        # Terminate a line left half-written by a crash so the next record starts cleanly
+        if output_file.tell() > 0:
+            output_file.seek(output_file.tell() - 1)
+            if output_file.read(1) != "\n":
+                output_file.write("\n")
+
+        def checkpoint(record):
+            # One line per finished request, on disk before we move on
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+            os.fsync(output_file.fileno())
+
+        executor = ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="bulk-generate")
+        remaining = iter(pending)
+        in_flight = set()
+        try:
+            while True:
+                # Keep at most a couple of requests per worker queued, however large the input
+                while len(in_flight) < args.workers * 2:
+                    request = next(remaining, None)
+                    if request is None:
+                        break
+                    in_flight.add(executor.submit(generate_one, request, mode))
+                if not in_flight:
+                    break
+
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record = future.result()
+                    checkpoint(record)
+                    if record['result']:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                        print(f"❌ {record['request'].get('book_title')}: {record['error']}")
+
+                    total = succeeded + failed
+                    if total % args.progress_every == 0 or total == len(pending):
+                        print(f"⏳ {total}/{len(pending)} done ({succeeded} succeeded, {failed} failed)")
+        except KeyboardInterrupt:
+            print("\n⚠️  Interrupted - rerun the same command to resume")
+            executor.shutdown(wait=False, cancel_futures=True)
+            return 130
+        executor.shutdown()
+
+    print(f"✅ Finished: {succeeded} succeeded, {failed} failed")
+    return 1 if failed else 0
+
+
+def run_load(args):
+    """Load a generated output file into the recommendation cache"""
+    cache = langchain_helper.recommendation_cache
+    if not cache.path:
+        print("⚠️  The disk cache is disabled (BOOKVOYAGER_CACHE_PATH is empty); results will not outlive this process")
+
+    loaded = skipped = outdated = 0
+    for record in read_output(args.input):
+        if not record.get('result'):
+            skipped += 1
+            continue
+        # Entries from a different model or prompt version would never be looked up
+        if (record.get('model') != langchain_helper.CACHE_MODEL_ID
+                or record.get('prompt_version') != langchain_helper.PROMPT_VERSION
+                or record.get('cache_key') != request_cache_key(record['request'], record.get('mode', "chain"))):
+            outdated += 1
+            continue
+        cache.set(record['cache_key'], record['result'])
+        loaded += 1
+
+    print(f"✅ Loaded {loaded} recommendations into the cache ({skipped} failed, {outdated} outdated skipped)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute BookVoyager recommendations offline")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Generate recommendations for a CSV/JSONL list of titles")
+    generate.add_argument("input", help="CSV or JSONL file of titles and filters")
+    generate.add_argument("-o", "--output", required=True, help="JSONL file results are appended to (also the checkpoint)")
+    generate.add_argument("--workers", type=int, default=langchain_helper.DEFAULT_BATCH_CONCURRENCY, help="Requests in flight at once")
+    generate.add_argument("--mode", choices=langchain_helper.GENERATION_MODES, help="Generation mode (default: BOOKVOYAGER_GENERATION_MODE)")
+    generate.add_argument("--progress-every", type=int, default=10, help="Print progress every N requests")
+    generate.set_defaults(handler=run_generate)
+
+    load = commands.add_parser("load", help="Load a generated JSONL file into the recommendation cache")
+    load.add_argument("input", help="JSONL file written by 'generate'")
+    load.set_defaults(handler=run_load)
+
+    args = parser.parse_args()
+    if getattr(args, "workers", 1) < 1:
+        parser.error("--workers must be at least 1")
+    sys.exit(args.handler(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,478 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "recommendations.db")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # one week
+DEFAULT_STALE_TTL_SECONDS = 30 * 24 * 60 * 60  # expired entries kept this long for stale fallback
+DEFAULT_MEMORY_SIZE = 256
+DEFAULT_DISK_SIZE = 5000
+# Tuned on real title pairs (see tests/test_semantic_cache.py): typos and article or punctuation variants match,
+# different books with similar titles ("Dark Matter" / "Dark Matters") don't
+DEFAULT_SEMANTIC_THRESHOLD = 0.83
+DEFAULT_SEMANTIC_DIMENSIONS = 4096
+DEFAULT_SEMANTIC_SIZE = 2000
+
+
+def normalize_text(value: Optional[str]) -> str:
+    """Lowercase and collapse whitespace so equivalent inputs share a key"""
+    if not value:
+        return ""
+    return " ".join(str(value).lower().split())
+
+
+def normalize_option(value: Optional[str]) -> str:
+    """Normalize a sidebar option, treating 'Any' the same as no preference"""
+    value = normalize_text(value)
+    return "" if value == "any" else value
+
+
+def make_cache_key(book_title: str, num_books: int, genres: Optional[List[str]] = None,
+                   era: Optional[str] = None, reading_level: Optional[str] = None,
+                   book_length: Optional[str] = None, model: str = "",
+                   prompt_version: str = "") -> str:
+    """Build a stable cache key from the normalized recommendation inputs"""
+    payload = {
+        'book_title': normalize_text(book_title),
+        'num_books': num_books,
+        'genres': sorted(normalize_text(genre) for genre in (genres or []) if genre),
+        'era': normalize_option(era),
+        'reading_level': normalize_option(reading_level),
+        'book_length': normalize_option(book_length),
+        'model': model,
+        'prompt_version': prompt_version
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class RecommendationCache:
+    """Two-tier cache for recommendation results: in-process LRU backed by SQLite on disk"""
+
+    def __init__(self, path: Optional[str] = None, memory_size: Optional[int] = None,
+                 disk_size: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 stale_ttl_seconds: Optional[float] = None):
+        if path is None:
+            path = settings_helper.env_str("BOOKVOYAGER_CACHE_PATH", DEFAULT_CACHE_PATH)
+        if memory_size is None:
+            memory_size = settings_helper.env_int("BOOKVOYAGER_CACHE_MEMORY_SIZE", DEFAULT_MEMORY_SIZE)
+        if disk_size is None:
+            disk_size = settings_helper.env_int("BOOKVOYAGER_CACHE_DISK_SIZE", DEFAULT_DISK_SIZE)
+        if ttl_seconds is None:
+            ttl_seconds = settings_helper.env_float("BOOKVOYAGER_CACHE_TTL", DEFAULT_TTL_SECONDS)
+        if stale_ttl_seconds is None:
+            stale_ttl_seconds = settings_helper.env_float("BOOKVOYAGER_CACHE_STALE_TTL", DEFAULT_STALE_TTL_SECONDS)
+
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._lock = threading.RLock()
+        self._connection = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0
+        }
+
+        # An empty path disables the disk tier
+        if self.path:
+            self._open_disk_tier()
+
+    def _open_disk_tier(self):
+        """Open (and create if needed) the SQLite database backing the disk tier"""
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_recommendations_accessed ON recommendations (accessed_at)"
+            )
+            self._connection.commit()
+            logger.info(f"Recommendation cache using SQLite store at {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to open recommendation cache at {self.path}: {str(e)}")
+            self._connection = None
+
+    def _is_expired(self, created_at: float) -> bool:
+        """Check whether an entry created at the given time has outlived the TTL"""
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _is_dead(self, created_at: float) -> bool:
+        """Check whether an entry is too old even to serve as a stale fallback"""
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds + self.stale_ttl_seconds
+
+    def _remember(self, key: str, created_at: float, value: Dict):
+        """Insert into the memory tier, evicting least recently used entries"""
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _lookup(self, key: str) -> Optional[tuple]:
+        """Find an entry in memory or on disk, fresh or stale. Returns (created_at, value)"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            if not self._is_dead(entry[0]):
+                self._memory.move_to_end(key)
+                return entry
+            del self._memory[key]
+
+        if self._connection is not None:
+            try:
+                row = self._connection.execute(
+                    "SELECT value, created_at FROM recommendations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created_at = json.loads(row[0]), row[1]
+                    if not self._is_dead(created_at):
+                        self._connection.execute(
+                            "UPDATE recommendations SET accessed_at = ? WHERE key = ?",
+                            (time.time(), key)
+                        )
+                        self._connection.commit()
+                        self._remember(key, created_at, value)
+                        return created_at, value
+                    self._connection.execute("DELETE FROM recommendations WHERE key = ?", (key,))
+                    self._connection.commit()
+            except Exception as e:
+                logger.error(f"Error reading recommendation cache: {str(e)}")
+        return None
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a fresh cached value, checking memory first and then disk"""
+        with self._lock:
+            in_memory = key in self._memory
+            entry = self._lookup(key)
+            if entry is not None and not self._is_expired(entry[0]):
+                self.stats['memory_hits' if in_memory else 'disk_hits'] += 1
+                return dict(entry[1])
+            self.stats['misses'] += 1
+            return None
+
+    def get_stale(self, key: str) -> Optional[Dict]:
+        """Return a cached value past its TTL but still within the stale grace period"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None and self._is_expired(entry[0]):
+                self.stats['stale_hits'] += 1
+                return dict(entry[1])
+            return None
+
+    def set(self, key: str, value: Dict):
+        """Store a value in both tiers"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, dict(value))
+            self.stats['writes'] += 1
+
+            if self._connection is not None:
+                try:
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO recommendations (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                        (key, json.dumps(value), now, now)
+                    )
+                    self._evict_disk()
+                    self._connection.commit()
+                except Exception as e:
+                    logger.error(f"Error writing recommendation cache: {str(e)}")
+
+    def _evict_disk(self):
+        """Drop rows past the stale grace period, then the least recently used rows beyond the size limit"""
+        if self.ttl_seconds > 0:
+            cursor = self._connection.execute(
+                "DELETE FROM recommendations WHERE created_at < ?",
+                (time.time() - self.ttl_seconds - self.stale_ttl_seconds,)
+            )
+            self.stats['evictions'] += max(cursor.rowcount, 0)
+
+        count = self._connection.execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
+        overflow = count - self.disk_size
+        if overflow > 0:
+            self._connection.execute(
+                "DELETE FROM recommendations WHERE key IN "
+                "(SELECT key FROM recommendations ORDER BY accessed_at ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.stats['evictions'] += overflow
+
+    def delete(self, key: str):
+        """Remove a single entry from both tiers"""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._connection is not None:
+                try:
+                    self._connection.execute("DELETE FROM recommendations WHERE key = ?", (key,))
+                    self._connection.commit()
+                except Exception as e:
+                    logger.error(f"Error deleting from recommendation cache: {str(e)}")
+
+    def clear(self):
+        """Remove every entry from both tiers"""
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                try:
+                    self._connection.execute("DELETE FROM recommendations")
+                    self._connection.commit()
+                except Exception as e:
+                    logger.error(f"Error clearing recommendation cache: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """Get hit/miss counters and current tier sizes"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = 0
+            if self._connection is not None:
+                try:
+                    stats['disk_entries'] = self._connection.execute(
+                        "SELECT COUNT(*) FROM recommendations"
+                    ).fetchone()[0]
+                except Exception as e:
+                    logger.error(f"Error reading recommendation cache stats: {str(e)}")
+            return stats
+
+
+# Words that don't change which book a title means: leading articles and
+# generic suffixes such as "harry potter books"
+LEADING_ARTICLES = ("the", "a", "an")
+TITLE_FILLER_WORDS = frozenset({"book", "books", "novel", "novels", "series", "story", "stories"})
+# Spelled-out series numbers, compared as digits
+NUMBER_WORDS = {
+    'one': "1", 'two': "2", 'three': "3", 'four': "4", 'five': "5",
+    'six': "6", 'seven': "7", 'eight': "8", 'nine': "9", 'ten': "10",
+    'ii': "2", 'iii': "3", 'iv': "4", 'v': "5", 'vi': "6", 'vii': "7", 'viii': "8", 'ix': "9"
+}
+# Where a series name ends and the book's own title starts:
+# "Harry Potter and the Sorcerer's Stone", "Dune: Messiah"
+SERIES_SEPARATOR = re.compile(r"\s*:\s*|\s+-\s+|\s+and\s+the\s+")
+
+
+def _is_number(word: str) -> bool:
+    return word.isdigit() or word in NUMBER_WORDS
+
+
+def canonical_title(title: str) -> str:
+    """
+    Strip the parts of a title that don't identify the book, for near-duplicate matching
+
+    Series numbers are dropped too; numeric_tokens compares them separately.
+    """
+    cleaned = re.sub(r"[^\w\s]", "", normalize_text(title).replace("&", " and "))
+    words = [word for word in cleaned.split() if word not in TITLE_FILLER_WORDS]
+    if any(not _is_number(word) for word in words):
+        words = [word for word in words if not _is_number(word)]
+    if len(words) > 1 and words[0] in LEADING_ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def series_name(title: str) -> str:
+    """Canonical series name in front of a subtitle ("harry potter"), or "" if the title has none"""
+    parts = SERIES_SEPARATOR.split(normalize_text(title), maxsplit=1)
+    return canonical_title(parts[0]) if len(parts) == 2 else ""
+
+
+def numeric_tokens(title: str) -> Tuple[str, ...]:
+    """
+    Series numbers in a title ("Harry Potter 2", "book two")
+
+    Hashed n-grams barely tell "2" from "3", so two titles that both carry
+    numbers only match when the numbers are identical.
+    """
+    words = re.sub(r"[^\w\s]", " ", normalize_text(title)).split()
+    return tuple(NUMBER_WORDS.get(word, word) for word in words if _is_number(word))
+
+
+def numbers_conflict(first: Tuple[str, ...], second: Tuple[str, ...]) -> bool:
+    """Whether two titles name different volumes; a title without a number names none"""
+    return bool(first) and bool(second) and first != second
+
+
+def embed_text(text: str, dimensions: int = DEFAULT_SEMANTIC_DIMENSIONS, ngram: int = 3) -> np.ndarray:
+    """
+    Embed text as an L2-normalized vector of hashed character n-grams and words
+
+    crc32 is used instead of hash() so vectors are identical across processes.
+    """
+    cleaned = " ".join(re.sub(r"[^\w\s]", "", normalize_text(text)).split())
+    vector = np.zeros(dimensions, dtype=np.float32)
+    padded = f" {cleaned} "
+    for i in range(len(padded) - ngram + 1):
+        vector[zlib.crc32(padded[i:i + ngram].encode('utf-8')) % dimensions] += 1.0
+    for word in cleaned.split():
+        vector[zlib.crc32(f"w:{word}".encode('utf-8')) % dimensions] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticCache:
+    """
+    Near-duplicate query index in front of RecommendationCache
+
+    Maps a book title to the exact cache key of a previously answered, similar
+    title. Only titles are compared and the partition (num_books, filters,
+    model, prompt version) must match exactly, so different filters never share
+    results. A series name matches the books of the series ("harry potter" /
+    "Harry Potter and the Sorcerer's Stone"), but titles with different series
+    numbers never match.
+    """
+
+    def __init__(self, threshold: Optional[float] = None, max_entries: Optional[int] = None,
+                 dimensions: int = DEFAULT_SEMANTIC_DIMENSIONS):
+        if threshold is None:
+            threshold = settings_helper.env_float("BOOKVOYAGER_SEMANTIC_THRESHOLD", DEFAULT_SEMANTIC_THRESHOLD)
+        if max_entries is None:
+            max_entries = settings_helper.env_int("BOOKVOYAGER_SEMANTIC_SIZE", DEFAULT_SEMANTIC_SIZE)
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dimensions = dimensions
+        # partition -> {'keys': [...], 'titles': [...], 'numbers': [...], 'vectors': ndarray, 'series': ndarray}
+        self._partitions = {}
+        self._size = 0
+        self._order = deque()  # (partition, cache_key) in insertion order, for eviction
+        self._lock = threading.Lock()
+        self.recent_hits = deque(maxlen=50)
+        self.stats = {
+            'lookups': 0,
+            'hits': 0,
+            'misses': 0,
+            'false_hits': 0,
+            'similarity_sum': 0.0
+        }
+
+    def _embed(self, title: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectors of the whole title and of its series name (the whole title when it has none)"""
+        vector = embed_text(canonical_title(title), self.dimensions)
+        series = series_name(title)
+        return vector, embed_text(series, self.dimensions) if series else vector
+
+    def add(self, title: str, partition: str, cache_key: str):
+        """Index a title whose result is stored under cache_key"""
+        vector, series = self._embed(title)
+        with self._lock:
+            entry = self._partitions.setdefault(partition, {
+                'keys': [], 'titles': [], 'numbers': [],
+                'vectors': np.zeros((0, self.dimensions), dtype=np.float32),
+                'series': np.zeros((0, self.dimensions), dtype=np.float32)
+            })
+            if cache_key in entry['keys']:
+                return
+            entry['keys'].append(cache_key)
+            entry['titles'].append(title)
+            entry['numbers'].append(numeric_tokens(title))
+            entry['vectors'] = np.vstack([entry['vectors'], vector])
+            entry['series'] = np.vstack([entry['series'], series])
+            self._order.append((partition, cache_key))
+            self._size += 1
+            while self._size > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        """Drop the oldest indexed title"""
+        partition, cache_key = self._order.popleft()
+        entry = self._partitions.get(partition)
+        if entry is None or cache_key not in entry['keys']:
+            return
+        index = entry['keys'].index(cache_key)
+        del entry['keys'][index]
+        del entry['titles'][index]
+        del entry['numbers'][index]
+        entry['vectors'] = np.delete(entry['vectors'], index, axis=0)
+        entry['series'] = np.delete(entry['series'], index, axis=0)
+        if not entry['keys']:
+            del self._partitions[partition]
+        self._size -= 1
+
+    def lookup(self, title: str, partition: str, record: bool = True) -> Optional[Tuple[str, str, float]]:
+        """
+        Find the most similar indexed title in the partition
+
+        A title is compared whole and through its series name, so "harry potter"
+        reaches "Harry Potter and the Sorcerer's Stone" and back. Titles whose
+        series numbers conflict are skipped. Pass record=False for repeat lookups of the same query so they don't
+        skew the hit-rate metrics.
+
+        Returns:
+            tuple: (cache_key, matched_title, similarity) when the best cosine
+            similarity reaches the threshold, otherwise None
+        """
+        vector, series = self._embed(title)
+        numbers = numeric_tokens(title)
+        with self._lock:
+            entry = self._partitions.get(partition)
+            similarity = 0.0
+            if entry is not None and entry['keys']:
+                similarities = np.maximum.reduce([
+                    entry['vectors'] @ vector, entry['vectors'] @ series, entry['series'] @ vector
+                ])
+                similarities[[numbers_conflict(numbers, other) for other in entry['numbers']]] = 0.0
+                best = int(np.argmax(similarities))
+                similarity = float(similarities[best])
+            if not record:
+                return (entry['keys'][best], entry['titles'][best], similarity) if similarity >= self.threshold else None
+            self.stats['lookups'] += 1
+            if similarity < self.threshold:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.stats['similarity_sum'] += similarity
+            self.recent_hits.append({
+                'query': title,
+                'matched_title': entry['titles'][best],
+                'similarity': round(similarity, 4)
+            })
+            return entry['keys'][best], entry['titles'][best], similarity
+
+    def report_false_hit(self, query: str, matched_title: str):
+        """Record that a semantic hit was wrong, e.g. the user asked for an exact search"""
+        with self._lock:
+            self.stats['false_hits'] += 1
+        logger.info(f"Semantic cache false hit: '{query}' matched '{matched_title}'")
+
+    def get_stats(self) -> Dict:
+        """Get hit rate, false-hit rate and recent matches for threshold tuning"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['threshold'] = self.threshold
+            stats['entries'] = self._size
+            stats['hit_rate'] = stats['hits'] / stats['lookups'] if stats['lookups'] else 0.0
+            stats['false_hit_rate'] = stats['false_hits'] / stats['hits'] if stats['hits'] else 0.0
+            stats['avg_hit_similarity'] = stats['similarity_sum'] / stats['hits'] if stats['hits'] else 0.0
+            stats['recent_hits'] = list(self.recent_hits)
+            return stats
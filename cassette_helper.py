@@ -0,0 +1,363 @@
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import requests
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+# 'record' captures LLM calls and HTTP GETs to the cassette file, 'replay' serves them back from it
+CASSETTE_MODES = ("off", "record", "replay")
+# 'original' replays with the recorded timing, 'zero' as fast as possible
+REPLAY_LATENCIES = ("original", "zero")
+
+
+class CassetteMiss(Exception):
+    """A request made during replay that the cassette has no recording of"""
+
+
+class RecordedError(Exception):
+    """An upstream error replayed from the cassette, with the original message"""
+
+
+class Cassette:
+    """
+    Records LLM calls and HTTP GETs to a JSONL file and replays them offline
+
+    Each line is one interaction, keyed by a hash of its request (model,
+    messages and call options for the LLM; URL and parameters for HTTP).
+    Responses are stored with their latency, streamed ones with the time
+    offset of every chunk, and upstream errors are recorded too so a replay
+    goes through the same retries and fallbacks. Identical requests replay
+    their recordings in order, the last one repeating.
+    """
+
+    def __init__(self, path: Optional[str] = None, mode: Optional[str] = None, latency: Optional[str] = None):
+        if path is None:
+            path = settings_helper.env_str("BOOKVOYAGER_CASSETTE", "bookvoyager_cassette.jsonl")
+        if mode is None:
+            mode = settings_helper.env_str("BOOKVOYAGER_CASSETTE_MODE", "off")
+        if latency is None:
+            latency = settings_helper.env_str("BOOKVOYAGER_CASSETTE_LATENCY", "original")
+
+        if mode not in CASSETTE_MODES:
+            logger.warning(f"Unknown cassette mode '{mode}', using 'off'")
+            mode = "off"
+        if latency not in REPLAY_LATENCIES:
+            logger.warning(f"Unknown cassette latency '{latency}', using 'original'")
+            latency = "original"
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self._recordings = {}  # key -> recorded interactions, in order
+        self._positions = {}  # key -> index of the next one to replay
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+        if mode == "replay":
+            self._load()
+
+    def _load(self):
+        """Read every interaction in the cassette file"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        interaction = json.loads(line)
+                        self._recordings.setdefault(interaction['key'], []).append(interaction)
+        except FileNotFoundError:
+            logger.warning(f"Cassette {self.path} not found, nothing to replay")
+        logger.info(f"Loaded {sum(len(r) for r in self._recordings.values())} interactions from {self.path}")
+
+    @staticmethod
+    def make_key(kind: str, request: Dict) -> str:
+        """Stable key of a request"""
+        payload = json.dumps({'kind': kind, 'request': request}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def record(self, kind: str, request: Dict, interaction: Dict, label: str = ""):
+        """Append one interaction (response or error, latency and chunks) to the cassette file"""
+        line = dict(interaction, kind=kind, key=self.make_key(kind, request), label=label[:120])
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, separators=(",", ":")) + "\n")
+            self.recorded += 1
+
+    def replay(self, kind: str, request: Dict, label: str = "") -> Dict:
+        """Get the next recorded interaction for a request"""
+        key = self.make_key(kind, request)
+        with self._lock:
+            recordings = self._recordings.get(key)
+            if not recordings:
+                self.misses += 1
+                raise CassetteMiss(f"No {kind} recording in {self.path} for: {label[:120]}")
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            self.replayed += 1
+            return recordings[min(position, len(recordings) - 1)]
+
+    def delay(self, seconds: float) -> float:
+        """How long to wait to reproduce a recorded delay"""
+        return max(0.0, seconds) if self.latency == "original" else 0.0
+
+    def get(self, url: str, params: Optional[Dict] = None, timeout: Optional[float] = None) -> requests.Response:
+        """requests.get that goes through the cassette"""
+        if self.mode == "off":
+            return requests.get(url, params=params, timeout=timeout)
+
+        request = {'url': url, 'params': params or {}}
+        label = f"GET {url} {params or ''}"
+        if self.mode == "replay":
+            interaction = self.replay("http", request, label)
+            time.sleep(self.delay(interaction['latency']))
+            if interaction.get('error'):
+                error_type = getattr(requests.exceptions, interaction['error']['type'], requests.exceptions.RequestException)
+                raise error_type(interaction['error']['message'])
+            response = requests.Response()
+            response.status_code = interaction['status']
+            response.url = url
+            response.headers['Content-Type'] = interaction.get('content_type') or ""
+            response.encoding = "utf-8"
+            response._content = interaction['body'].encode("utf-8")
+            return response
+
+        started = time.monotonic()
+        try:
+            response = requests.get(url, params=params, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            self.record("http", request, {
+                'latency': round(time.monotonic() - started, 4),
+                'error': {'type': type(e).__name__, 'message': str(e)}
+            }, label)
+            raise
+        self.record("http", request, {
+            'latency': round(time.monotonic() - started, 4),
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type'),
+            'body': response.text
+        }, label)
+        return response
+
+    def get_stats(self) -> Dict:
+        """Get the mode and interaction counts"""
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'path': self.path,
+                'latency': self.latency,
+                'recorded': self.recorded,
+                'replayed': self.replayed,
+                'misses': self.misses
+            }
+
+
+cassette = Cassette()
+
+
+def _llm_request(model_name: str, messages: List[Any], stop: Optional[List[str]], kwargs: Dict) -> Dict:
+    """The parts of a chat call that determine its answer"""
+    return {
+        'model': model_name,
+        'messages': [[message.type, message.content] for message in messages],
+        'stop': stop,
+        'options': {name: value for name, value in kwargs.items() if name != "stream"}
+    }
+
+
+def _error_interaction(error: BaseException, started: float, chunks: Optional[List] = None) -> Dict:
+    interaction = {
+        'latency': round(time.monotonic() - started, 4),
+        'error': {'type': type(error).__name__, 'message': str(error)}
+    }
+    if chunks:
+        interaction['chunks'] = chunks
+    return interaction
+
+
+def _replayed_error(interaction: Dict) -> BaseException:
+    """Rebuild a recorded error so retries and error buckets treat it like the original"""
+    error = interaction['error']
+    if "timeout" in error['type'].lower():
+        return TimeoutError(error['message'])
+    return RecordedError(error['message'])
+
+
+def _usage(message: Any) -> Optional[Dict]:
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        return dict(usage)
+    usage = (getattr(message, "response_metadata", None) or {}).get('token_usage')
+    if usage:
+        return {
+            'input_tokens': usage.get('prompt_tokens', 0),
+            'output_tokens': usage.get('completion_tokens', 0),
+            'total_tokens': usage.get('total_tokens', 0)
+        }
+    return None
+
+
+def create_cassette_chat_model(inner: Any, model_name: str, active: Optional[Cassette] = None):
+    """
+    Wrap a chat model so its calls are recorded to or replayed from a cassette
+
+    inner may be None when replaying, so no API key or network is needed.
+    """
+    # LangChain is only imported when a cassette is in use
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage, AIMessageChunk
+    from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+    class CassetteChatModel(BaseChatModel):
+        """Chat model that records calls of the wrapped model or replays them from the cassette"""
+
+        model_name: str = "cassette"
+        inner: Any = None
+        cassette: Any = None
+
+        @property
+        def _llm_type(self) -> str:
+            return "bookvoyager-cassette"
+
+        @property
+        def _identifying_params(self) -> Dict[str, Any]:
+            return {'model_name': self.model_name, 'cassette': self.cassette.path}
+
+        def _replay(self, messages, stop, kwargs) -> Dict:
+            label = str(messages[-1].content) if messages else ""
+            return self.cassette.replay("llm", _llm_request(self.model_name, messages, stop, kwargs), label)
+
+        def _record(self, messages, stop, kwargs, interaction: Dict):
+            label = str(messages[-1].content) if messages else ""
+            self.cassette.record("llm", _llm_request(self.model_name, messages, stop, kwargs), interaction, label)
+
+        @staticmethod
+        def _text(interaction: Dict) -> str:
+            if 'content' in interaction:
+                return interaction['content']
+            return "".join(text for _, text in interaction.get('chunks', []))
+
+        @staticmethod
+        def _pieces(interaction: Dict) -> List:
+            """(offset, text) chunks of a recording; unstreamed answers arrive as one chunk"""
+            if 'chunks' in interaction:
+                return interaction['chunks']
+            return [[interaction['latency'], interaction.get('content', "")]]
+
+        def _result(self, interaction: Dict) -> ChatResult:
+            message = AIMessage(content=self._text(interaction))
+            if interaction.get('usage'):
+                message = AIMessage(content=message.content, usage_metadata=interaction['usage'])
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            if self.cassette.mode == "replay":
+                interaction = self._replay(messages, stop, kwargs)
+                time.sleep(self.cassette.delay(interaction['latency']))
+                if interaction.get('error'):
+                    raise _replayed_error(interaction)
+                return self._result(interaction)
+
+            started = time.monotonic()
+            try:
+                result = self.inner._generate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self._record(messages, stop, kwargs, _error_interaction(e, started))
+                raise
+            message = result.generations[0].message
+            self._record(messages, stop, kwargs, {
+                'latency': round(time.monotonic() - started, 4),
+                'content': message.content,
+                'usage': _usage(message)
+            })
+            return result
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+            if self.cassette.mode == "replay":
+                interaction = self._replay(messages, stop, kwargs)
+                await asyncio.sleep(self.cassette.delay(interaction['latency']))
+                if interaction.get('error'):
+                    raise _replayed_error(interaction)
+                return self._result(interaction)
+
+            started = time.monotonic()
+            try:
+                result = await self.inner._agenerate(messages, stop=stop, **kwargs)
+            except Exception as e:
+                self._record(messages, stop, kwargs, _error_interaction(e, started))
+                raise
+            message = result.generations[0].message
+            self._record(messages, stop, kwargs, {
+                'latency': round(time.monotonic() - started, 4),
+                'content': message.content,
+                'usage': _usage(message)
+            })
+            return result
+
+        def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+            if self.cassette.mode == "replay":
+                interaction = self._replay(messages, stop, kwargs)
+                elapsed = 0.0
+                for offset, text in self._pieces(interaction):
+                    time.sleep(self.cassette.delay(offset - elapsed))
+                    elapsed = offset
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                    if run_manager:
+                        run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+                if interaction.get('error'):
+                    time.sleep(self.cassette.delay(interaction['latency'] - elapsed))
+                    raise _replayed_error(interaction)
+                return
+
+            started = time.monotonic()
+            chunks = []
+            try:
+                for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+                    chunks.append([round(time.monotonic() - started, 4), chunk.message.content])
+                    if run_manager:
+                        run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                    yield chunk
+            except Exception as e:
+                self._record(messages, stop, kwargs, _error_interaction(e, started, chunks))
+                raise
+            self._record(messages, stop, kwargs, {'latency': round(time.monotonic() - started, 4), 'chunks': chunks})
+
+        async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+            if self.cassette.mode == "replay":
+                interaction = self._replay(messages, stop, kwargs)
+                elapsed = 0.0
+                for offset, text in self._pieces(interaction):
+                    await asyncio.sleep(self.cassette.delay(offset - elapsed))
+                    elapsed = offset
+                    chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+                    if run_manager:
+                        await run_manager.on_llm_new_token(text, chunk=chunk)
+                    yield chunk
+                if interaction.get('error'):
+                    await asyncio.sleep(self.cassette.delay(interaction['latency'] - elapsed))
+                    raise _replayed_error(interaction)
+                return
+
+            started = time.monotonic()
+            chunks = []
+            try:
+                async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+                    chunks.append([round(time.monotonic() - started, 4), chunk.message.content])
+                    if run_manager:
+                        await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+                    yield chunk
+            except Exception as e:
+                self._record(messages, stop, kwargs, _error_interaction(e, started, chunks))
+                raise
+            self._record(messages, stop, kwargs, {'latency': round(time.monotonic() - started, 4), 'chunks': chunks})
+
+    return CassetteChatModel(model_name=model_name, inner=inner, cassette=active or cassette)
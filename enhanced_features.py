@@ -1,9 +1,34 @@
 import requests
 import json
 import re
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, List, Optional, Tuple
 import streamlit as st
 
+import cassette_helper
+import settings_helper
+
+# Covers of a page are looked up concurrently; the page waits at most COVER_DEADLINE seconds for them
+COVER_WORKERS = settings_helper.env_int("BOOKVOYAGER_COVER_WORKERS", 8)
+COVER_DEADLINE = settings_helper.env_float("BOOKVOYAGER_COVER_DEADLINE", 3)
+_cover_executor = ThreadPoolExecutor(max_workers=COVER_WORKERS, thread_name_prefix="book-cover")
+
+# (title, author) -> cover URL or None, for lookups that completed; shared across sessions
+MAX_CACHED_COVERS = 1000
+_cover_cache = OrderedDict()
+_cover_lock = threading.Lock()
+
+def _remember_cover(key: Tuple[str, str], cover_url: Optional[str]) -> Optional[str]:
+    with _cover_lock:
+        _cover_cache[key] = cover_url
+        _cover_cache.move_to_end(key)
+        while len(_cover_cache) > MAX_CACHED_COVERS:
+            _cover_cache.popitem(last=False)
+    return cover_url
+
 class EnhancedFeatures:
     """Enhanced features for BookVoyager including book covers, reading time, and reading lists"""
     
@@ -32,6 +57,11 @@ class EnhancedFeatures:
             if not title:
                 return None
             
+            key = (title.lower(), author.lower())
+            with _cover_lock:
+                if key in _cover_cache:
+                    return _cover_cache[key]
+            
             # Search query - try different combinations
             search_queries = [
                 f"{title} {author}".strip(),
@@ -50,16 +80,18 @@ class EnhancedFeatures:
                     'fields': 'items(volumeInfo(imageLinks,title,authors))'
                 }
                 
-                response = requests.get(url, params=params, timeout=10)  # Increased timeout
+                # Recorded or replayed when a cassette is in use
+                response = cassette_helper.cassette.get(url, params=params, timeout=10)  # Increased timeout
                 response.raise_for_status()
                 
                 data = response.json()
                 if 'items' in data and len(data['items']) > 0:
                     volume_info = data['items'][0]['volumeInfo']
                     if 'imageLinks' in volume_info and 'thumbnail' in volume_info['imageLinks']:
-                        return volume_info['imageLinks']['thumbnail']
+                        return _remember_cover(key, volume_info['imageLinks']['thumbnail'])
             
-            return None
+            # Books without a cover are remembered too; lookups that raise are tried again next time
+            return _remember_cover(key, None)
             
         except requests.exceptions.Timeout:
             print(f"Timeout fetching book cover for: {title}")
@@ -68,6 +100,32 @@ class EnhancedFeatures:
             print(f"Error fetching book cover for '{title}': {e}")
             return None
     
+    def get_book_covers(self, books: List[Dict], deadline: Optional[float] = None) -> List[Optional[str]]:
+        """
+        Get the cover URLs of several books at once, waiting at most deadline seconds
+        
+        Lookups run concurrently, so the wait is that of the slowest one rather
+        than their sum. Covers that aren't found in time come back as None;
+        their lookups carry on in the background and are remembered for the
+        next page.
+        """
+        if deadline is None:
+            deadline = COVER_DEADLINE
+        
+        # Each distinct book is looked up once
+        lookups = {}
+        for book in books:
+            key = ((book.get('title') or "").strip(), (book.get('author') or "").strip())
+            if key[0] and key not in lookups:
+                lookups[key] = _cover_executor.submit(self.get_book_cover, *key)
+        wait(lookups.values(), timeout=deadline)
+        
+        covers = []
+        for book in books:
+            future = lookups.get(((book.get('title') or "").strip(), (book.get('author') or "").strip()))
+            covers.append(future.result() if future is not None and future.done() else None)
+        return covers
+    
     def estimate_reading_time(self, book_info: Dict, reading_speed: str = 'normal') -> Tuple[int, str]:
         """Estimate reading time based on book information"""
         try:
@@ -123,10 +181,14 @@ class EnhancedFeatures:
             line = line.strip()
             
             # Check for numbered list items (1., 2., etc.)
-            if line.startswith(('1.', '2.', '3.', '4.', '5.', '6.', '7.', '8.', '9.', '10.')):
+            if re.match(r'\d+\.\s', line):
                 if current_book and len(current_book) > 1:  # Only add if we have some data
                     books.append(current_book)
                 current_book = {'number': line.split('.')[0]}
+                # The title usually shares the numbered line: "1. **Title**: Dune"
+                title_match = re.match(r'\d+\.\s+\*\*Title:?\*\*:?\s*(.+)', line)
+                if title_match:
+                    current_book['title'] = title_match.group(1).strip()
             
             # Check for title in various formats
             elif line.startswith('**Title**:') or line.startswith('**Title:**'):
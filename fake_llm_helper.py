@@ -0,0 +1,274 @@
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+import settings_helper
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+ERROR_KINDS = ("429", "503", "timeout")
+
+# Word lists the fake recommendations are assembled from
+ADJECTIVES = ["Silent", "Hidden", "Last", "Crimson", "Distant", "Broken", "Golden", "Forgotten",
+              "Midnight", "Wandering", "Glass", "Iron", "Secret", "Burning", "Quiet", "Endless"]
+NOUNS = ["Garden", "Voyage", "Empire", "Library", "River", "Kingdom", "Lighthouse", "Archive",
+         "Orchard", "Compass", "Harbor", "Labyrinth", "Atlas", "Winter", "Tide", "Crown"]
+FIRST_NAMES = ["Ada", "Elena", "Marcus", "Noor", "Tomas", "Yuki", "Ravi", "Clara", "Jonah", "Ines"]
+LAST_NAMES = ["Hale", "Okafor", "Lindqvist", "Moreau", "Takeda", "Varga", "Castillo", "Byrne", "Osei", "Park"]
+THEMES = ["belonging", "memory", "ambition", "courage", "loss", "discovery", "power", "friendship"]
+JOURNEY_STAGES = ["Start with", "Continue with", "Explore", "Dive into", "Finish with"]
+
+
+class FakeLLMError(Exception):
+    """Error injected by FakeChatModel, worded like the upstream API error it imitates"""
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for the Groq chat model, for load tests and benchmarks
+
+    Answers the books, journey, repair and structured JSON prompts with well-formed
+    text that depends only on the seed and the prompt. Latency, token rate and
+    injected 429/503/timeout errors are configurable.
+    """
+
+    model_name: str = "fake"
+    seed: int = 0
+    latency: float = 0.5  # median seconds before the first token
+    latency_distribution: str = "lognormal"
+    latency_spread: float = 0.5  # sigma for lognormal, +/- fraction for uniform
+    tokens_per_second: float = 0.0  # 0 streams the whole answer at once
+    error_rate: float = 0.0
+    error_kinds: List[str] = list(ERROR_KINDS)
+    max_tokens: Optional[int] = None  # completions are cut off here, like a real capped call
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        if self.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Latency distribution must be one of: {', '.join(LATENCY_DISTRIBUTIONS)}")
+        unknown = [kind for kind in self.error_kinds if kind not in ERROR_KINDS]
+        if unknown:
+            raise ValueError(f"Unknown error kinds: {', '.join(unknown)}")
+        # Latency and error draws; answers use their own per-prompt generator
+        object.__setattr__(self, "_rng", random.Random(self.seed))
+        object.__setattr__(self, "_rng_lock", threading.Lock())
+
+    @classmethod
+    def from_env(cls, model_name: str = "fake") -> "FakeChatModel":
+        """Create a fake model configured from BOOKVOYAGER_FAKE_* environment variables"""
+        error_kinds = settings_helper.env_str("BOOKVOYAGER_FAKE_ERROR_KINDS", ",".join(ERROR_KINDS))
+        return cls(
+            model_name=model_name,
+            seed=settings_helper.env_int("BOOKVOYAGER_FAKE_SEED", 0),
+            latency=settings_helper.env_float("BOOKVOYAGER_FAKE_LATENCY", 0.5),
+            latency_distribution=settings_helper.env_str("BOOKVOYAGER_FAKE_LATENCY_DISTRIBUTION", "lognormal"),
+            latency_spread=settings_helper.env_float("BOOKVOYAGER_FAKE_LATENCY_SPREAD", 0.5),
+            tokens_per_second=settings_helper.env_float("BOOKVOYAGER_FAKE_TOKENS_PER_SECOND", 0),
+            error_rate=settings_helper.env_float("BOOKVOYAGER_FAKE_ERROR_RATE", 0),
+            error_kinds=[kind.strip() for kind in error_kinds.split(",") if kind.strip()]
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "bookvoyager-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model_name': self.model_name, 'seed': self.seed}
+
+    # Timing and error injection
+
+    def _draw_latency(self) -> float:
+        """Seconds to wait before answering, drawn from the configured distribution"""
+        if self.latency <= 0:
+            return 0.0
+        with self._rng_lock:
+            if self.latency_distribution == "fixed":
+                return self.latency
+            if self.latency_distribution == "uniform":
+                return max(0.0, self._rng.uniform(self.latency * (1 - self.latency_spread),
+                                                  self.latency * (1 + self.latency_spread)))
+            return self._rng.lognormvariate(0.0, self.latency_spread) * self.latency
+
+    def _draw_error(self) -> Optional[BaseException]:
+        """Pick an error to inject for this call, if any"""
+        if self.error_rate <= 0 or not self.error_kinds:
+            return None
+        with self._rng_lock:
+            if self._rng.random() >= self.error_rate:
+                return None
+            kind = self._rng.choice(self.error_kinds)
+        if kind == "429":
+            return FakeLLMError(f"Error code: 429 - Rate limit reached for model `{self.model_name}` (injected)")
+        if kind == "503":
+            return FakeLLMError("Error code: 503 - Service unavailable (injected)")
+        return TimeoutError("Request timed out (injected)")
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    # Answers
+
+    def _respond(self, messages: List[BaseMessage], **kwargs: Any) -> str:
+        """Build the answer for a prompt, truncated to max_tokens; the same seed and prompt give the same text"""
+        text = self._answer(messages, **kwargs)
+        max_tokens = kwargs.get("max_tokens") or self.max_tokens
+        return "".join(self._chunks(text)[:max_tokens]) if max_tokens else text
+
+    def _answer(self, messages: List[BaseMessage], **kwargs: Any) -> str:
+        """Build the full answer for a prompt"""
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).hexdigest()
+        rng = random.Random(int(digest[:16], 16))
+
+        response_format = kwargs.get("response_format") or {}
+        if response_format.get("type") == "json_object" or "JSON object" in prompt:
+            return self._structured_answer(prompt, rng)
+        if "missing fields" in prompt:
+            return self._repair_answer(prompt, rng)
+        if "reading journey" in prompt.lower():
+            return self._journey_answer(prompt, rng)
+        return self._books_answer(prompt, rng)
+
+    @staticmethod
+    def _request_details(prompt: str):
+        """Pull the number of books and the seed title out of a recommendation prompt"""
+        count = re.search(r"Recommend (\d+) (?:more )?books", prompt)
+        title = re.search(r'"([^"]+)"', prompt)
+        return (int(count.group(1)) if count else 5), (title.group(1) if title else "your favourite book")
+
+    @staticmethod
+    def _fake_books(rng: random.Random, count: int, book_title: str) -> List[Dict[str, str]]:
+        books = []
+        for _ in range(count):
+            title = f"The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}"
+            books.append({
+                'title': title,
+                'author': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                'year': str(rng.randint(1850, 2023)),
+                'description': f"A story of {rng.choice(THEMES)} set around a {rng.choice(NOUNS).lower()}.",
+                'reason': f"Fans of {book_title} will enjoy its focus on {rng.choice(THEMES)}."
+            })
+        return books
+
+    def _books_answer(self, prompt: str, rng: random.Random) -> str:
+        count, book_title = self._request_details(prompt)
+        lines = []
+        for i, book in enumerate(self._fake_books(rng, count, book_title), 1):
+            lines.append(f"{i}. **Title**: {book['title']}  ")
+            lines.append(f"   **Author**: {book['author']}  ")
+            lines.append(f"   **Year**: {book['year']}  ")
+            lines.append(f"   **Description**: {book['description']}  ")
+            lines.append(f"   **Why Recommended**: {book['reason']}")
+        return "\n".join(lines)
+
+    def _repair_answer(self, prompt: str, rng: random.Random) -> str:
+        """Fill in the listed missing fields of each "N. Title (missing: Author, Year)" line"""
+        _, book_title = self._request_details(prompt)
+        labels = {'Author': 'author', 'Year': 'year', 'Description': 'description', 'Why Recommended': 'reason'}
+        lines = []
+        for number, title, missing in re.findall(r"^(\d+)\. (.+?)(?: by .+?)? \(missing: (.+)\)$", prompt, flags=re.MULTILINE):
+            book = self._fake_books(rng, 1, book_title)[0]
+            lines.append(f"{number}. **Title**: {title}  ")
+            for label in missing.split(", "):
+                if label in labels:
+                    lines.append(f"   **{label}**: {book[labels[label]]}  ")
+        return "\n".join(lines)
+
+    def _journey_answer(self, prompt: str, rng: random.Random) -> str:
+        titles = re.findall(r"\*\*Title\*\*:\s*(.+?)\s*$", prompt, flags=re.MULTILINE)
+        # The pipelined journey prompt lists bare titles as "1. Title"
+        titles = titles or re.findall(r"^\s*\d+\.\s+(.+?)\s*$", prompt, flags=re.MULTILINE)
+        titles = [title for title in titles if not title.startswith("[")] or ["The Next Book"]
+        lines = ["## 🌟 Your Reading Journey", ""]
+        for i, stage in enumerate(JOURNEY_STAGES):
+            lines.append(f"**{stage}**: {titles[i % len(titles)]} - It builds on {rng.choice(THEMES)}.  ")
+        lines.append("")
+        lines.append(f"**Overall Journey Theme**: A path through {rng.choice(THEMES)} and {rng.choice(THEMES)}.")
+        return "\n".join(lines)
+
+    def _structured_answer(self, prompt: str, rng: random.Random) -> str:
+        count, book_title = self._request_details(prompt)
+        books = self._fake_books(rng, count, book_title)
+        steps = [
+            {'stage': stage, 'title': books[i % len(books)]['title'], 'reason': f"It builds on {rng.choice(THEMES)}."}
+            for i, stage in enumerate(JOURNEY_STAGES)
+        ]
+        return json.dumps({
+            'books': books,
+            'journey': {'steps': steps, 'theme': f"A path through {rng.choice(THEMES)}."}
+        })
+
+    @staticmethod
+    def _chunks(text: str) -> List[str]:
+        """Split an answer into roughly token-sized pieces for streaming"""
+        return re.findall(r"\S+\s*|\s+", text)
+
+    def _message(self, text: str, messages: List[BaseMessage]) -> AIMessage:
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // 4 + 1
+        completion_tokens = len(self._chunks(text))
+        return AIMessage(content=text, usage_metadata={
+            'input_tokens': prompt_tokens,
+            'output_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        })
+
+    # BaseChatModel interface
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._draw_latency())
+        error = self._draw_error()
+        if error:
+            raise error
+        text = self._respond(messages, **kwargs)
+        time.sleep(len(self._chunks(text)) * self._token_delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(text, messages))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._draw_latency())
+        error = self._draw_error()
+        if error:
+            raise error
+        text = self._respond(messages, **kwargs)
+        await asyncio.sleep(len(self._chunks(text)) * self._token_delay())
+        return ChatResult(generations=[ChatGeneration(message=self._message(text, messages))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self._draw_latency())
+        error = self._draw_error()
+        if error:
+            raise error
+        delay = self._token_delay()
+        for i, piece in enumerate(self._chunks(self._respond(messages, **kwargs))):
+            if i and delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self._draw_latency())
+        error = self._draw_error()
+        if error:
+            raise error
+        delay = self._token_delay()
+        for i, piece in enumerate(self._chunks(self._respond(messages, **kwargs))):
+            if i and delay:
+                await asyncio.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
@@ -0,0 +1,98 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import cache_helper
+
+# Same five steps the journey prompts ask the LLM for
+JOURNEY_STAGES = ["Start with", "Continue with", "Explore", "Dive into", "Finish with"]
+
+
+def parse_year(value) -> Optional[int]:
+    """Publication year from values like '1954', 'c. 1600' or '1818 (revised 1831)'"""
+    match = re.search(r"\d{3,4}", str(value or ""))
+    return int(match.group(0)) if match else None
+
+
+class LocalJourneyBuilder:
+    """
+    Builds the five-step reading journey from parsed books without an LLM call
+
+    The closest match to the seed opens the journey, the book that travels
+    furthest from it closes it and the rest are read in publication order.
+    Only what the parsed books say is used: their text and publication year.
+    """
+
+    def describe(self, books: List[Dict], seed_title: str) -> List[Dict]:
+        """Year and similarity to the seed for each book"""
+        seed = cache_helper.embed_text(seed_title)
+        described = []
+        for position, book in enumerate(books):
+            text = " ".join(str(book.get(field) or "") for field in ('title', 'description', 'reason'))
+            described.append({
+                'book': book,
+                'position': position,
+                'year': parse_year(book.get('year')),
+                'similarity': float(np.dot(seed, cache_helper.embed_text(text)))
+            })
+        return described
+
+    def order(self, books: List[Dict], seed_title: str) -> List[Dict]:
+        """Pick up to five books and put them in journey order"""
+        described = self.describe([book for book in books if book.get('title')], seed_title)
+        if len(described) > len(JOURNEY_STAGES):
+            described = sorted(described, key=lambda d: (-d['similarity'], d['position']))[:len(JOURNEY_STAGES)]
+        if len(described) < 2:
+            return described
+
+        start = min(described, key=lambda d: (-d['similarity'], d['position']))
+        rest = [d for d in described if d is not start]
+        # Ties go to the book listed last, which the LLM ranked furthest from the seed
+        finish = min(rest, key=lambda d: (d['similarity'], -d['position']))
+        middle = sorted(
+            (d for d in rest if d is not finish),
+            key=lambda d: (d['year'] is None, d['year'] or 0, d['position'])
+        )
+        return [start] + middle + [finish]
+
+    def build(self, books: List[Dict], seed_title: str) -> Dict:
+        """
+        Build the journey for parsed books
+
+        Returns:
+            dict: 'steps' (stage, title, reason) and 'theme', the shape
+                structured responses are parsed into
+        """
+        ordered = self.order(books, seed_title)
+        if not ordered:
+            raise ValueError("No books to build a reading journey from")
+
+        # Fewer books than steps: skip middle steps but always finish
+        stages = JOURNEY_STAGES[:len(ordered) - 1] + [JOURNEY_STAGES[-1]] if len(ordered) > 1 else JOURNEY_STAGES[:1]
+        steps = []
+        for stage, described in zip(stages, ordered):
+            steps.append({
+                'stage': stage,
+                'title': described['book']['title'],
+                'reason': self._reason(stage, described, seed_title)
+            })
+
+        years = [d['year'] for d in ordered if d['year']]
+        theme = f"From {ordered[0]['book']['title']} to {ordered[-1]['book']['title']}, a path for readers of {seed_title}"
+        if years and min(years) != max(years):
+            theme += f" spanning {min(years)} to {max(years)}"
+        return {'steps': steps, 'theme': theme + "."}
+
+    @staticmethod
+    def _reason(stage: str, described: Dict, seed_title: str) -> str:
+        year = f" ({described['year']})" if described['year'] else ""
+        if stage == "Start with":
+            return f"The closest match to {seed_title}, an easy way in{year}."
+        if stage == "Continue with":
+            return f"Carries the same appeal forward{year}."
+        if stage == "Explore":
+            return f"Widens the view to neighbouring themes{year}."
+        if stage == "Dive into":
+            return f"Goes deeper into what the journey has opened up{year}."
+        return f"Travels furthest from {seed_title}{year}, to finish on."
@@ -1,9 +1,25 @@
 import os
+import re
+import json
+import time
+import asyncio
+import itertools
+import contextlib
+import contextvars
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain, SequentialChain
-from langchain_groq import ChatGroq
 import logging
+import cache_helper
+import cassette_helper
+import journey_helper
+import metrics_helper
+import prompt_budget_helper
+import resilience_helper
+import routing_helper
+import settings_helper
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +28,114 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Picks the model tier for each stage and request class, failing over on observed health
+model_router = routing_helper.ModelRouter()
+metrics_helper.llm_metrics.add_listener(model_router.observe)
+MODEL_NAME = model_router.tier_models['large']
+# Sessions of background work (refreshes, cache warm-up, bulk generation) route as the 'background' class
+BACKGROUND_SESSION_IDS = ("background", "cache-warmup", "bulk-generate")
+# 'groq' for the real service, 'fake' for the offline load-testing model (see fake_llm_helper)
+LLM_BACKEND = settings_helper.env_str("BOOKVOYAGER_LLM_BACKEND", "groq")
+# Seconds one Groq request may take; the SDK's own retries are off so RetryPolicy and the
+# circuit breaker are the only retry layer and a call's total wait stays bounded
+GROQ_TIMEOUT = settings_helper.env_float("BOOKVOYAGER_GROQ_TIMEOUT", 20)
+# Results from other backends must never be served as Groq answers
+CACHE_MODEL_ID = MODEL_NAME if LLM_BACKEND == "groq" else f"{LLM_BACKEND}:{MODEL_NAME}"
+# Bump whenever the prompt templates change so stale cached answers are not served
+PROMPT_VERSION = "1"
+
+# 'chain' runs the two-step books -> journey chain; 'json' asks for both in one structured call;
+# 'pipelined' streams the books and starts the journey as soon as enough titles have arrived
+GENERATION_MODES = ("chain", "json", "pipelined")
+STREAM_MODES = ("chain", "pipelined")
+GENERATION_MODE = settings_helper.env_str("BOOKVOYAGER_GENERATION_MODE", "chain")
+if GENERATION_MODE not in GENERATION_MODES:
+    logger.warning(f"Unknown BOOKVOYAGER_GENERATION_MODE '{GENERATION_MODE}', using 'chain'")
+    GENERATION_MODE = "chain"
+
+# When the reading journey is generated: 'eager' together with the books, 'background'
+# right after the books are shown, or 'on_demand' once the reader asks for it
+JOURNEY_TIMINGS = ("eager", "background", "on_demand")
+JOURNEY_TIMING = settings_helper.env_str("BOOKVOYAGER_JOURNEY_TIMING", "eager")
+if JOURNEY_TIMING not in JOURNEY_TIMINGS:
+    logger.warning(f"Unknown BOOKVOYAGER_JOURNEY_TIMING '{JOURNEY_TIMING}', using 'eager'")
+    JOURNEY_TIMING = "eager"
+
+# Who writes the journey: 'llm', 'local' (built from the parsed books without an LLM call)
+# or 'auto' (the LLM, or the local builder while Groq is saturated or failing)
+JOURNEY_BUILDERS = ("llm", "local", "auto")
+JOURNEY_BUILDER = settings_helper.env_str("BOOKVOYAGER_JOURNEY_BUILDER", "llm")
+if JOURNEY_BUILDER not in JOURNEY_BUILDERS:
+    logger.warning(f"Unknown BOOKVOYAGER_JOURNEY_BUILDER '{JOURNEY_BUILDER}', using 'llm'")
+    JOURNEY_BUILDER = "llm"
+local_journey_builder = journey_helper.LocalJourneyBuilder()
+
+JOURNEY_STAGES = journey_helper.JOURNEY_STAGES
+# Markdown label of each structured book field
+BOOK_ENTRY_LABELS = {
+    'title': "Title", 'author': "Author", 'year': "Year", 'description': "Description", 'reason': "Why Recommended"
+}
+# Start of a numbered entry ("3. **Title**: ...") in book recommendations markdown
+_BOOK_ENTRY_START = re.compile(r"^[ \t]*\d+\.\s+(?=\*\*Title\*\*)", re.MULTILINE)
+STRUCTURED_BOOK_FIELDS = ("title", "author", "year", "description", "reason")
+# Filter sentences passed to the books prompt as input variables
+FILTER_VARIABLES = ("genre_filter", "era_filter", "level_filter", "length_filter")
+
+# Requests in flight at once for batch generation
+DEFAULT_BATCH_CONCURRENCY = settings_helper.env_int("BOOKVOYAGER_BATCH_CONCURRENCY", 4)
+
+# Shared across sessions: in-process LRU tier backed by SQLite on disk
+recommendation_cache = cache_helper.RecommendationCache()
+
+# Near-duplicate titles ("the great gatsby" / "Great Gatsby") reuse each other's results; turn off
+# if false matches show up in the semantic cache stats
+SEMANTIC_CACHE = settings_helper.env_bool("BOOKVOYAGER_SEMANTIC_CACHE", True)
+semantic_cache = cache_helper.SemanticCache()
+
+# Process-wide: identical concurrent requests share one upstream generation
+recommendation_flight = resilience_helper.SingleFlight()
+
+# Upstream protection: retry transient errors, fail fast while Groq is down
+llm_retry = resilience_helper.RetryPolicy()
+llm_breaker = resilience_helper.CircuitBreaker()
+
+# Shapes Groq traffic to the account's request and token budgets, fairly across sessions
+rate_limiter = resilience_helper.RateLimiter()
+
+# Session and queue callback of the request being served, read by _call_llm
+_request_context = contextvars.ContextVar("request_context", default=("background", None))
+
+# Prompt variant and per-stage completion caps; the caps also size rate limiter reservations
+prompt_budget = prompt_budget_helper.PromptBudget()
+
+# Journey requests started while the books are still streaming (pipelined mode)
+_journey_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="journey-pipeline")
+# (kind, cache key) -> pipelined journey or superset drain waiting for complete_streamed_recommendations
+_parked_work = OrderedDict()
+_parked_lock = threading.Lock()
+MAX_PARKED_WORK = 64  # unclaimed work beyond this is dropped, oldest first
+
+# Upper bound on the list "load more" can grow to
+MAX_LOADED_BOOKS = 30
+
+# Most seed books one blended request may combine
+MAX_BLEND_SEEDS = 5
+
+# Generate this many books once per title/filter combination and slice smaller requests from it,
+# so changing num_books only costs a journey call at most
+SUPERSET_SIZE = 10
+SUPERSET_GENERATION = settings_helper.env_bool("BOOKVOYAGER_SUPERSET", True)
+
+# Ask the LLM for just the missing books and fields when a list parses incomplete
+REPAIR_INCOMPLETE = settings_helper.env_bool("BOOKVOYAGER_REPAIR", True)
+
+# Reading journeys deferred until after the books were returned
+_deferred_journey_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="deferred-journey")
+
+# Serve expired cache entries immediately and refresh them in the background
+SERVE_STALE = settings_helper.env_bool("BOOKVOYAGER_SERVE_STALE", True)
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="recommendation-refresh")
+
 # Validate API key
 def validate_api_key():
     """Validate that the GROQ API key is available"""
@@ -22,38 +146,74 @@ def validate_api_key():
         raise ValueError("GROQ_API_KEY appears to be invalid. Please check your .env file.")
     return api_key
 
-# Initialize Groq LLM with error handling
-try:
+def _create_groq_llm(model_name):
+    """Create a Groq chat model"""
     api_key = validate_api_key()
-    llm = ChatGroq(
+    from langchain_groq import ChatGroq
+    return ChatGroq(
         temperature=0.75,
-        model_name="llama3-70b-8192",
-        api_key=api_key
+        model_name=model_name,
+        api_key=api_key,
+        max_retries=0,
+        timeout=GROQ_TIMEOUT
     )
-    logger.info("Groq LLM initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Groq LLM: {str(e)}")
-    llm = None
 
-def generate_book_recommendations(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None):
+def _create_fake_llm(model_name):
+    """Create the offline fake chat model, configured from BOOKVOYAGER_FAKE_* variables"""
+    import fake_llm_helper
+    return fake_llm_helper.FakeChatModel.from_env(model_name)
+
+# Backend name -> factory taking a model name and returning a LangChain chat model
+LLM_BACKENDS = {
+    'groq': _create_groq_llm,
+    'fake': _create_fake_llm
+}
+
+def register_llm_backend(name, factory):
+    """Make another chat model backend selectable through BOOKVOYAGER_LLM_BACKEND"""
+    LLM_BACKENDS[name] = factory
+
+# Clients are created on first use so importing this module stays cheap
+_llm_clients = {}
+_llm_lock = threading.Lock()
+
+def get_llm(model_name=MODEL_NAME):
     """
-    Generate book recommendations with comprehensive error handling
+    Get the shared client for a model on the configured backend, creating it on first use
     
-    Args:
-        book_title (str): The book title or topic to base recommendations on
-        num_books (int): Number of recommendations to generate (3-10)
-        genres (list): List of genres to filter by
-        era (str): Era preference
+    LangChain and the backend's client library are only imported here, on the
+    first real generation, to keep app start-up fast.
     
     Returns:
-        dict: Dictionary containing 'book_recommendations' and 'reading_journey'
-    
-    Raises:
-        ValueError: For invalid inputs
-        Exception: For API or processing errors
+        The chat model, or None if it could not be initialized
     """
+    client = _llm_clients.get(model_name)
+    if client is not None:
+        return client
     
-    # Input validation
+    with _llm_lock:
+        client = _llm_clients.get(model_name)
+        if client is None:
+            # Initialize the LLM with error handling
+            try:
+                if LLM_BACKEND not in LLM_BACKENDS:
+                    raise ValueError(f"Unknown LLM backend '{LLM_BACKEND}'. Choose one of: {', '.join(LLM_BACKENDS)}")
+                cassette = cassette_helper.cassette
+                # Replaying needs neither the backend's client nor the network
+                client = None if cassette.mode == "replay" else LLM_BACKENDS[LLM_BACKEND](model_name)
+                if cassette.mode != "off":
+                    client = cassette_helper.create_cassette_chat_model(client, model_name)
+                # Every call made through the client is timed and counted per stage
+                client.callbacks = list(client.callbacks or []) + [metrics_helper.get_callback_handler()]
+                _llm_clients[model_name] = client
+                logger.info(f"{LLM_BACKEND} LLM initialized successfully")
+            except Exception as e:
+                logger.error(f"Failed to initialize {LLM_BACKEND} LLM: {str(e)}")
+                return None
+    return client
+
+def validate_recommendation_inputs(book_title, num_books, genres, era):
+    """Validate recommendation inputs, raising ValueError on bad values"""
     if not book_title or not isinstance(book_title, str):
         raise ValueError("Book title must be a non-empty string")
     
@@ -65,156 +225,1981 @@ def generate_book_recommendations(book_title, num_books=5, genres=None, era=None
     
     if era and not isinstance(era, str):
         raise ValueError("Era must be a string")
+
+def make_recommendation_cache_key(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None, mode="chain"):
+    """Build the recommendation cache key for the current model, prompt version and mode"""
+    return cache_helper.make_cache_key(
+        book_title, num_books, genres, era, reading_level, book_length,
+        model=CACHE_MODEL_ID,
+        prompt_version=(
+            f"{PROMPT_VERSION}-{mode}{prompt_budget.cache_tag}{model_router.cache_tag}"
+            f"{'-local' if JOURNEY_BUILDER == 'local' else ''}"
+        )
+    )
+
+def make_semantic_partition(num_books=5, genres=None, era=None, reading_level=None, book_length=None, mode="chain"):
+    """Build the semantic cache partition: everything in the cache key except the title"""
+    return make_recommendation_cache_key("", num_books, genres, era, reading_level, book_length, mode=mode)
+
+def report_semantic_false_hit(query, matched_title):
+    """Record that a near-duplicate match was not what the user searched for"""
+    semantic_cache.report_false_hit(query, matched_title)
+
+def build_filter_text(genres=None, era=None, reading_level=None, book_length=None):
+    """Build the genre, era, reading level and length filter sentences for the prompt"""
+    # Prepare genre filter
+    genre_filter = ""
+    if genres and len(genres) > 0:
+        genre_filter = f" Focus on {', '.join(genres)} genres."
     
-    # Check if LLM is available
-    if llm is None:
-        raise Exception("AI service is not available. Please check your API configuration.")
+    # Prepare era filter
+    era_filter = ""
+    if era and era != "Any":
+        era_filter = f" Prefer books from the {era} era."
     
-    try:
-        # Prepare genre filter
-        genre_filter = ""
-        if genres and len(genres) > 0:
-            genre_filter = f" Focus on {', '.join(genres)} genres."
-        
-        # Prepare era filter
-        era_filter = ""
-        if era and era != "Any":
-            era_filter = f" Prefer books from the {era} era."
-        
-        # Prepare reading level filter
-        level_filter = ""
-        if reading_level and reading_level != "Any":
-            level_filter = f" Focus on {reading_level} reading level books."
-        
-        # Prepare book length filter
-        length_filter = ""
-        if book_length and book_length != "Any":
-            if "Short" in book_length:
-                length_filter = " Prefer shorter books (under 200 pages)."
-            elif "Medium" in book_length:
-                length_filter = " Prefer medium-length books (200-400 pages)."
-            elif "Long" in book_length:
-                length_filter = " Prefer longer books (over 400 pages)."
+    # Prepare reading level filter
+    level_filter = ""
+    if reading_level and reading_level != "Any":
+        level_filter = f" Focus on {reading_level} reading level books."
+    
+    # Prepare book length filter
+    length_filter = ""
+    if book_length and book_length != "Any":
+        if "Short" in book_length:
+            length_filter = " Prefer shorter books (under 200 pages)."
+        elif "Medium" in book_length:
+            length_filter = " Prefer medium-length books (200-400 pages)."
+        elif "Long" in book_length:
+            length_filter = " Prefer longer books (over 400 pages)."
+    
+    return {
+        'genre_filter': genre_filter,
+        'era_filter': era_filter,
+        'level_filter': level_filter,
+        'length_filter': length_filter
+    }
+
+def build_books_prompt():
+    """Build the prompt template for the book recommendations step"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_title', 'num_books'] + list(FILTER_VARIABLES),
+        template="""
+        Recommend {num_books} books related to the book or topic "{book_title}".
+        If "{book_title}" is not a book, treat it as a topic and suggest books that are relevant, informative, or interesting for someone interested in that topic.
+        If you cannot find direct matches, suggest the closest possible books or general reading material.
+        {genre_filter}
+        {era_filter}
+        {level_filter}
+        {length_filter}
+        For each book, provide:
+        - Title
+        - Author
+        - Publication Year
+        - 1-sentence description
+        - Reason it's recommended for fans of or those interested in "{book_title}"
         
-        # Chain 1: Generate book recommendations
-        prompt_template_books = PromptTemplate(
-            input_variables=['book_title'],
-            template=f"""
-            Recommend {num_books} books related to the book or topic "{{book_title}}".
-            If "{{book_title}}" is not a book, treat it as a topic and suggest books that are relevant, informative, or interesting for someone interested in that topic.
-            If you cannot find direct matches, suggest the closest possible books or general reading material.
-            {genre_filter}
-            {era_filter}
-            {level_filter}
-            {length_filter}
-            For each book, provide:
-            - Title
-            - Author
-            - Publication Year
-            - 1-sentence description
-            - Reason it's recommended for fans of or those interested in "{{book_title}}"
-            
-            Format EXACTLY as follows (use this exact format for each book):
-            1. **Title**: [Book Title]  
-               **Author**: [Author Name]  
-               **Year**: [Publication Year]  
-               **Description**: [One sentence description of the book]  
-               **Why Recommended**: [Why this book is recommended for fans of {{book_title}}]
-            2. **Title**: [Book Title]  
-               **Author**: [Author Name]  
-               **Year**: [Publication Year]  
-               **Description**: [One sentence description of the book]  
-               **Why Recommended**: [Why this book is recommended for fans of {{book_title}}]
-            3. **Title**: [Book Title]  
-               **Author**: [Author Name]  
-               **Year**: [Publication Year]  
-               **Description**: [One sentence description of the book]  
-               **Why Recommended**: [Why this book is recommended for fans of {{book_title}}]
-            [Continue for all {num_books} books...]
-            """
+        Format EXACTLY as follows (use this exact format for each book):
+        1. **Title**: [Book Title]  
+           **Author**: [Author Name]  
+           **Year**: [Publication Year]  
+           **Description**: [One sentence description of the book]  
+           **Why Recommended**: [Why this book is recommended for fans of {book_title}]
+        2. **Title**: [Book Title]  
+           **Author**: [Author Name]  
+           **Year**: [Publication Year]  
+           **Description**: [One sentence description of the book]  
+           **Why Recommended**: [Why this book is recommended for fans of {book_title}]
+        3. **Title**: [Book Title]  
+           **Author**: [Author Name]  
+           **Year**: [Publication Year]  
+           **Description**: [One sentence description of the book]  
+           **Why Recommended**: [Why this book is recommended for fans of {book_title}]
+        [Continue for all {num_books} books...]
+        """
+    )
+
+def build_compact_books_prompt():
+    """Build the books prompt that spells the per-book format out once"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_title', 'num_books'] + list(FILTER_VARIABLES),
+        template=(
+            'Recommend {num_books} books related to the book or topic "{book_title}". '
+            "If it is not a book, treat it as a topic; if nothing matches directly, suggest the closest books."
+            "{genre_filter}{era_filter}{level_filter}{length_filter}\n"
+            "Reply with exactly {num_books} numbered entries in this format and nothing else:\n"
+            "1. **Title**: [Book Title]  \n"
+            "   **Author**: [Author Name]  \n"
+            "   **Year**: [Publication Year]  \n"
+            "   **Description**: [One sentence]  \n"
+            "   **Why Recommended**: [One sentence on why fans of {book_title} will like it]"
         )
+    )
+
+def build_more_books_prompt():
+    """Build the prompt that asks for additional books, excluding the ones already shown"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_title', 'num_books', 'excluded_titles', 'start_number'] + list(FILTER_VARIABLES),
+        template=(
+            'Recommend {num_books} more books related to the book or topic "{book_title}". '
+            "If it is not a book, treat it as a topic; if nothing matches directly, suggest the closest books."
+            "{genre_filter}{era_filter}{level_filter}{length_filter}\n"
+            "These books were already recommended, so do not repeat any of them:\n"
+            "{excluded_titles}\n"
+            "Reply with exactly {num_books} numbered entries, starting at {start_number}, in this format and nothing else:\n"
+            "{start_number}. **Title**: [Book Title]  \n"
+            "   **Author**: [Author Name]  \n"
+            "   **Year**: [Publication Year]  \n"
+            "   **Description**: [One sentence]  \n"
+            "   **Why Recommended**: [One sentence on why fans of {book_title} will like it]"
+        )
+    )
+
+def build_repair_prompt():
+    """Build the prompt that asks only for the fields missing from parsed book entries"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_title', 'incomplete_entries'],
+        template=(
+            'Some books recommended for readers of "{book_title}" are missing fields:\n'
+            "{incomplete_entries}\n"
+            "Reply with each numbered entry again, giving its title and only the missing fields, "
+            "in this format and nothing else:\n"
+            "1. **Title**: [Book Title]  \n"
+            "   **Author**: [Author Name]  \n"
+            "   **Year**: [Publication Year]  \n"
+            "   **Description**: [One sentence]  \n"
+            "   **Why Recommended**: [One sentence on why fans of {book_title} will like it]"
+        )
+    )
+
+def build_journey_titles_prompt():
+    """Build the journey prompt that only needs book titles, for pipelined generation"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_titles'],
+        template=(
+            "Create a personalized reading journey through these books:\n"
+            "{book_titles}\n\n"
+            "Format as:\n"
+            "## 🌟 Your Reading Journey\n\n"
+            "**Start with**: [Book] - [Brief reason why to start here]  \n"
+            "**Continue with**: [Book] - [Brief reason for progression]  \n"
+            "**Explore**: [Book] - [Brief reason for thematic exploration]  \n"
+            "**Dive into**: [Book] - [Brief reason for deeper dive]  \n"
+            "**Finish with**: [Book] - [Brief reason for climactic finish]  \n\n"
+            "**Overall Journey Theme**: [1-sentence theme connecting all books]"
+        )
+    )
+
+def build_journey_prompt():
+    """Build the prompt template for the reading journey step"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_recommendations'],
+        template="""
+        Create a personalized reading journey based on these recommendations:
+        {book_recommendations}
+        
+        Format as:
+        ## 🌟 Your Reading Journey
+        
+        **Start with**: [First Book] - [Brief reason why to start here]  
+        **Continue with**: [Second Book] - [Brief reason for progression]  
+        **Explore**: [Third Book] - [Brief reason for thematic exploration]  
+        **Dive into**: [Fourth Book] - [Brief reason for deeper dive]  
+        **Finish with**: [Fifth Book] - [Brief reason for climactic finish]  
+        
+        **Overall Journey Theme**: [1-sentence theme connecting all books]
+        """
+    )
+
+def friendly_error(e):
+    """Map an API or processing error to an exception with a user-facing message"""
+    error_str = str(e).lower()
+    if "503" in error_str or "service unavailable" in error_str:
+        return Exception("The AI service is temporarily unavailable. Please try again in a few minutes. If the problem persists, check https://groqstatus.com/ for service status.")
+    elif "401" in error_str or "unauthorized" in error_str:
+        return Exception("API key authentication failed. Please check your API configuration.")
+    elif "429" in error_str or "rate limit" in error_str:
+        return Exception("Rate limit exceeded. Please wait a moment and try again.")
+    elif "timeout" in error_str:
+        return Exception("Request timed out. Please try again.")
+    else:
+        return Exception(f"Failed to generate recommendations: {str(e)}")
+
+def _is_json_validation_error(e):
+    """Check whether Groq rejected a JSON-mode completion that wasn't valid JSON (400 json_validate_failed)"""
+    body = getattr(e, 'body', None)
+    if isinstance(body, dict):
+        error = body.get('error', body)
+        if isinstance(error, dict) and error.get('code') == "json_validate_failed":
+            return True
+    return "json_validate_failed" in str(e)
+
+def build_structured_prompt():
+    """Build the single-call prompt that returns books and journey as one JSON document"""
+    from langchain_core.prompts import PromptTemplate
+    return PromptTemplate(
+        input_variables=['book_title', 'num_books', 'filters'],
+        template="""
+        Recommend {num_books} books related to the book or topic "{book_title}".
+        If "{book_title}" is not a book, treat it as a topic and suggest books that are relevant, informative, or interesting for someone interested in that topic.
+        {filters}
+        Then arrange the books into a personalized reading journey of five steps
+        ("Start with", "Continue with", "Explore", "Dive into", "Finish with").
+        
+        Respond with ONLY a JSON object of this shape:
+        {{"books": [{{"title": "...", "author": "...", "year": "...", "description": "one sentence", "reason": "why fans of {book_title} will like it"}}],
+          "journey": {{"steps": [{{"stage": "Start with", "title": "...", "reason": "..."}}], "theme": "one sentence"}}}}
+        """
+    )
+
+def _extract_json(text):
+    """Pull the JSON object out of a model response, tolerating code fences"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("Response does not contain a JSON object")
+    return json.loads(text[start:end + 1])
+
+def parse_structured_response(text, num_books):
+    """
+    Parse and validate a structured JSON response
+    
+    Returns:
+        dict: {'books': [...], 'journey': {'steps': [...], 'theme': str}}
+    
+    Raises:
+        ValueError: If the response does not match the expected schema
+    """
+    try:
+        data = _extract_json(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Response is not valid JSON: {str(e)}")
+    
+    if not isinstance(data, dict):
+        raise ValueError("Response must be a JSON object")
+    
+    # Validate books
+    raw_books = data.get('books')
+    if not isinstance(raw_books, list) or len(raw_books) < num_books:
+        raise ValueError(f"Expected {num_books} books in response")
+    books = []
+    for i, raw_book in enumerate(raw_books[:num_books], 1):
+        if not isinstance(raw_book, dict):
+            raise ValueError(f"Book {i} must be an object")
+        book = {'number': str(i)}
+        for field in STRUCTURED_BOOK_FIELDS:
+            value = raw_book.get(field)
+            if value is None or isinstance(value, (dict, list)):
+                value = ""
+            book[field] = str(value).strip()
+        if not book['title'] or not book['author']:
+            raise ValueError(f"Book {i} is missing a title or author")
+        books.append(book)
+    
+    # Validate journey
+    raw_journey = data.get('journey')
+    if not isinstance(raw_journey, dict) or not isinstance(raw_journey.get('steps'), list):
+        raise ValueError("Response is missing the reading journey")
+    steps = []
+    for i, raw_step in enumerate(raw_journey['steps'][:len(JOURNEY_STAGES)]):
+        if not isinstance(raw_step, dict) or not raw_step.get('title'):
+            raise ValueError(f"Journey step {i + 1} is missing a title")
+        steps.append({
+            'stage': JOURNEY_STAGES[i],
+            'title': str(raw_step['title']).strip(),
+            'reason': str(raw_step.get('reason') or "").strip()
+        })
+    if not steps:
+        raise ValueError("Reading journey has no steps")
+    
+    return {
+        'books': books,
+        'journey': {'steps': steps, 'theme': str(raw_journey.get('theme') or "").strip()}
+    }
+
+def render_books_markdown(books):
+    """Render parsed books in the same markdown format the books prompt asks for"""
+    lines = []
+    for i, book in enumerate(books, 1):
+        lines.append(f"{i}. **Title**: {book.get('title', '')}  ")
+        lines.append(f"   **Author**: {book.get('author', '')}  ")
+        lines.append(f"   **Year**: {book.get('year', '')}  ")
+        lines.append(f"   **Description**: {book.get('description', '')}  ")
+        lines.append(f"   **Why Recommended**: {book.get('reason', '')}")
+    return "\n".join(lines)
+
+def render_journey_markdown(journey):
+    """Render journey steps in the same markdown format the journey prompt asks for"""
+    lines = ["## 🌟 Your Reading Journey", ""]
+    for step in journey.get('steps', []):
+        lines.append(f"**{step['stage']}**: {step['title']} - {step['reason']}  ")
+    if journey.get('theme'):
+        lines.append("")
+        lines.append(f"**Overall Journey Theme**: {journey['theme']}")
+    return "\n".join(lines)
+
+def build_local_journey(book_title, book_recommendations):
+    """Build the reading journey from the books markdown without an LLM call"""
+    books = [parse_book_entry(entry) for entry in split_book_entries(book_recommendations)]
+    return render_journey_markdown(local_journey_builder.build(books, book_title))
+
+def _use_local_journey():
+    """Whether the next journey should be built locally instead of asked of the LLM"""
+    if JOURNEY_BUILDER == "auto":
+        # A journey call now would queue behind others or be rejected outright
+        return llm_breaker.state != resilience_helper.CircuitBreaker.CLOSED or rate_limiter.queue_depth() > 0
+    return JOURNEY_BUILDER == "local"
+
+def _journey_or_local(book_title, book_recommendations, generate):
+    """Run the LLM journey call `generate`, or build the journey locally per JOURNEY_BUILDER"""
+    if _use_local_journey():
+        logger.info(f"Building the reading journey locally for: {book_title}")
+        return build_local_journey(book_title, book_recommendations)
+    try:
+        return generate()
+    except Exception as e:
+        if JOURNEY_BUILDER != "auto":
+            raise
+        logger.warning(f"Reading journey call failed, building it locally: {str(e)}")
+        return build_local_journey(book_title, book_recommendations)
+
+class ChainRegistry:
+    """Compiles prompt templates and chains once and reuses them across calls and sessions"""
+    
+    PROMPT_BUILDERS = {
+        'books': build_books_prompt,
+        'books_compact': build_compact_books_prompt,
+        'books_more': build_more_books_prompt,
+        'books_repair': build_repair_prompt,
+        'journey': build_journey_prompt,
+        'journey_titles': build_journey_titles_prompt,
+        'structured': build_structured_prompt
+    }
+    
+    def __init__(self):
+        self._prompts = {}
+        self._chains = {}  # (id(model), books prompt, num_books) -> (model, chain)
+        self._lock = threading.Lock()
+    
+    def get_prompt(self, name):
+        """Get a compiled prompt template by name (one of PROMPT_BUILDERS)"""
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            with self._lock:
+                prompt = self._prompts.get(name)
+                if prompt is None:
+                    prompt = self.PROMPT_BUILDERS[name]()
+                    self._prompts[name] = prompt
+        return prompt
+    
+    def get_recommendation_chain(self, model, num_books=5, journey_model=None):
+        """
+        Get the books -> journey SequentialChain bound to the given models
+        
+        One chain is compiled per num_books since the books step's completion
+        cap depends on it. The journey step uses journey_model when given.
+        """
+        journey_model = journey_model or model
+        key = (id(model), id(journey_model), prompt_budget.books_prompt_name, num_books)
+        entry = self._chains.get(key)
+        if entry is None or entry[0] is not model or entry[1] is not journey_model:
+            books_prompt = self.get_prompt(prompt_budget.books_prompt_name)
+            journey_prompt = self.get_prompt('journey')
+            with self._lock:
+                entry = self._chains.get(key)
+                if entry is None or entry[0] is not model or entry[1] is not journey_model:
+                    entry = (model, journey_model, self._build_recommendation_chain(
+                        model, books_prompt, journey_prompt,
+                        prompt_budget.max_tokens('books', num_books), prompt_budget.max_tokens('journey'),
+                        journey_model
+                    ))
+                    self._chains[key] = entry
+        return entry[2]
+    
+    @staticmethod
+    def _build_recommendation_chain(model, books_prompt, journey_prompt, books_max_tokens, journey_max_tokens, journey_model=None):
+        """Build the two-step books -> journey SequentialChain"""
+        from langchain.chains import LLMChain, SequentialChain
         
+        # Chain 1: Generate book recommendations
+        # Stage tags let the metrics tell the two steps apart
         books_chain = LLMChain(
-            llm=llm,
-            prompt=prompt_template_books,
+            llm=model.bind(max_tokens=books_max_tokens).with_config(tags=['books']),
+            prompt=books_prompt,
             output_key="book_recommendations"
         )
 
         # Chain 2: Generate personalized reading journey
-        prompt_template_list = PromptTemplate(
-            input_variables=['book_recommendations'],
-            template="""
-            Create a personalized reading journey based on these recommendations:
-            {book_recommendations}
-            
-            Format as:
-            ## 🌟 Your Reading Journey
-            
-            **Start with**: [First Book] - [Brief reason why to start here]  
-            **Continue with**: [Second Book] - [Brief reason for progression]  
-            **Explore**: [Third Book] - [Brief reason for thematic exploration]  
-            **Dive into**: [Fourth Book] - [Brief reason for deeper dive]  
-            **Finish with**: [Fifth Book] - [Brief reason for climactic finish]  
-            
-            **Overall Journey Theme**: [1-sentence theme connecting all books]
-            """
-        )
-        
         list_chain = LLMChain(
-            llm=llm,
-            prompt=prompt_template_list,
+            llm=(journey_model or model).bind(max_tokens=journey_max_tokens).with_config(tags=['journey']),
+            prompt=journey_prompt,
             output_key="reading_journey"
         )
 
         # Combine chains
-        chain = SequentialChain(
+        return SequentialChain(
             chains=[books_chain, list_chain],
-            input_variables=['book_title'],
+            input_variables=books_prompt.input_variables,
             output_variables=['book_recommendations', 'reading_journey']
         )
+    
+    def clear(self):
+        """Drop every compiled prompt and chain"""
+        with self._lock:
+            self._prompts.clear()
+            self._chains.clear()
+
+chain_registry = ChainRegistry()
+
+def _chain_inputs(book_title, num_books, filters):
+    """Build the input variables for the books prompt and recommendation chain"""
+    return dict(filters, book_title=book_title, num_books=num_books)
+
+def _chain_result(book_title, result):
+    """Validate a SequentialChain result and keep only the recommendation fields"""
+    if not result:
+        raise Exception("No response received from AI service")
+    
+    if 'book_recommendations' not in result or not result['book_recommendations']:
+        raise Exception("No book recommendations generated")
+    
+    if 'reading_journey' not in result or not result['reading_journey']:
+        raise Exception("No reading journey generated")
+    
+    return {
+        'book_title': book_title,
+        'book_recommendations': result['book_recommendations'],
+        'reading_journey': result['reading_journey']
+    }
+
+@contextlib.contextmanager
+def _request_scope(session_id, on_queue):
+    """Attribute LLM calls made inside the block to a session for fair rate limiting"""
+    token = _request_context.set((session_id or "default", on_queue))
+    try:
+        yield
+    finally:
+        _request_context.reset(token)
+
+def _call_llm(fn, *args, estimated_tokens=0, upstream_requests=1, **kwargs):
+    """Run an upstream LLM call through the rate limiter and circuit breaker, retrying transient errors"""
+    session_id, on_queue = _request_context.get()
+    
+    def attempt():
+        queued_at = time.monotonic()
+        tokens = rate_limiter.expected_tokens(estimated_tokens)
+        rate_limiter.acquire(session_id, tokens=tokens, requests=upstream_requests, on_wait=on_queue)
+        metrics_helper.note_queue_wait(time.monotonic() - queued_at)
+        # Reserved from the usual share of the worst case; the difference to the actual usage is settled later
+        reservation = resilience_helper.TokenReservation(rate_limiter, tokens, estimated_tokens, session_id)
+        token = metrics_helper.note_usage_listener(reservation)
+        try:
+            return llm_breaker.call(fn, *args, **kwargs)
+        finally:
+            metrics_helper.clear_usage_listener(token)
+            reservation.call_finished()
+    
+    return llm_retry.call(attempt)
+
+async def _call_llm_async(fn, *args, estimated_tokens=0, upstream_requests=1, **kwargs):
+    """Async variant of _call_llm"""
+    session_id, on_queue = _request_context.get()
+    
+    async def attempt():
+        queued_at = time.monotonic()
+        tokens = rate_limiter.expected_tokens(estimated_tokens)
+        await rate_limiter.acquire_async(session_id, tokens=tokens, requests=upstream_requests, on_wait=on_queue)
+        metrics_helper.note_queue_wait(time.monotonic() - queued_at)
+        reservation = resilience_helper.TokenReservation(rate_limiter, tokens, estimated_tokens, session_id)
+        token = metrics_helper.note_usage_listener(reservation)
+        try:
+            return await llm_breaker.call_async(fn, *args, **kwargs)
+        finally:
+            metrics_helper.clear_usage_listener(token)
+            reservation.call_finished()
+    
+    return await llm_retry.call_async(attempt)
+
+def _request_class():
+    """Routing class of the request being served"""
+    return "background" if _request_context.get()[0] in BACKGROUND_SESSION_IDS else "interactive"
+
+def _routed(build):
+    """
+    Wrap an LLM call so every attempt picks its models through the router
+    
+    build(pick) returns the callable for one attempt; pick(stage) returns the
+    client routed for that stage, so a retry can land on another tier.
+    """
+    attempts = itertools.count()
+    request_class = _request_class()
+    
+    def call(*args, **kwargs):
+        retry = next(attempts) > 0
         
-        # Execute the chain
-        logger.info(f"Generating recommendations for: {book_title}")
-        result = chain({'book_title': book_title})
-        
-        # Validate the response
-        if not result:
-            raise Exception("No response received from AI service")
-        
-        if 'book_recommendations' not in result or not result['book_recommendations']:
-            raise Exception("No book recommendations generated")
+        def pick(stage):
+            # A tier whose client can't be created falls back to the large model
+            return get_llm(model_router.choose(stage, request_class, retry)) or get_llm()
         
-        if 'reading_journey' not in result or not result['reading_journey']:
-            raise Exception("No reading journey generated")
+        return build(pick)(*args, **kwargs)
+    
+    return call
+
+class _LLMCall:
+    """
+    An upstream LLM call a generation step waits on
+    
+    build(pick) returns the runnable for one attempt (see _routed); the sync
+    runner invokes it and the async runner awaits ainvoke, so generation logic
+    is written once for both.
+    """
+    
+    def __init__(self, build, inputs, estimated_tokens=0, upstream_requests=1, **kwargs):
+        self.build = build
+        self.inputs = inputs
+        self.estimated_tokens = estimated_tokens
+        self.upstream_requests = upstream_requests
+        self.kwargs = kwargs  # passed on to the runnable, e.g. config
+
+class _Blocking:
+    """Blocking work a generation step waits on, such as consuming a stream; kept off the event loop"""
+    
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+class _Flight:
+    """Steps of steps_fn(*args), run once for all concurrent waiters on the same key"""
+    
+    def __init__(self, key, steps_fn, *args):
+        self.key = key
+        self.steps_fn = steps_fn
+        self.args = args
+
+def _perform(step):
+    """Carry out one generation step on the calling thread"""
+    if isinstance(step, _LLMCall):
+        return _call_llm(
+            _routed(lambda pick: step.build(pick).invoke), step.inputs,
+            estimated_tokens=step.estimated_tokens, upstream_requests=step.upstream_requests, **step.kwargs
+        )
+    if isinstance(step, _Flight):
+        return recommendation_flight.do(step.key, lambda: _run_steps(step.steps_fn(*step.args)))
+    return step.fn(*step.args)
+
+async def _perform_async(step):
+    """Async variant of _perform"""
+    if isinstance(step, _LLMCall):
+        return await _call_llm_async(
+            _routed(lambda pick: step.build(pick).ainvoke), step.inputs,
+            estimated_tokens=step.estimated_tokens, upstream_requests=step.upstream_requests, **step.kwargs
+        )
+    if isinstance(step, _Flight):
+        return await recommendation_flight.do_async(step.key, lambda: _run_steps_async(step.steps_fn(*step.args)))
+    # The context carries the session along to the worker thread
+    return await asyncio.to_thread(step.fn, *step.args)
+
+def _run_steps(steps):
+    """Drive a generator of steps to its return value, sending each outcome (or raising its error) back in"""
+    outcome, error = None, None
+    try:
+        while True:
+            try:
+                step = steps.send(outcome) if error is None else steps.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                outcome, error = _perform(step), None
+            except Exception as e:
+                outcome, error = None, e
+    finally:
+        steps.close()
+
+async def _run_steps_async(steps):
+    """Async variant of _run_steps"""
+    outcome, error = None, None
+    try:
+        while True:
+            try:
+                step = steps.send(outcome) if error is None else steps.throw(error)
+            except StopIteration as done:
+                return done.value
+            try:
+                outcome, error = await _perform_async(step), None
+            except Exception as e:
+                outcome, error = None, e
+    finally:
+        steps.close()
+
+def _books_prompt_text(book_title, num_books, filters):
+    """Format the books prompt for the configured prompt variant"""
+    return chain_registry.get_prompt(prompt_budget.books_prompt_name).format(
+        **_chain_inputs(book_title, num_books, filters)
+    )
+
+def _estimate_chain_tokens(book_title, num_books, filters):
+    """Worst-case prompt + capped completion tokens for both steps of the recommendation chain"""
+    books = prompt_budget.plan('books', _books_prompt_text(book_title, num_books, filters), num_books)
+    # The journey prompt embeds the books answer, which is at most the books cap
+    journey = prompt_budget.plan('journey', chain_registry.get_prompt('journey').template)
+    return books['budget_tokens'] + journey['budget_tokens'] + books['max_tokens']
+
+def _local_journey_steps(book_title, num_books, filters):
+    """Ask the LLM for the books only and build the journey locally"""
+    prompt = _books_prompt_text(book_title, num_books, filters)
+    plan = prompt_budget.plan('books', prompt, num_books)
+    logger.info(f"Generating recommendations with a local journey for: {book_title}")
+    response = yield _LLMCall(
+        lambda pick: pick('books').bind(max_tokens=plan['max_tokens']), prompt,
+        estimated_tokens=plan['budget_tokens'], config={'tags': ['books']}
+    )
+    book_recommendations = response.content if hasattr(response, 'content') else str(response)
+    return _chain_result(book_title, {
+        'book_recommendations': book_recommendations,
+        'reading_journey': build_local_journey(book_title, book_recommendations) if book_recommendations else None
+    })
+
+def _chain_steps(book_title, num_books, filters):
+    """Run the two-step books -> journey SequentialChain"""
+    if _use_local_journey():
+        return (yield from _local_journey_steps(book_title, num_books, filters))
+    inputs = _chain_inputs(book_title, num_books, filters)
+    logger.info(f"Generating recommendations for: {book_title}")
+    result = yield _LLMCall(
+        lambda pick: chain_registry.get_recommendation_chain(pick('books'), num_books, pick('journey')), inputs,
+        estimated_tokens=_estimate_chain_tokens(book_title, num_books, filters), upstream_requests=2
+    )
+    return _chain_result(book_title, result)
+
+def _structured_prompt_text(book_title, num_books, filters):
+    """Format the single-call structured prompt"""
+    return chain_registry.get_prompt('structured').format(
+        book_title=book_title,
+        num_books=num_books,
+        filters=" ".join(text.strip() for text in filters.values() if text)
+    )
+
+def _structured_result(book_title, content, num_books):
+    """
+    Validate a structured response and render it into the markdown result format
+    
+    Raises:
+        ValueError: If the response fails schema validation
+    """
+    parsed = parse_structured_response(content, num_books)
+    return {
+        'book_title': book_title,
+        'book_recommendations': render_books_markdown(parsed['books']),
+        'reading_journey': render_journey_markdown(parsed['journey']),
+        'books': parsed['books'],
+        'journey_steps': parsed['journey']['steps']
+    }
+
+def _structured_steps(book_title, num_books, filters):
+    """
+    Generate books and journey in a single JSON-mode LLM call
+    
+    Raises:
+        ValueError: If the response fails schema validation
+    """
+    logger.info(f"Generating structured recommendations for: {book_title}")
+    prompt = _structured_prompt_text(book_title, num_books, filters)
+    plan = prompt_budget.plan('structured', prompt, num_books)
+    response = yield _LLMCall(
+        lambda pick: pick('structured').bind(
+            response_format={"type": "json_object"}, max_tokens=plan['max_tokens']
+        ), prompt,
+        estimated_tokens=plan['budget_tokens'], config={'tags': ['structured']}
+    )
+    return _structured_result(book_title, response.content, num_books)
+
+def _resolve_mode(mode):
+    """Resolve and validate the generation mode"""
+    mode = mode or GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Generation mode must be one of: {', '.join(GENERATION_MODES)}")
+    return mode
+
+def _resolve_stream_mode(mode):
+    """Resolve the mode for streaming, which has no structured variant"""
+    mode = mode or (GENERATION_MODE if GENERATION_MODE in STREAM_MODES else "chain")
+    if mode not in STREAM_MODES:
+        raise ValueError(f"Streaming supports these modes: {', '.join(STREAM_MODES)}")
+    return mode
+
+def _refresh_in_background(book_title, num_books, filters, mode, cache_key):
+    """Regenerate a stale cache entry off the request path"""
+    if recommendation_flight.in_flight(cache_key):
+        return
+    
+    def refresh():
+        try:
+            _perform(_Flight(cache_key, _uncached_steps, book_title, num_books, filters, mode, cache_key, True))
+        except Exception as e:
+            logger.warning(f"Background refresh failed for '{book_title}': {str(e)}")
+    
+    _refresh_executor.submit(refresh)
+
+def _cache_generated(cache_key, result):
+    """
+    Store a generated result, unless calls were recently failed over
+    
+    Cache keys name the configured models; an answer from the model failed
+    over to would otherwise be served under them for the whole TTL.
+    """
+    if model_router.failed_over_recently():
+        logger.info("Not caching recommendations generated while failing over to another model")
+        return
+    recommendation_cache.set(cache_key, result)
+
+def _with_journey(entry):
+    """A cache entry only counts as a full result once it has a journey; streams cache the books first"""
+    return entry if entry and entry.get('reading_journey') else None
+
+def _semantic_lookup(book_title, partition, record=True, need_journey=True):
+    """Return the fresh cached result of a near-duplicate title, tagged with the match"""
+    match = semantic_cache.lookup(book_title, partition, record=record)
+    if match is None:
+        return None
+    matched_key, matched_title, similarity = match
+    cached = recommendation_cache.get(matched_key)
+    if need_journey:
+        cached = _with_journey(cached)
+    if not cached:
+        return None
+    cached['semantic_match'] = {'title': matched_title, 'similarity': round(similarity, 4)}
+    return cached
+
+def _index_semantic(book_title, partition, cache_key, use_semantic):
+    """Make a freshly cached result findable by near-duplicate titles"""
+    if SEMANTIC_CACHE and use_semantic:
+        semantic_cache.add(book_title, partition, cache_key)
+
+def _lookup_cached(book_title, num_books, filters, mode, cache_key, partition=None, need_journey=True):
+    """
+    Return a fresh cached result, a near-duplicate title's result when a
+    partition is given, or a stale one (refreshed in the background) when allowed
+    
+    Books-only entries cached by a stream are skipped unless need_journey is off.
+    """
+    check = _with_journey if need_journey else (lambda entry: entry)
+    cached = check(recommendation_cache.get(cache_key))
+    if cached:
+        logger.info(f"Serving cached recommendations for: {book_title}")
+        return cached
+    
+    if SEMANTIC_CACHE and partition is not None:
+        cached = _semantic_lookup(book_title, partition, need_journey=need_journey)
+        if cached:
+            logger.info(f"Serving recommendations for similar title '{cached['semantic_match']['title']}' for: {book_title}")
+            return cached
+    
+    if SERVE_STALE:
+        stale = check(recommendation_cache.get_stale(cache_key))
+        if stale:
+            logger.info(f"Serving stale recommendations for: {book_title} while refreshing")
+            _refresh_in_background(book_title, num_books, filters, mode, cache_key)
+            stale['stale'] = True
+            return stale
+    return None
+
+def _stale_fallback(cache_key, error):
+    """Serve the last known good result after a failed generation, or re-raise"""
+    stale = _with_journey(recommendation_cache.get_stale(cache_key))
+    if not stale:
+        raise error
+    logger.warning(f"Serving stale recommendations after failure: {str(error)}")
+    stale['stale'] = True
+    return stale
+
+def _generation_size(num_books):
+    """Number of books to ask the LLM for when num_books are requested"""
+    return max(num_books, SUPERSET_SIZE) if SUPERSET_GENERATION else num_books
+
+def parse_book_entry(entry):
+    """Parse one book entry of the markdown format into the fields of a structured book"""
+    book = {}
+    for field, label in BOOK_ENTRY_LABELS.items():
+        match = re.search(rf"\*\*{label}\*\*:\s*(.*)", entry)
+        book[field] = match.group(1).strip() if match else ""
+    return book
+
+def split_book_entries(text):
+    """Split book recommendations markdown into one entry per book"""
+    starts = [match.start() for match in _BOOK_ENTRY_START.finditer(text)]
+    return [text[start:end].strip() for start, end in zip(starts, starts[1:] + [len(text)])]
+
+def slice_books_markdown(text, num_books):
+    """Keep the first num_books entries of book recommendations markdown"""
+    entries = split_book_entries(text)
+    if len(entries) <= num_books:
+        return text
+    return "\n".join(entries[:num_books])
+
+def slice_recommendations(result, num_books):
+    """
+    Cut a superset result down to its first num_books books
+    
+    Returns:
+        tuple: (sliced result, whether its reading journey mentions a dropped book)
+    """
+    if result.get('books'):
+        if len(result['books']) <= num_books:
+            return dict(result), False
+        kept = result['books'][:num_books]
+        sliced = dict(result, books=kept, book_recommendations=render_books_markdown(kept))
+        dropped_titles = [book['title'] for book in result['books'][num_books:]]
+    else:
+        entries = split_book_entries(result['book_recommendations'])
+        if len(entries) <= num_books:
+            return dict(result), False
+        sliced = dict(result, book_recommendations="\n".join(entries[:num_books]))
+        dropped_titles = extract_streamed_titles("\n".join(entries[num_books:]) + "\n")
+    journey = result.get('reading_journey') or ""
+    return sliced, any(title in journey for title in dropped_titles)
+
+def _serve_slice(book_title, superset, num_books, cache_key, use_cache):
+    """Slice a superset result to num_books, regenerating only a journey that no longer fits"""
+    sliced, journey_outdated = slice_recommendations(superset, num_books)
+    cacheable = not sliced.get('stale') and not sliced.get('semantic_match')
+    if journey_outdated:
+        titles = [book['title'] for book in sliced['books']] if sliced.get('books') else \
+            extract_streamed_titles(sliced['book_recommendations'] + "\n")
+        try:
+            sliced['reading_journey'] = _journey_or_local(
+                book_title, sliced['book_recommendations'], lambda: _generate_journey_from_titles(titles)
+            )
+            sliced.pop('journey_steps', None)
+        except Exception as e:
+            logger.warning(f"Could not regenerate the journey for {num_books} books, keeping the full one: {str(e)}")
+            cacheable = False
+    # Later requests for this size skip the journey call
+    if use_cache and cacheable:
+        _cache_generated(cache_key, sliced)
+    return sliced
+
+def _uncached_steps(book_title, num_books, filters, mode, cache_key, use_cache):
+    """Generate recommendations on a cache miss and store the result"""
+    # Another caller may have filled the cache while we were joining the flight
+    if use_cache:
+        cached = _with_journey(recommendation_cache.get(cache_key))
+        if cached:
+            return cached
+    
+    try:
+        result = None
+        if mode == "json":
+            try:
+                result = yield from _structured_steps(book_title, num_books, filters)
+            except ValueError as e:
+                logger.warning(f"Structured response failed validation, falling back to chain: {str(e)}")
+            except Exception as e:
+                # Groq checks JSON mode itself and answers invalid JSON with a 400 instead of the text
+                if not _is_json_validation_error(e):
+                    raise
+                logger.warning(f"Groq rejected the structured response, falling back to chain: {str(e)}")
+        if mode == "pipelined":
+            result = yield _Blocking(_generate_pipelined, book_title, num_books, filters)
+        if result is None:
+            result = yield from _chain_steps(book_title, num_books, filters)
         
         logger.info("Recommendations generated successfully")
+        if use_cache:
+            _cache_generated(cache_key, result)
         return result
         
     except Exception as e:
         logger.error(f"Error generating recommendations: {str(e)}")
         
         # Check for specific API errors
-        error_str = str(e).lower()
-        if "503" in error_str or "service unavailable" in error_str:
-            raise Exception("The AI service is temporarily unavailable. Please try again in a few minutes. If the problem persists, check https://groqstatus.com/ for service status.")
-        elif "401" in error_str or "unauthorized" in error_str:
-            raise Exception("API key authentication failed. Please check your API configuration.")
-        elif "429" in error_str or "rate limit" in error_str:
-            raise Exception("Rate limit exceeded. Please wait a moment and try again.")
-        elif "timeout" in error_str:
-            raise Exception("Request timed out. Please try again.")
+        raise friendly_error(e)
+
+def _recommendation_steps(book_title, num_books, genres, era, reading_level, book_length, use_cache, mode, session_id, on_queue, use_semantic, defer_journey):
+    """Steps of generate_book_recommendations, shared by its sync and async variants"""
+    # Input validation
+    validate_recommendation_inputs(book_title, num_books, genres, era)
+    mode = _resolve_mode(mode)
+    
+    # Serve repeated title/filter combinations from the cache; other sizes are sliced from the superset
+    generated_books = _generation_size(num_books)
+    cache_key = make_recommendation_cache_key(book_title, num_books, genres, era, reading_level, book_length, mode=mode)
+    superset_key = make_recommendation_cache_key(book_title, generated_books, genres, era, reading_level, book_length, mode=mode)
+    filters = build_filter_text(genres, era, reading_level, book_length)
+    partition = make_semantic_partition(generated_books, genres, era, reading_level, book_length, mode=mode)
+    with _request_scope(session_id, on_queue):
+        if use_cache:
+            cached = _with_journey(recommendation_cache.get(cache_key)) if cache_key != superset_key else None
+            if cached:
+                logger.info(f"Serving cached recommendations for: {book_title}")
+                return cached
+            superset = _lookup_cached(book_title, generated_books, filters, mode, superset_key, partition if use_semantic else None)
+            if superset:
+                # A journey regenerated for the slice is a blocking call
+                return (yield _Blocking(_serve_slice, book_title, superset, num_books, cache_key, use_cache))
+            
+            # Books an earlier stream cached without a journey only need the journey
+            books_only = _cached_books_only(cache_key, superset_key, num_books) if mode in STREAM_MODES else None
+            if books_only and not defer_journey:
+                return (yield _Blocking(
+                    complete_streamed_recommendations,
+                    book_title, books_only, num_books, genres, era, reading_level, book_length, use_cache,
+                    session_id, on_queue, use_semantic, mode
+                ))
+        
+        if mode in STREAM_MODES and (defer_journey or cache_key != superset_key):
+            # The books come from a stream. A superset is streamed without a journey, since one
+            # covering all its books would be thrown away; the journey is generated once, for the slice
+            books_only = yield _Blocking(
+                _generate_books_only,
+                book_title, num_books, genres, era, reading_level, book_length, use_cache, session_id, on_queue, mode,
+                not defer_journey
+            )
+            if defer_journey:
+                return books_only
+            return (yield _Blocking(
+                complete_streamed_recommendations,
+                book_title, books_only['book_recommendations'], num_books, genres, era, reading_level, book_length,
+                use_cache, session_id, on_queue, use_semantic, mode
+            ))
+        
+        # Check if LLM is available
+        if get_llm() is None:
+            raise Exception("AI service is not available. Please check your API configuration.")
+        
+        if cache_key != superset_key:
+            # JSON mode gets books and journey from one call, so a smaller request asks for just its own books
+            try:
+                return (yield _Flight(
+                    cache_key, _uncached_steps, book_title, num_books, filters, mode, cache_key, use_cache
+                ))
+            except Exception as e:
+                if not use_cache:
+                    raise
+                return _stale_fallback(cache_key, e)
+        
+        try:
+            superset = yield _Flight(
+                superset_key, _uncached_steps, book_title, generated_books, filters, mode, superset_key, use_cache
+            )
+            if use_cache:
+                _index_semantic(book_title, partition, superset_key, use_semantic)
+        except Exception as e:
+            if not use_cache:
+                raise
+            superset = _stale_fallback(superset_key, e)
+        return superset
+
+def generate_book_recommendations(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, mode=None, session_id=None, on_queue=None, use_semantic=True, defer_journey=False):
+    """
+    Generate book recommendations with comprehensive error handling
+    
+    Concurrent calls with the same normalized arguments share one upstream
+    generation instead of each sending their own LLM requests. Unless
+    BOOKVOYAGER_SUPERSET is off, SUPERSET_SIZE books are generated once per
+    title/filter combination and smaller requests are sliced from them; the
+    journey is regenerated only when it mentions a book the slice dropped.
+    A smaller request that misses streams the superset without a journey
+    and generates the journey once for its slice. In 'json' mode it makes
+    its single structured call for just its own books instead.
+    
+    Args:
+        book_title (str): The book title or topic to base recommendations on
+        num_books (int): Number of recommendations to generate (3-10)
+        genres (list): List of genres to filter by
+        era (str): Era preference
+        use_cache (bool): Serve and store results in the recommendation cache
+        mode (str): 'chain' for the two-step chain, 'json' for a single structured
+            call that falls back to the chain when validation fails, 'pipelined'
+            to overlap the journey with the books. Defaults to GENERATION_MODE.
+        session_id (str): Caller identity for fair rate limiting across sessions
+        on_queue (callable): Called with (queue position, seconds waited) while
+            the request waits for rate limit capacity
+        use_semantic (bool): Allow serving the cached result of a near-duplicate title
+        defer_journey (bool): On a cache miss return the books without the journey
+            ('reading_journey' is None); pass the result to generate_reading_journey
+            or start_reading_journey later. Ignored in 'json' mode, whose single
+            call returns both.
+    
+    Returns:
+        dict: Dictionary containing 'book_recommendations' and 'reading_journey'.
+            JSON mode also includes the parsed 'books' and 'journey_steps'.
+            Results reused from a similar title carry 'semantic_match'.
+    
+    Raises:
+        ValueError: For invalid inputs
+        Exception: For API or processing errors
+    """
+    return _run_steps(_recommendation_steps(
+        book_title, num_books, genres, era, reading_level, book_length, use_cache, mode, session_id, on_queue,
+        use_semantic, defer_journey
+    ))
+
+async def generate_book_recommendations_async(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, mode=None, session_id=None, on_queue=None, use_semantic=True, defer_journey=False):
+    """
+    Async variant of generate_book_recommendations built on ainvoke
+    
+    Takes the same arguments and returns the same dictionary, but awaits the
+    LLM calls so many requests can share one event loop.
+    """
+    return await _run_steps_async(_recommendation_steps(
+        book_title, num_books, genres, era, reading_level, book_length, use_cache, mode, session_id, on_queue,
+        use_semantic, defer_journey
+    ))
+
+async def generate_book_recommendations_batch_async(requests, max_concurrency=DEFAULT_BATCH_CONCURRENCY):
+    """
+    Run many recommendation requests concurrently with bounded parallelism
+    
+    Args:
+        requests (list): Dicts of generate_book_recommendations keyword arguments,
+            each with at least 'book_title'
+        max_concurrency (int): Maximum number of requests in flight at once
+    
+    Returns:
+        list: One dict per request, in input order, with 'request', 'result'
+            (the recommendations dict or None) and 'error' (message or None)
+    """
+    if not isinstance(max_concurrency, int) or max_concurrency < 1:
+        raise ValueError("max_concurrency must be a positive integer")
+    
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    async def run_one(request):
+        async with semaphore:
+            try:
+                result = await generate_book_recommendations_async(**request)
+                return {'request': request, 'result': result, 'error': None}
+            except Exception as e:
+                return {'request': request, 'result': None, 'error': str(e)}
+    
+    return await asyncio.gather(*(run_one(request) for request in requests))
+
+def generate_book_recommendations_batch(requests, max_concurrency=DEFAULT_BATCH_CONCURRENCY):
+    """
+    Synchronous entry point for generate_book_recommendations_batch_async
+    
+    Runs its own event loop, so call the async variant instead from code that
+    is already inside one.
+    """
+    return asyncio.run(generate_book_recommendations_batch_async(requests, max_concurrency=max_concurrency))
+
+def validate_blend_seeds(book_titles):
+    """Validate the seed books of a blended request, returning them without repeats"""
+    if not isinstance(book_titles, (list, tuple)):
+        raise ValueError("Seed books must be a list")
+    seeds = []
+    for book_title in book_titles:
+        if not book_title or not isinstance(book_title, str) or not book_title.strip():
+            raise ValueError("Seed books must be non-empty strings")
+        if _normalize_title(book_title) not in {_normalize_title(seed) for seed in seeds}:
+            seeds.append(book_title.strip())
+    if len(seeds) < 2 or len(seeds) > MAX_BLEND_SEEDS:
+        raise ValueError(f"Blending needs between 2 and {MAX_BLEND_SEEDS} different seed books")
+    return seeds
+
+def blend_label(seeds):
+    """Seeds as one title for display and prompts: 'A, B and C'"""
+    return seeds[0] if len(seeds) == 1 else f"{', '.join(seeds[:-1])} and {seeds[-1]}"
+
+def blend_books(seed_results, num_books):
+    """
+    Merge per-seed book lists into one, ranked by how many seeds recommended each book
+    
+    Books match on normalized title and author (a missing author matches any);
+    the seeds themselves are left out. Ties go to the book placed higher on
+    average in its seeds' lists, then to the one seen first.
+    
+    Args:
+        seed_results (dict): Seed title -> recommendations dict
+        num_books (int): Length of the blended list
+    
+    Returns:
+        list: Books with the structured fields and 'seeds', the seeds that
+            recommended them
+    """
+    seed_keys = {_normalize_title(seed) for seed in seed_results}
+    merged = []
+    by_title = {}
+    for seed, result in seed_results.items():
+        books = result.get('books') or [
+            parse_book_entry(entry) for entry in split_book_entries(result['book_recommendations'])
+        ]
+        for position, book in enumerate(books):
+            title_key = _normalize_title(book.get('title') or "")
+            if not title_key or title_key in seed_keys:
+                continue
+            author_key = _normalize_title(book.get('author') or "")
+            match = next((
+                candidate for candidate in by_title.get(title_key, [])
+                if not author_key or not candidate['author'] or candidate['author'] == author_key
+            ), None)
+            if match is None:
+                match = {
+                    'book': {field: str(book.get(field) or "").strip() for field in STRUCTURED_BOOK_FIELDS},
+                    'author': author_key, 'seeds': [], 'positions': [], 'order': len(merged)
+                }
+                merged.append(match)
+                by_title.setdefault(title_key, []).append(match)
+            if seed not in match['seeds']:
+                match['seeds'].append(seed)
+                match['positions'].append(position)
+            # Fill fields one seed's answer left empty from another's
+            for field in STRUCTURED_BOOK_FIELDS:
+                if not match['book'][field] and book.get(field):
+                    match['book'][field] = str(book[field]).strip()
+            match['author'] = match['author'] or author_key
+    
+    ranked = sorted(merged, key=lambda m: (-len(m['seeds']), sum(m['positions']) / len(m['positions']), m['order']))
+    books = []
+    for match in ranked[:num_books]:
+        book = dict(match['book'], seeds=match['seeds'])
+        if len(match['seeds']) > 1:
+            book['reason'] = f"Recommended for readers of {blend_label(match['seeds'])}. {book['reason']}".strip()
+        books.append(book)
+    return books
+
+async def generate_blended_recommendations_async(book_titles, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, mode=None, session_id=None, on_queue=None, use_semantic=True):
+    """
+    Blend recommendations for several seed books into one list and journey
+    
+    The per-seed generations run concurrently and go through the cache and
+    shared flights like single requests, without their own journeys; the
+    books are merged with blend_books and one journey is made for the
+    blended list. Wall time is about that of the slowest seed plus the
+    journey.
+    
+    Args:
+        book_titles (list): 2 to MAX_BLEND_SEEDS seed books or topics
+        num_books (int): Number of blended recommendations (3-10)
+        Other arguments are as for generate_book_recommendations and apply to
+        every seed.
+    
+    Returns:
+        dict: 'book_title' (the seeds as one title), 'seeds', the ranked
+            'books' (each with the 'seeds' that recommended it),
+            'book_recommendations', 'reading_journey' and 'seed_errors'
+            (seed -> message for seeds that failed)
+    
+    Raises:
+        ValueError: For invalid inputs
+        Exception: When no seed produced recommendations, or for journey errors
+    """
+    seeds = validate_blend_seeds(book_titles)
+    validate_recommendation_inputs(seeds[0], num_books, genres, era)
+    mode = _resolve_mode(mode)
+    label = blend_label(seeds)
+    
+    # Seed order doesn't change the blend
+    cache_key = make_recommendation_cache_key(
+        " + ".join(sorted(_normalize_title(seed) for seed in seeds)), num_books,
+        genres, era, reading_level, book_length, mode=f"blend-{mode}"
+    )
+    if use_cache:
+        cached = recommendation_cache.get(cache_key)
+        if cached:
+            logger.info(f"Serving cached blended recommendations for: {label}")
+            return cached
+    
+    # More candidates per seed give the ranking books that several seeds share; with the superset they are free
+    seed_request = dict(
+        num_books=_generation_size(num_books), genres=genres, era=era, reading_level=reading_level,
+        book_length=book_length, use_cache=use_cache, mode=mode, session_id=session_id, on_queue=on_queue,
+        use_semantic=use_semantic, defer_journey=True
+    )
+    outcomes = await generate_book_recommendations_batch_async(
+        [dict(seed_request, book_title=seed) for seed in seeds], max_concurrency=len(seeds)
+    )
+    seed_results = {seed: outcome['result'] for seed, outcome in zip(seeds, outcomes) if outcome['result']}
+    seed_errors = {seed: outcome['error'] for seed, outcome in zip(seeds, outcomes) if outcome['error']}
+    for seed, error in seed_errors.items():
+        logger.warning(f"Blending without {seed}: {error}")
+    if not seed_results:
+        raise Exception(next(iter(seed_errors.values())))
+    
+    books = blend_books(seed_results, num_books)
+    if not books:
+        raise Exception("No book recommendations generated")
+    book_recommendations = render_books_markdown(books)
+    with _request_scope(session_id, on_queue):
+        try:
+            reading_journey = await asyncio.to_thread(
+                _journey_or_local, label, book_recommendations, lambda: _generate_journey(book_recommendations)
+            )
+        except Exception as e:
+            logger.error(f"Error generating the blended reading journey: {str(e)}")
+            raise friendly_error(e)
+    
+    result = {
+        'book_title': label,
+        'seeds': seeds,
+        'books': books,
+        'book_recommendations': book_recommendations,
+        'reading_journey': reading_journey,
+        'seed_errors': seed_errors
+    }
+    if use_cache and not seed_errors:
+        _cache_generated(cache_key, result)
+    return result
+
+def generate_blended_recommendations(book_titles, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, mode=None, session_id=None, on_queue=None, use_semantic=True):
+    """
+    Synchronous entry point for generate_blended_recommendations_async
+    
+    Runs its own event loop, so call the async variant instead from code that
+    is already inside one.
+    """
+    return asyncio.run(generate_blended_recommendations_async(
+        book_titles, num_books, genres, era, reading_level, book_length, use_cache=use_cache, mode=mode,
+        session_id=session_id, on_queue=on_queue, use_semantic=use_semantic
+    ))
+
+def _open_stream(model, prompt, max_tokens):
+    """Start a token stream, returning the iterator and its first chunk"""
+    stream = iter(model.bind(max_tokens=max_tokens).stream(prompt, config={'tags': ['books']}))
+    return stream, next(stream, None)
+
+def extract_streamed_titles(text):
+    """Titles of the books whose title line has finished streaming"""
+    return [title.strip() for title in re.findall(r"\*\*Title\*\*:\s*([^\n]+?)\s*\n", text)]
+
+def _generate_journey_from_titles(titles):
+    """Generate the reading journey from book titles alone"""
+    prompt = chain_registry.get_prompt('journey_titles').format(
+        book_titles="\n".join(f"{i}. {title}" for i, title in enumerate(titles, 1))
+    )
+    plan = prompt_budget.plan('journey', prompt)
+    response = _call_llm(
+        _routed(lambda pick: pick('journey').bind(max_tokens=plan['max_tokens']).invoke), prompt,
+        config={'tags': ['journey']},
+        estimated_tokens=plan['budget_tokens']
+    )
+    reading_journey = response.content if hasattr(response, 'content') else str(response)
+    if not reading_journey:
+        raise Exception("No reading journey generated")
+    return reading_journey
+
+class _JourneyPipeline:
+    """Starts the journey request on the first titles of a books stream while the rest still streams"""
+    
+    def __init__(self, num_books):
+        # The journey has one step per stage, so that many titles are enough to start it
+        self.needed = min(num_books, len(JOURNEY_STAGES))
+        # Nothing to overlap when the journey will be built locally
+        self.enabled = not _use_local_journey()
+        self.text = ""
+        self.titles = None
+        self.future = None
+        # Captured inside the request scope so the journey call is rate limited for the same session
+        self._context = contextvars.copy_context()
+    
+    def feed(self, chunk):
+        """Add streamed text, starting the journey once enough titles have arrived"""
+        self.text += chunk
+        if self.enabled and self.future is None:
+            titles = extract_streamed_titles(self.text)
+            if len(titles) >= self.needed:
+                self._start(titles[:self.needed])
+    
+    def finish(self):
+        """Start the journey on whatever titles arrived if the stream ended short"""
+        if self.enabled and self.future is None:
+            titles = extract_streamed_titles(self.text + "\n")
+            if titles:
+                self._start(titles)
+    
+    def _start(self, titles):
+        logger.info(f"Starting pipelined reading journey after {len(titles)} titles")
+        self.titles = titles
+        self.future = _journey_executor.submit(self._context.run, _generate_journey_from_titles, titles)
+    
+    def result(self, book_recommendations):
+        """
+        Get the pipelined journey if it was built from these recommendations
+        
+        Returns:
+            str: The reading journey, or None if it failed or doesn't match
+        """
+        if self.future is None or not all(title in book_recommendations for title in self.titles):
+            return None
+        try:
+            return self.future.result()
+        except Exception as e:
+            logger.warning(f"Pipelined reading journey failed, generating it again: {str(e)}")
+            return None
+    
+    def cancel(self):
+        if self.future is not None:
+            self.future.cancel()
+
+def _park(kind, cache_key, work):
+    """Keep a streamed request's background work until complete_streamed_recommendations claims it"""
+    with _parked_lock:
+        previous = _parked_work.pop((kind, cache_key), None)
+        _parked_work[(kind, cache_key)] = work
+        while len(_parked_work) > MAX_PARKED_WORK:
+            _parked_work.popitem(last=False)[1].cancel()
+    if previous:
+        previous.cancel()
+
+def _claim(kind, cache_key):
+    """Take the parked work of a kind for a cache key, if any"""
+    with _parked_lock:
+        return _parked_work.pop((kind, cache_key), None)
+
+def _visible_books_text(text, num_books):
+    """
+    The part of a superset books stream to show for num_books
+    
+    Returns:
+        tuple: (text to show, whether entry num_books + 1 has started so the rest can be hidden)
+    """
+    starts = [match.start() for match in _BOOK_ENTRY_START.finditer(text)]
+    if len(starts) > num_books:
+        return text[:starts[num_books]], True
+    if len(starts) == num_books:
+        # A partial last line may turn out to be the start of the next entry
+        return text[:text.rfind("\n") + 1], False
+    return text, False
+
+def _cache_books_only(cache_key, book_title, book_recommendations):
+    """
+    Cache streamed books until their journey is generated
+    
+    Reruns and later requests then reuse the books instead of streaming them
+    again; the journey step replaces the entry with the full result.
+    """
+    if _with_journey(recommendation_cache.get(cache_key)):
+        return
+    _cache_generated(cache_key, {
+        'book_title': book_title,
+        'book_recommendations': book_recommendations,
+        'reading_journey': None
+    })
+
+def _cached_books_only(cache_key, superset_key, num_books):
+    """Books markdown an earlier stream cached for num_books without a journey, or None"""
+    cached = recommendation_cache.get(cache_key)
+    if cached:
+        return cached['book_recommendations']
+    superset = recommendation_cache.get(superset_key)
+    if superset:
+        return slice_books_markdown(superset['book_recommendations'], num_books)
+    return None
+
+def _drain_stream(stream, text, books_key, drained, book_title, use_cache):
+    """Read the rest of a books stream after its requested books were shown"""
+    try:
+        for chunk in stream:
+            if chunk.content:
+                text += chunk.content
+    except Exception as e:
+        # The shown books are unaffected; the superset is just shorter
+        logger.warning(f"Reading the rest of the books stream failed: {str(e)}")
+    if use_cache:
+        _cache_books_only(books_key[1], book_title, text)
+    # Identical streams waiting on this one slice their own size from the full text
+    recommendation_flight.complete(books_key, result=text)
+    drained.set_result(text)
+
+def _start_drain(stream, text, books_key, book_title, use_cache):
+    """Read the rest of a books stream on its own thread, returning a future of the full text"""
+    drained = Future()
+    # Running futures can't be cancelled, so dropping it from the parked work never strands waiters
+    drained.set_running_or_notify_cancel()
+    threading.Thread(
+        target=_drain_stream, args=(stream, text, books_key, drained, book_title, use_cache),
+        name="superset-drain", daemon=True
+    ).start()
+    return drained
+
+def _generate_pipelined(book_title, num_books, filters):
+    """Stream the books and generate the journey concurrently from the first titles"""
+    prompt = _books_prompt_text(book_title, num_books, filters)
+    plan = prompt_budget.plan('books', prompt, num_books)
+    logger.info(f"Generating pipelined recommendations for: {book_title}")
+    
+    pipeline = _JourneyPipeline(num_books)
+    try:
+        stream, first_chunk = _call_llm(
+            _routed(lambda pick: functools.partial(_open_stream, pick('books'))), prompt, plan['max_tokens'],
+            estimated_tokens=plan['budget_tokens']
+        )
+        for chunk in itertools.chain([first_chunk] if first_chunk else [], stream):
+            if chunk.content:
+                pipeline.feed(chunk.content)
+        if not pipeline.text:
+            raise Exception("No book recommendations generated")
+        pipeline.finish()
+    except BaseException:
+        pipeline.cancel()
+        raise
+    
+    reading_journey = pipeline.result(pipeline.text) or _journey_or_local(
+        book_title, pipeline.text,
+        lambda: _generate_journey_from_titles(extract_streamed_titles(pipeline.text + "\n") or [book_title])
+    )
+    return _chain_result(book_title, {
+        'book_recommendations': pipeline.text,
+        'reading_journey': reading_journey
+    })
+
+def stream_book_recommendations(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, use_semantic=True, mode=None, start_journey=True):
+    """
+    Stream book recommendation text as tokens arrive from the LLM
+    
+    A cached result is yielded as a single chunk. Pass the joined text to
+    complete_streamed_recommendations to generate the reading journey. In
+    'pipelined' mode the journey is started while the books still stream.
+    Like generate_book_recommendations, a superset of books is requested;
+    only the first num_books are yielded and the rest is read in the
+    background for the cache. Both are cached without a journey until
+    complete_streamed_recommendations fills it in, so a rerun reuses the
+    books instead of streaming them again.
+    
+    Args:
+        start_journey (bool): In 'pipelined' mode, start the journey while the
+            books stream; off for callers that may never ask for it
+    
+    Yields:
+        str: Chunks of the book recommendations markdown
+    
+    Raises:
+        ValueError: For invalid inputs
+        Exception: For API or processing errors
+    """
+    validate_recommendation_inputs(book_title, num_books, genres, era)
+    mode = _resolve_stream_mode(mode)
+    
+    generated_books = _generation_size(num_books)
+    cache_key = make_recommendation_cache_key(book_title, num_books, genres, era, reading_level, book_length, mode=mode)
+    superset_key = make_recommendation_cache_key(book_title, generated_books, genres, era, reading_level, book_length, mode=mode)
+    filters = build_filter_text(genres, era, reading_level, book_length)
+    if use_cache:
+        cached = recommendation_cache.get(cache_key) if cache_key != superset_key else None
+        if cached:
+            logger.info(f"Serving cached recommendations for: {book_title}")
+            yield cached['book_recommendations']
+            return
+        partition = make_semantic_partition(generated_books, genres, era, reading_level, book_length, mode=mode)
+        superset = _lookup_cached(
+            book_title, generated_books, filters, mode, superset_key, partition if use_semantic else None,
+            need_journey=False
+        )
+        if superset:
+            yield slice_books_markdown(superset['book_recommendations'], num_books)
+            return
+    
+    if get_llm() is None:
+        raise Exception("AI service is not available. Please check your API configuration.")
+    
+    # Coalesce with an identical stream already in progress: wait for its text
+    books_key = ('books', superset_key)
+    future, leader = recommendation_flight.join(books_key)
+    if not leader:
+        logger.info(f"Waiting on in-flight recommendations for: {book_title}")
+        yield slice_books_markdown(future.result(), num_books)
+        return
+    
+    prompt = _books_prompt_text(book_title, generated_books, filters)
+    plan = prompt_budget.plan('books', prompt, generated_books)
+    
+    logger.info(f"Streaming recommendations for: {book_title}")
+    text = ""
+    shown = 0
+    error = None
+    pipeline = None
+    draining = False
+    try:
+        # Retries are only possible until the first token has been shown
+        with _request_scope(session_id, on_queue):
+            if mode == "pipelined" and start_journey:
+                pipeline = _JourneyPipeline(num_books)
+            stream, first_chunk = _call_llm(
+                _routed(lambda pick: functools.partial(_open_stream, pick('books'))), prompt, plan['max_tokens'],
+                estimated_tokens=plan['budget_tokens']
+            )
+        for chunk in itertools.chain([first_chunk] if first_chunk else [], stream):
+            if not chunk.content:
+                continue
+            text += chunk.content
+            visible, complete = _visible_books_text(text, num_books)
+            if len(visible) > shown:
+                piece = visible[shown:]
+                shown = len(visible)
+                if pipeline:
+                    pipeline.feed(piece)
+                yield piece
+            if complete:
+                # The requested books are shown; read the rest for the superset without holding the caller
+                draining = True
+                _park('drain', superset_key, _start_drain(stream, text, books_key, book_title, use_cache))
+                break
+        if not draining and shown < len(text):
+            # The stream ended inside the last entry shown
+            piece = text[shown:]
+            shown = len(text)
+            if pipeline:
+                pipeline.feed(piece)
+            yield piece
+        if not shown:
+            raise Exception("No book recommendations generated")
+        if use_cache:
+            _cache_books_only(cache_key, book_title, text[:shown])
+        if pipeline:
+            # Hand the journey over to complete_streamed_recommendations
+            pipeline.finish()
+            _park('journey', cache_key, pipeline)
+            pipeline = None
+    except GeneratorExit:
+        error = Exception("Recommendation stream was closed before it finished")
+        raise
+    except Exception as e:
+        logger.error(f"Error streaming recommendations: {str(e)}")
+        error = friendly_error(e)
+        if use_cache and not shown:
+            stale = recommendation_cache.get_stale(superset_key)
+            if stale:
+                logger.warning("Serving stale recommendations after streaming failure")
+                text = stale['book_recommendations']
+                error = None
+                yield slice_books_markdown(text, num_books)
+                return
+        raise error
+    finally:
+        if pipeline:
+            pipeline.cancel()
+        # Release anyone waiting on this stream, even if it failed or was abandoned
+        if not draining:
+            recommendation_flight.complete(books_key, result=text, error=error)
+
+def complete_streamed_recommendations(book_title, book_recommendations, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, use_semantic=True, mode=None):
+    """
+    Generate the reading journey for streamed recommendations and cache the full result
+    
+    In 'pipelined' mode the journey started during the stream is used when it
+    was built from these recommendations. Once the rest of the stream has been
+    read, the superset is cached with the same journey.
+    
+    Returns:
+        dict: Dictionary containing 'book_recommendations' and 'reading_journey'
+    """
+    if not book_recommendations:
+        raise Exception("No book recommendations generated")
+    mode = _resolve_stream_mode(mode)
+    
+    generated_books = _generation_size(num_books)
+    cache_key = make_recommendation_cache_key(book_title, num_books, genres, era, reading_level, book_length, mode=mode)
+    superset_key = make_recommendation_cache_key(book_title, generated_books, genres, era, reading_level, book_length, mode=mode)
+    partition = make_semantic_partition(generated_books, genres, era, reading_level, book_length, mode=mode)
+    if use_cache:
+        cached = _with_journey(recommendation_cache.get(cache_key))
+        if cached:
+            return cached
+        # The stream may have served a slice of a cached superset, a similar title's or a stale one
+        superset = _with_journey(recommendation_cache.get(superset_key))
+        if not superset and SEMANTIC_CACHE and use_semantic:
+            superset = _semantic_lookup(book_title, partition, record=False)
+        if not superset:
+            superset = _with_journey(recommendation_cache.get_stale(superset_key))
+            if superset:
+                superset['stale'] = True
+        if superset and slice_books_markdown(superset['book_recommendations'], num_books) == book_recommendations:
+            with _request_scope(session_id, on_queue):
+                return _serve_slice(book_title, superset, num_books, cache_key, use_cache)
+    
+    if get_llm() is None:
+        raise Exception("AI service is not available. Please check your API configuration.")
+    
+    with _request_scope(session_id, on_queue):
+        # Keyed apart from the generate flights, whose key is the same when num_books is the superset size
+        result = recommendation_flight.do(
+            ('stream', cache_key), _complete_journey, book_title, book_recommendations, cache_key, superset_key, use_cache
+        )
+    if use_cache:
+        _index_semantic(book_title, partition, superset_key, use_semantic)
+    return result
+
+def _generate_journey(book_recommendations):
+    """Generate the reading journey from the full books markdown"""
+    prompt = chain_registry.get_prompt('journey').format(book_recommendations=book_recommendations)
+    plan = prompt_budget.plan('journey', prompt)
+    response = _call_llm(
+        _routed(lambda pick: pick('journey').bind(max_tokens=plan['max_tokens']).invoke), prompt,
+        config={'tags': ['journey']},
+        estimated_tokens=plan['budget_tokens']
+    )
+    return response.content if hasattr(response, 'content') else str(response)
+
+def _complete_journey(book_title, book_recommendations, cache_key, superset_key, use_cache):
+    """Generate the reading journey for streamed recommendations and store the result"""
+    if use_cache:
+        cached = _with_journey(recommendation_cache.get(cache_key))
+        if cached:
+            return cached
+    
+    pipeline = _claim('journey', cache_key)
+    reading_journey = pipeline.result(book_recommendations) if pipeline else None
+    try:
+        if not reading_journey:
+            reading_journey = _journey_or_local(
+                book_title, book_recommendations, lambda: _generate_journey(book_recommendations)
+            )
+        if not reading_journey:
+            raise Exception("No reading journey generated")
+    except Exception as e:
+        logger.error(f"Error generating reading journey: {str(e)}")
+        raise friendly_error(e)
+    
+    result = {
+        'book_title': book_title,
+        'book_recommendations': book_recommendations,
+        'reading_journey': reading_journey
+    }
+    if use_cache:
+        _cache_generated(cache_key, result)
+    
+    drain = _claim('drain', superset_key)
+    if use_cache and superset_key != cache_key:
+        shown_entries = split_book_entries(book_recommendations)
+        
+        def store_superset(full_text):
+            # The journey only covers the shown books, so slicing back to them reuses it
+            entries = split_book_entries(full_text)
+            if len(entries) > len(shown_entries) and entries[:len(shown_entries)] == shown_entries:
+                _cache_generated(superset_key, dict(result, book_recommendations=full_text))
+        
+        if drain:
+            drain.add_done_callback(lambda future: store_superset(future.result()))
         else:
-            raise Exception(f"Failed to generate recommendations: {str(e)}")
+            # The drain was claimed earlier or the books came from the cache; fill in the cached superset
+            superset = recommendation_cache.get(superset_key)
+            if superset and not superset.get('reading_journey'):
+                store_superset(superset['book_recommendations'])
+    return result
+
+def _generate_books_only(book_title, num_books, genres, era, reading_level, book_length, use_cache, session_id, on_queue, mode, start_journey=False):
+    """Generate the books of a recommendation without its reading journey"""
+    # The caller already looked for similar titles; the stream shares the superset and flights.
+    # Deferred callers such as blend seeds may never ask for the journey, so by default none is
+    # started while streaming
+    book_recommendations = "".join(stream_book_recommendations(
+        book_title, num_books, genres, era, reading_level, book_length, use_cache=use_cache,
+        session_id=session_id, on_queue=on_queue, use_semantic=False, mode=mode, start_journey=start_journey
+    ))
+    return {
+        'book_title': book_title,
+        'book_recommendations': book_recommendations,
+        'reading_journey': None
+    }
+
+def get_cached_recommendations(book_title, num_books=5, genres=None, era=None, reading_level=None, book_length=None, mode=None):
+    """Return the fresh cached result for exactly these arguments, journey included, or None"""
+    mode = _resolve_mode(mode)
+    return _with_journey(recommendation_cache.get(
+        make_recommendation_cache_key(book_title, num_books, genres, era, reading_level, book_length, mode=mode)
+    ))
+
+def generate_reading_journey(book_title, recommendations, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, use_semantic=True, mode=None):
+    """
+    Generate the reading journey for recommendations returned without one
+    
+    Args:
+        recommendations (dict): A result of generate_book_recommendations with
+            defer_journey=True; the other arguments must match that call
+    
+    Returns:
+        dict: The full result with 'reading_journey', also stored in the cache
+    """
+    if recommendations.get('reading_journey'):
+        return recommendations
+    return complete_streamed_recommendations(
+        book_title, recommendations['book_recommendations'], num_books, genres, era, reading_level, book_length,
+        use_cache=use_cache, session_id=session_id, on_queue=on_queue, use_semantic=use_semantic, mode=mode
+    )
+
+def start_reading_journey(book_title, recommendations, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, use_semantic=True, mode=None):
+    """
+    Start generate_reading_journey in the background
+    
+    Returns:
+        concurrent.futures.Future: Resolves to the full result
+    """
+    return _deferred_journey_executor.submit(
+        generate_reading_journey, book_title, recommendations, num_books, genres, era, reading_level, book_length,
+        use_cache=use_cache, session_id=session_id, on_queue=on_queue, use_semantic=use_semantic, mode=mode
+    )
+
+def _normalize_title(title):
+    """Compare titles ignoring case, punctuation and spacing"""
+    return " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+
+def _generate_more_books(book_title, num_books, filters, excluded_titles, start_number):
+    """Ask the LLM for num_books entries that aren't in excluded_titles"""
+    prompt = chain_registry.get_prompt('books_more').format(
+        **_chain_inputs(book_title, num_books, filters),
+        excluded_titles="\n".join(f"- {title}" for title in excluded_titles),
+        start_number=start_number
+    )
+    plan = prompt_budget.plan('books', prompt, num_books)
+    try:
+        response = _call_llm(
+            _routed(lambda pick: pick('books_more').bind(max_tokens=plan['max_tokens']).invoke), prompt,
+            config={'tags': ['books_more']},
+            estimated_tokens=plan['budget_tokens']
+        )
+    except Exception as e:
+        logger.error(f"Error loading more recommendations: {str(e)}")
+        raise friendly_error(e)
+    return split_book_entries(response.content if hasattr(response, 'content') else str(response))
+
+def load_more_recommendations(book_title, recommendations, num_more=3, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, mode=None):
+    """
+    Append num_more books to the recommendations being shown without regenerating them
+    
+    Unseen books of the cached superset are used first; the LLM is only asked
+    for the rest, with every title already shown as an exclusion list. The
+    reading journey is kept as it is.
+    
+    Args:
+        book_title (str): The book title or topic the recommendations are for
+        recommendations (dict): The result being shown, as returned by
+            generate_book_recommendations or complete_streamed_recommendations
+        num_more (int): Number of books to add (1-10)
+        mode (str): Generation mode the recommendations were made with
+    
+    Returns:
+        dict: The recommendations with the new books appended to
+            'book_recommendations' (and 'books' when present) and
+            'loaded_more' counting the books added so far
+    
+    Raises:
+        ValueError: For invalid inputs
+        Exception: For API or processing errors
+    """
+    validate_recommendation_inputs(book_title, 5, genres, era)
+    if not isinstance(num_more, int) or num_more < 1 or num_more > SUPERSET_SIZE:
+        raise ValueError(f"Number of additional books must be an integer between 1 and {SUPERSET_SIZE}")
+    if not recommendations or not recommendations.get('book_recommendations'):
+        raise ValueError("There are no recommendations to add to")
+    if recommendations.get('seeds'):
+        raise ValueError("More books can't be loaded for blended recommendations")
+    mode = _resolve_mode(mode)
+    
+    entries = split_book_entries(recommendations['book_recommendations'])
+    shown_titles = [parse_book_entry(entry)['title'] for entry in entries]
+    total = len(entries) + num_more
+    if total > MAX_LOADED_BOOKS:
+        raise ValueError(f"At most {MAX_LOADED_BOOKS} books can be shown")
+    
+    # Someone may already have loaded more of the same list. Extended lists keep the
+    # journey of the shorter list, so they're cached apart from a plain request for total books
+    cache_key = make_recommendation_cache_key(book_title, total, genres, era, reading_level, book_length, mode=f"more-{mode}")
+    if use_cache:
+        cached = _with_journey(recommendation_cache.get(cache_key))
+        if cached and split_book_entries(cached['book_recommendations'])[:len(entries)] == entries:
+            logger.info(f"Serving cached additional recommendations for: {book_title}")
+            return cached
+    
+    seen = {_normalize_title(title) for title in shown_titles}
+    new_entries = []
+    
+    def add_new(candidates):
+        for entry in candidates:
+            key = _normalize_title(parse_book_entry(entry)['title'])
+            if key and key not in seen and len(new_entries) < num_more:
+                seen.add(key)
+                new_entries.append(entry)
+    
+    if use_cache and SUPERSET_GENERATION:
+        superset_key = make_recommendation_cache_key(book_title, SUPERSET_SIZE, genres, era, reading_level, book_length, mode=mode)
+        # The stream that showed these books may still be reading the rest of the superset
+        drain = recommendation_flight.pending(('books', superset_key))
+        if drain:
+            with contextlib.suppress(Exception):
+                drain.result()
+        superset = recommendation_cache.get(superset_key) or {}
+        add_new(split_book_entries(superset.get('book_recommendations') or ""))
+    
+    if len(new_entries) < num_more:
+        if get_llm() is None:
+            raise Exception("AI service is not available. Please check your API configuration.")
+        filters = build_filter_text(genres, era, reading_level, book_length)
+        excluded_titles = shown_titles + [parse_book_entry(entry)['title'] for entry in new_entries]
+        with _request_scope(session_id, on_queue):
+            add_new(_generate_more_books(
+                book_title, num_more - len(new_entries), filters, excluded_titles, len(excluded_titles) + 1
+            ))
+    if not new_entries:
+        raise Exception("No additional book recommendations generated")
+    
+    # Number the new entries on from the ones already shown
+    new_entries = [
+        _BOOK_ENTRY_START.sub(f"{number}. ", entry, count=1)
+        for number, entry in enumerate(new_entries, len(entries) + 1)
+    ]
+    result = dict(
+        recommendations,
+        book_recommendations="\n".join(entries + new_entries),
+        loaded_more=recommendations.get('loaded_more', 0) + len(new_entries)
+    )
+    if recommendations.get('books'):
+        result['books'] = recommendations['books'] + [parse_book_entry(entry) for entry in new_entries]
+    
+    # A stale or similar title's list is fine to extend for this reader but not to cache as this title's
+    if use_cache and len(new_entries) == num_more and not result.get('stale') and not result.get('semantic_match'):
+        _cache_generated(cache_key, result)
+    return result
+
+def find_incomplete_books(books, num_books):
+    """
+    Spot what a parsed recommendation list is missing
+    
+    Books without a title can't be repaired and count as missing.
+    
+    Returns:
+        tuple: ({index in books: missing fields} for books with a title,
+            number of books missing altogether)
+    """
+    incomplete = {}
+    titled = 0
+    for i, book in enumerate(books):
+        if not str(book.get('title') or "").strip():
+            continue
+        titled += 1
+        missing = [field for field in STRUCTURED_BOOK_FIELDS if not str(book.get(field) or "").strip()]
+        if missing:
+            incomplete[i] = missing
+    return incomplete, max(0, num_books - titled)
+
+def _repair_fields(book_title, books, incomplete):
+    """Ask the LLM for only the missing fields of incomplete books and merge them in place"""
+    lines = []
+    for number, index in enumerate(incomplete, 1):
+        book = books[index]
+        author = f" by {book['author']}" if book.get('author') else ""
+        missing = ", ".join(BOOK_ENTRY_LABELS[field] for field in incomplete[index])
+        lines.append(f"{number}. {book['title']}{author} (missing: {missing})")
+    prompt = chain_registry.get_prompt('books_repair').format(book_title=book_title, incomplete_entries="\n".join(lines))
+    plan = prompt_budget.plan('books', prompt, len(incomplete))
+    response = _call_llm(
+        _routed(lambda pick: pick('books_repair').bind(max_tokens=plan['max_tokens']).invoke), prompt,
+        config={'tags': ['books_repair']},
+        estimated_tokens=plan['budget_tokens']
+    )
+    
+    by_number = dict(enumerate(incomplete, 1))
+    by_title = {_normalize_title(books[index]['title']): index for index in incomplete}
+    repaired = set()
+    for entry in split_book_entries(response.content if hasattr(response, 'content') else str(response)):
+        answer = parse_book_entry(entry)
+        # Match on the entry number, or on the title if the model renumbered
+        index = by_title.get(_normalize_title(answer['title']))
+        if index is None:
+            index = by_number.get(int(re.match(r"\s*(\d+)", entry).group(1)))
+        if index is None:
+            continue
+        for field in incomplete[index]:
+            if answer.get(field):
+                books[index][field] = answer[field]
+        if all(books[index].get(field) for field in incomplete[index]):
+            repaired.add(index)
+    return len(repaired)
+
+def repair_recommendations(book_title, recommendations, books, num_books=5, genres=None, era=None, reading_level=None, book_length=None, use_cache=True, session_id=None, on_queue=None, mode=None):
+    """
+    Fill in the books and fields missing from a partially parsed recommendation list
+    
+    Only the gaps go to the LLM: one small prompt for the missing fields of
+    incomplete entries and, if fewer books parsed than were asked for, a
+    "more books" prompt for just the missing ones. The answers are merged into
+    the parsed books; the reading journey is kept as it is.
+    
+    Args:
+        book_title (str): The book title or topic the recommendations are for
+        recommendations (dict): The result being shown
+        books (list): The books parsed from it
+        num_books (int): Number of books that should be shown
+    
+    Returns:
+        dict: The recommendations with 'books' set to the repaired list,
+            'book_recommendations' rendered from it and 'repaired' counting
+            the books fixed or added. What could not be repaired is left as
+            it was; a failed repair call is logged, not raised.
+    """
+    books = [
+        {field: str(book.get(field) or "").strip() for field in STRUCTURED_BOOK_FIELDS}
+        for book in books if str(book.get('title') or "").strip()
+    ]
+    incomplete, missing_books = find_incomplete_books(books, num_books)
+    if not incomplete and not missing_books:
+        return recommendations
+    if get_llm() is None:
+        return recommendations
+    logger.info(f"Repairing recommendations for {book_title}: {len(incomplete)} incomplete, {missing_books} missing")
+    
+    repaired = 0
+    with _request_scope(session_id, on_queue):
+        if incomplete:
+            try:
+                repaired += _repair_fields(book_title, books, incomplete)
+            except Exception as e:
+                logger.warning(f"Could not repair incomplete books: {str(e)}")
+        if missing_books:
+            filters = build_filter_text(genres, era, reading_level, book_length)
+            titles = [book['title'] for book in books]
+            seen = {_normalize_title(title) for title in titles}
+            try:
+                entries = _generate_more_books(book_title, missing_books, filters, titles, len(titles) + 1)
+            except Exception as e:
+                logger.warning(f"Could not generate the missing books: {str(e)}")
+                entries = []
+            for entry in entries:
+                book = parse_book_entry(entry)
+                if book['title'] and _normalize_title(book['title']) not in seen and missing_books > 0:
+                    seen.add(_normalize_title(book['title']))
+                    books.append(book)
+                    missing_books -= 1
+                    repaired += 1
+    if not repaired:
+        return recommendations
+    
+    result = dict(
+        recommendations,
+        books=books,
+        book_recommendations=render_books_markdown(books),
+        repaired=recommendations.get('repaired', 0) + repaired
+    )
+    # Only a complete list with its journey replaces the cached one
+    still_incomplete, still_missing = find_incomplete_books(books, num_books)
+    if use_cache and not still_incomplete and not still_missing and result.get('reading_journey') \
+            and not result.get('loaded_more') and not result.get('seeds') \
+            and not result.get('stale') and not result.get('semantic_match'):
+        cache_key = make_recommendation_cache_key(
+            book_title, num_books, genres, era, reading_level, book_length, mode=_resolve_mode(mode)
+        )
+        _cache_generated(cache_key, result)
+    return result
 
 def test_api_connection():
     """Test the API connection and return status"""
     try:
-        validate_api_key()
-        if llm is None:
+        if LLM_BACKEND == "groq":
+            validate_api_key()
+        model = get_llm()
+        if model is None:
             return False, "LLM not initialized"
         
         # Try a simple test query
-        test_response = llm.invoke("Say 'Hello'")
+        test_response = model.invoke("Say 'Hello'", config={'tags': ['health_check']})
         if test_response and hasattr(test_response, 'content'):
             return True, "API connection successful"
         else:
@@ -2,10 +2,17 @@ import streamlit as st
 import langchain_helper
 import enhanced_features
 import analytics_helper
+import metrics_helper
+import cassette_helper
+import settings_helper
+import warmup_helper
 import base64
 import requests
 import urllib.parse
 import re
+import os
+import json
+import uuid
 
 # Set page config
 st.set_page_config(
@@ -22,6 +29,8 @@ if 'recommendations' not in st.session_state:
     st.session_state.recommendations = None
 if 'reading_journey' not in st.session_state:
     st.session_state.reading_journey = None
+if 'parsed_books' not in st.session_state:
+    st.session_state.parsed_books = None
 if 'error_message' not in st.session_state:
     st.session_state.error_message = None
 if 'reading_speed' not in st.session_state:
@@ -32,6 +41,17 @@ if 'enhanced_features' not in st.session_state:
     st.session_state.enhanced_features = enhanced_features.EnhancedFeatures()
 if 'analytics_helper' not in st.session_state:
     st.session_state.analytics_helper = analytics_helper.AnalyticsHelper()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'loaded_more' not in st.session_state:
+    st.session_state.loaded_more = None
+if 'deferred_journey' not in st.session_state:
+    st.session_state.deferred_journey = None
+if 'book_repair' not in st.session_state:
+    st.session_state.book_repair = None
+
+# Warm the recommendation cache once per process in the background
+cache_warmer = warmup_helper.start_cache_warmup()
 
 # Theme toggle in sidebar
 theme = st.sidebar.radio('Theme', options=['dark', 'light'], index=0 if st.session_state['theme']=='dark' else 1)
@@ -877,6 +897,13 @@ with st.sidebar:
         key="book_input"
     )
     
+    # More favourites: their recommendations are blended into one list
+    blend_titles = st.text_input(
+        "Also loved (optional, comma-separated):",
+        placeholder="Dune, Circe...",
+        key="blend_input"
+    )
+    
     # Show recent searches if available
     if recent_searches:
         st.markdown("**🔍 Recent Searches:**")
@@ -1038,39 +1065,182 @@ if book_title:
         st.session_state.error_message = None
         
         try:
-            with st.spinner("📖 Exploring the literary universe for perfect recommendations..."):
-                response = langchain_helper.generate_book_recommendations(
-                    validation_result,  # Use validated title
-                    num_books=num_books,
-                    genres=genres,
-                    era=era,
-                    reading_level=reading_level,
-                    book_length=book_length
-                )
-                
-                # Track analytics
-                st.session_state.analytics_helper.add_to_search_history(validation_result, num_books)
-                st.session_state.analytics_helper.update_reading_stats(genres)
-                
-                # Validate response
-                if not response or 'book_recommendations' not in response or 'reading_journey' not in response:
-                    raise Exception("Invalid response from AI service")
-                
-                # Store in session state
-                st.session_state.recommendations = response['book_recommendations']
-                st.session_state.reading_journey = response['reading_journey']
-        
+            # Shown only while this session waits behind others for Groq capacity
+            queue_placeholder = st.empty()
+            
+            def show_queue_position(position, waited):
+                queue_placeholder.info(f"⏳ Lots of readers right now: queued, position {position} ({waited:.0f}s)")
+            
+            # Near-duplicate matching is skipped once the user asks for an exact search
+            use_semantic = st.session_state.get('exact_search_title') != validation_result
+            
+            blend_seeds = [validation_result] + [title.strip() for title in (blend_titles or "").split(",") if title.strip()]
+            blend_seeds = list(dict.fromkeys(blend_seeds))
+            
+            request_signature = (validation_result, num_books, tuple(genres or []), era, reading_level, book_length, tuple(blend_seeds))
+            loaded_more = st.session_state.loaded_more
+            if loaded_more and loaded_more['signature'] == request_signature:
+                # Books added with "load more" stay on screen until the request changes
+                response = loaded_more['response']
+            elif len(blend_seeds) > 1:
+                # Every favourite is searched at once and the books they share rank first
+                with st.spinner("📖 Blending recommendations for all your favourites..."):
+                    response = langchain_helper.generate_blended_recommendations(
+                        blend_seeds,
+                        num_books=num_books,
+                        genres=genres,
+                        era=era,
+                        reading_level=reading_level,
+                        book_length=book_length,
+                        session_id=st.session_state.session_id,
+                        on_queue=show_queue_position,
+                        use_semantic=use_semantic
+                    )
+                for seed, error in response['seed_errors'].items():
+                    st.warning(f"⚠️ Left out '{seed}': {error}")
+            elif langchain_helper.GENERATION_MODE == "json":
+                # Single structured call: nothing useful to stream, the books arrive pre-parsed
+                with st.spinner("📖 Exploring the literary universe for perfect recommendations..."):
+                    response = langchain_helper.generate_book_recommendations(
+                        validation_result,  # Use validated title
+                        num_books=num_books,
+                        genres=genres,
+                        era=era,
+                        reading_level=reading_level,
+                        book_length=book_length,
+                        session_id=st.session_state.session_id,
+                        on_queue=show_queue_position,
+                        use_semantic=use_semantic
+                    )
+            else:
+                # Stream the recommendations as they are generated, then replace
+                # the raw text with the full book cards once the journey is ready
+                stream_placeholder = st.empty()
+                with stream_placeholder.container():
+                    st.markdown("📖 Exploring the literary universe for perfect recommendations...")
+                    streamed_recommendations = st.write_stream(
+                        langchain_helper.stream_book_recommendations(
+                            validation_result,  # Use validated title
+                            num_books=num_books,
+                            genres=genres,
+                            era=era,
+                            reading_level=reading_level,
+                            book_length=book_length,
+                            session_id=st.session_state.session_id,
+                            on_queue=show_queue_position,
+                            use_semantic=use_semantic
+                        )
+                    )
+                    journey_args = dict(
+                        num_books=num_books,
+                        genres=genres,
+                        era=era,
+                        reading_level=reading_level,
+                        book_length=book_length,
+                        session_id=st.session_state.session_id,
+                        use_semantic=use_semantic
+                    )
+                    cached_response = langchain_helper.get_cached_recommendations(
+                        validation_result, num_books, genres, era, reading_level, book_length
+                    )
+                    if langchain_helper.JOURNEY_TIMING == "eager" or cached_response:
+                        with st.spinner("🗺️ Charting your personalized reading journey..."):
+                            response = cached_response or langchain_helper.complete_streamed_recommendations(
+                                validation_result,
+                                streamed_recommendations,
+                                on_queue=show_queue_position,
+                                **journey_args
+                            )
+                    else:
+                        # Show the books now; the journey follows in the background or when asked for
+                        response = {
+                            'book_title': validation_result,
+                            'book_recommendations': streamed_recommendations,
+                            'reading_journey': None
+                        }
+                        deferred = st.session_state.deferred_journey
+                        if deferred is None or deferred['signature'] != request_signature:
+                            deferred = {'signature': request_signature, 'future': None}
+                            st.session_state.deferred_journey = deferred
+                        if deferred['future'] is None and (
+                                langchain_helper.JOURNEY_TIMING == "background" or deferred.get('requested')):
+                            deferred['future'] = langchain_helper.start_reading_journey(
+                                validation_result, response, **journey_args
+                            )
+                        if deferred['future'] is not None and deferred['future'].done():
+                            response = deferred['future'].result()
+                stream_placeholder.empty()
+            queue_placeholder.empty()
+            
+            # Track analytics
+            st.session_state.analytics_helper.add_to_search_history(
+                validation_result, num_books,
+                filters={'genres': genres, 'era': era, 'reading_level': reading_level, 'book_length': book_length}
+            )
+            st.session_state.analytics_helper.update_reading_stats(genres)
+            
+            # Validate response
+            if not response or 'book_recommendations' not in response or 'reading_journey' not in response:
+                raise Exception("Invalid response from AI service")
+            
+            # Store in session state
+            st.session_state.recommendations = response['book_recommendations']
+            st.session_state.reading_journey = response['reading_journey']
+            st.session_state.parsed_books = response.get('books')
+            
             # Display recommendations with enhanced features
-            st.subheader(f"✨ Books Similar to '{validation_result}'")
+            st.subheader(f"✨ Books Similar to '{response['book_title'] if response.get('seeds') else validation_result}'")
+            if response.get('stale'):
+                st.info("⏳ Showing saved recommendations while fresh ones are prepared in the background.")
+            semantic_match = response.get('semantic_match')
+            if semantic_match:
+                st.caption(f"🔎 Showing recommendations from the similar search '{semantic_match['title']}'.")
+                if st.button(f"Search exactly for '{validation_result}'", key="exact_search"):
+                    langchain_helper.report_semantic_false_hit(validation_result, semantic_match['title'])
+                    st.session_state.exact_search_title = validation_result
+                    st.rerun()
             
-            # Extract book details for enhanced display
-            books = st.session_state.enhanced_features.extract_book_details(st.session_state.recommendations)
+            # Extract book details for enhanced display (structured responses are already parsed)
+            books = st.session_state.parsed_books or st.session_state.enhanced_features.extract_book_details(st.session_state.recommendations)
+            
+            # Ask only for the missing books and fields of a partly parsed list, once per answer
+            if books and langchain_helper.REPAIR_INCOMPLETE:
+                book_repair = st.session_state.book_repair
+                if not book_repair or book_repair['source'] != st.session_state.recommendations:
+                    expected_books = num_books + response.get('loaded_more', 0)
+                    incomplete, missing_books = langchain_helper.find_incomplete_books(books, expected_books)
+                    book_repair = None
+                    if incomplete or missing_books:
+                        with st.spinner("🔧 Filling in missing book details..."):
+                            repaired = langchain_helper.repair_recommendations(
+                                validation_result,
+                                response,
+                                books,
+                                num_books=expected_books,
+                                genres=genres,
+                                era=era,
+                                reading_level=reading_level,
+                                book_length=book_length,
+                                session_id=st.session_state.session_id,
+                                on_queue=show_queue_position
+                            )
+                        queue_placeholder.empty()
+                        book_repair = {'source': st.session_state.recommendations, 'response': repaired}
+                        st.session_state.book_repair = book_repair
+                if book_repair and book_repair['response'].get('repaired'):
+                    repaired = book_repair['response']
+                    response = dict(response, books=repaired['books'], book_recommendations=repaired['book_recommendations'])
+                    st.session_state.recommendations = response['book_recommendations']
+                    st.session_state.parsed_books = books = response['books']
             
             # Debug: Show how many books were extracted
             print(f"DEBUG: Extracted {len(books)} books from recommendations")
             
             # Display books with covers and enhanced features
             if books:
+                # All covers are looked up at once; the ones not found by the deadline show a placeholder
+                cover_urls = st.session_state.enhanced_features.get_book_covers(books) \
+                    if st.session_state.show_book_covers else [None] * len(books)
                 for i, book in enumerate(books):
                     # Track book in reading history
                     st.session_state.analytics_helper.add_to_reading_history(book, validation_result)
@@ -1084,10 +1254,7 @@ if book_title:
                             st.markdown('<div class="book-cover">', unsafe_allow_html=True)
                             # Book cover
                             if st.session_state.show_book_covers:
-                                cover_url = st.session_state.enhanced_features.get_book_cover(
-                                    book.get('title', ''), 
-                                    book.get('author', '')
-                                )
+                                cover_url = cover_urls[i]
                                 if cover_url:
                                     st.image(cover_url, width=120, caption="Book Cover")
                                 else:
@@ -1159,13 +1326,43 @@ if book_title:
                 st.markdown("### 📝 Original Recommendations")
                 st.markdown(st.session_state.recommendations, unsafe_allow_html=True)
             
+            # Load more: only the additional books are generated, the list on screen is kept
+            if not response.get('seeds') and st.button("➕ Load 3 more books", key="load_more", use_container_width=True):
+                try:
+                    with st.spinner("📚 Finding more books for you..."):
+                        more = langchain_helper.load_more_recommendations(
+                            validation_result,
+                            response,
+                            num_more=3,
+                            genres=genres,
+                            era=era,
+                            reading_level=reading_level,
+                            book_length=book_length,
+                            session_id=st.session_state.session_id,
+                            on_queue=show_queue_position
+                        )
+                    st.session_state.loaded_more = {'signature': request_signature, 'response': more}
+                    st.rerun()
+                except ValueError as e:
+                    st.warning(str(e))
+            
             # Also show the original markdown for compatibility
             st.markdown("### 📝 Detailed Recommendations")
             st.markdown(st.session_state.recommendations, unsafe_allow_html=True)
         
             # Reading journey
             st.subheader("🌟 Your Personalized Reading Journey")
-            st.markdown(st.session_state.reading_journey, unsafe_allow_html=True)
+            journey_placeholder = st.empty()
+            pending_journey = None
+            if st.session_state.reading_journey:
+                journey_placeholder.markdown(st.session_state.reading_journey, unsafe_allow_html=True)
+            elif st.session_state.deferred_journey and st.session_state.deferred_journey['future'] is not None:
+                # Filled in at the end of the page once the background journey is ready
+                pending_journey = st.session_state.deferred_journey['future']
+                journey_placeholder.info("🗺️ Charting your personalized reading journey...")
+            elif journey_placeholder.button("🗺️ Chart my reading journey", key="request_journey"):
+                st.session_state.deferred_journey['requested'] = True
+                st.rerun()
             
             # Analytics Dashboard Section
             st.markdown("---")
@@ -1335,6 +1532,17 @@ if book_title:
                     
                 except Exception as e:
                     st.error(f"Error creating WhatsApp message: {str(e)}")
+            
+            # The rest of the page is on screen; now wait for the background journey
+            if pending_journey is not None:
+                try:
+                    response = pending_journey.result()
+                    st.session_state.reading_journey = response['reading_journey']
+                    journey_placeholder.markdown(response['reading_journey'], unsafe_allow_html=True)
+                except Exception as e:
+                    # Started again on the next run
+                    st.session_state.deferred_journey = None
+                    journey_placeholder.error(f"Could not chart your reading journey: {str(e)}")
         
         except Exception as e:
             error_msg = str(e)
@@ -1387,6 +1595,7 @@ if book_title:
             # Clear previous results
             st.session_state.recommendations = None
             st.session_state.reading_journey = None
+            st.session_state.parsed_books = None
 
 # Display error message if exists
 if st.session_state.error_message:
@@ -1455,4 +1664,60 @@ else:
             <div class="author">- David R., Public Librarian</div>
         </div>
         """, unsafe_allow_html=True)
-    st.markdown('</div>', unsafe_allow_html=True)
\ No newline at end of file
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Admin performance view: open the app with ?admin=<BOOKVOYAGER_ADMIN_TOKEN>
+admin_token = settings_helper.env_str("BOOKVOYAGER_ADMIN_TOKEN", "")
+if admin_token and st.query_params.get("admin") == admin_token:
+    st.markdown("---")
+    st.subheader("⚙️ Performance (admin)")
+    
+    cache_stats = langchain_helper.recommendation_cache.get_stats()
+    cache_lookups = cache_stats['memory_hits'] + cache_stats['disk_hits'] + cache_stats['misses']
+    limiter_stats = langchain_helper.rate_limiter.get_stats()
+    breaker_stats = langchain_helper.llm_breaker.get_stats()
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        hit_rate = (cache_stats['memory_hits'] + cache_stats['disk_hits']) / cache_lookups if cache_lookups else 0.0
+        st.metric("Cache hit rate", f"{hit_rate:.0%}")
+    with col2:
+        st.metric("Queue depth", limiter_stats['queue_depth'])
+    with col3:
+        st.metric("Groq circuit", breaker_stats['state'])
+    with col4:
+        if cache_warmer:
+            progress = cache_warmer.get_progress()
+            st.metric("Cache warm-up", f"{progress['done']}/{progress['total']}")
+        else:
+            st.metric("Cache warm-up", "off")
+    
+    # Per-stage LLM latency, tokens and cost
+    stage_summary = metrics_helper.llm_metrics.get_summary()
+    if stage_summary:
+        st.dataframe(stage_summary, use_container_width=True)
+    else:
+        st.write("No LLM calls recorded yet")
+    
+    # Which model each stage was routed to, and why
+    routing_summary = langchain_helper.model_router.get_summary()
+    if routing_summary:
+        st.dataframe(routing_summary, use_container_width=True)
+    
+    metrics_export = metrics_helper.llm_metrics.get_stats()
+    metrics_export['cache'] = cache_stats
+    metrics_export['semantic_cache'] = langchain_helper.semantic_cache.get_stats()
+    metrics_export['rate_limiter'] = limiter_stats
+    metrics_export['circuit_breaker'] = breaker_stats
+    metrics_export['model_routing'] = langchain_helper.model_router.get_stats()
+    metrics_export['cassette'] = cassette_helper.cassette.get_stats()
+    metrics_export['warmup'] = cache_warmer.get_progress() if cache_warmer else None
+    
+    with st.expander("Histograms and recent calls"):
+        st.json(metrics_export, expanded=False)
+    st.download_button(
+        "📥 Download metrics (JSON)",
+        data=json.dumps(metrics_export, indent=2),
+        file_name=f"bookvoyager_metrics_{metrics_export['exported_at'][:19].replace(':', '-')}.json",
+        mime="application/json"
+    )
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import contextvars
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds; the last bucket catches everything above
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+TOKEN_BUCKETS = (50, 100, 200, 400, 800, 1600, 3200, 6400)
+
+# Queue wait measured by the rate limiter, handed to the next LLM call started in this context
+_pending_queue_wait = contextvars.ContextVar("pending_queue_wait", default=None)
+
+
+def note_queue_wait(seconds: float):
+    """Record how long the upcoming LLM call waited for rate limiter capacity"""
+    _pending_queue_wait.set([seconds])
+
+
+def take_queue_wait() -> float:
+    """Take the queue wait noted for this call; later calls in the same request report zero"""
+    pending = _pending_queue_wait.get()
+    return pending.pop() if pending else 0.0
+
+
+# Listener for the token usage of the LLM runs started in this context, e.g. a rate limiter
+# reservation: told run_started() when a run starts and run_finished(tokens) when it ends
+_pending_usage_listener = contextvars.ContextVar("pending_usage_listener", default=None)
+
+
+def note_usage_listener(listener) -> contextvars.Token:
+    """Report the usage of LLM runs started from now on in this context to listener"""
+    return _pending_usage_listener.set(listener)
+
+
+def clear_usage_listener(token: contextvars.Token):
+    """Stop reporting usage to the listener noted with token"""
+    _pending_usage_listener.reset(token)
+
+
+def classify_outcome(error: Optional[BaseException]) -> str:
+    """Bucket a call's result into success, rate_limited, unavailable, timeout or error"""
+    if error is None:
+        return "success"
+    error_str = str(error).lower()
+    if "429" in error_str or "rate limit" in error_str:
+        return "rate_limited"
+    if isinstance(error, TimeoutError) or "timeout" in error_str or "timed out" in error_str:
+        return "timeout"
+    if any(code in error_str for code in ("500", "502", "503", "504", "service unavailable", "overloaded")):
+        return "unavailable"
+    return "error"
+
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum, min/max and bucket-based percentile estimates"""
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        """Add one observation"""
+        index = len(self.bounds)
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Estimate a percentile as the upper bound of the bucket it falls in"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict:
+        """Get the histogram as a JSON-serializable dict"""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': [
+                {'le': bound, 'count': count}
+                for bound, count in zip(list(self.bounds) + ["+Inf"], self.counts)
+            ]
+        }
+
+
+class _StageMetrics:
+    """Aggregates for one pipeline stage (books, journey, structured, ...)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.outcomes = {}
+        self.models = {}
+        self.prompt_tokens_total = 0
+        self.completion_tokens_total = 0
+        self.cost = 0.0
+        self.queue_wait = Histogram(LATENCY_BUCKETS)
+        self.time_to_first_token = Histogram(LATENCY_BUCKETS)
+        self.total = Histogram(LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+
+    def to_dict(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'outcomes': dict(self.outcomes),
+            'models': dict(self.models),
+            'prompt_tokens_total': self.prompt_tokens_total,
+            'completion_tokens_total': self.completion_tokens_total,
+            'cost_usd': round(self.cost, 6),
+            'queue_wait_seconds': self.queue_wait.summary(),
+            'time_to_first_token_seconds': self.time_to_first_token.summary(),
+            'total_seconds': self.total.summary(),
+            'prompt_tokens': self.prompt_tokens.summary(),
+            'completion_tokens': self.completion_tokens.summary()
+        }
+
+
+class LLMMetrics:
+    """Per-stage latency, token and cost aggregates for every LLM call, shared across sessions"""
+
+    def __init__(self, input_price: Optional[float] = None, output_price: Optional[float] = None,
+                 recent_size: int = 200):
+        # Prices are USD per million tokens; defaults are Groq's llama3-70b list prices
+        if input_price is None:
+            input_price = settings_helper.env_float("BOOKVOYAGER_PRICE_INPUT_PER_MTOK", 0.59)
+        if output_price is None:
+            output_price = settings_helper.env_float("BOOKVOYAGER_PRICE_OUTPUT_PER_MTOK", 0.79)
+
+        self.input_price = input_price
+        self.output_price = output_price
+        self.started_at = datetime.now().isoformat()
+        self._stages = {}
+        self._recent = deque(maxlen=recent_size)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call listener(call record) after every recorded call, e.g. to feed model routing"""
+        self._listeners.append(listener)
+
+    def record(self, stage: str, model: str, outcome: str, queue_wait: float, time_to_first_token: Optional[float],
+               total: float, prompt_tokens: int, completion_tokens: int):
+        """Record one finished LLM call"""
+        cost = (prompt_tokens * self.input_price + completion_tokens * self.output_price) / 1_000_000
+        with self._lock:
+            metrics = self._stages.setdefault(stage, _StageMetrics())
+            metrics.calls += 1
+            metrics.outcomes[outcome] = metrics.outcomes.get(outcome, 0) + 1
+            metrics.models[model] = metrics.models.get(model, 0) + 1
+            metrics.prompt_tokens_total += prompt_tokens
+            metrics.completion_tokens_total += completion_tokens
+            metrics.cost += cost
+            metrics.queue_wait.observe(queue_wait)
+            if time_to_first_token is not None:
+                metrics.time_to_first_token.observe(time_to_first_token)
+            metrics.total.observe(total)
+            metrics.prompt_tokens.observe(prompt_tokens)
+            metrics.completion_tokens.observe(completion_tokens)
+            call = {
+                'timestamp': datetime.now().isoformat(),
+                'stage': stage,
+                'model': model,
+                'outcome': outcome,
+                'queue_wait': round(queue_wait, 4),
+                'time_to_first_token': None if time_to_first_token is None else round(time_to_first_token, 4),
+                'total': round(total, 4),
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'cost_usd': round(cost, 8)
+            }
+            self._recent.append(call)
+        for listener in self._listeners:
+            try:
+                listener(call)
+            except Exception as e:
+                logger.warning(f"Metrics listener failed: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """Get every stage's aggregates plus the most recent calls"""
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'exported_at': datetime.now().isoformat(),
+                'prices_per_mtok': {'input': self.input_price, 'output': self.output_price},
+                'stages': {stage: metrics.to_dict() for stage, metrics in self._stages.items()},
+                'recent_calls': list(self._recent)
+            }
+
+    def get_summary(self) -> List[Dict]:
+        """Get one row per stage with the headline numbers, for tables"""
+        rows = []
+        for stage, metrics in self.get_stats()['stages'].items():
+            calls = metrics['calls']
+            rows.append({
+                'stage': stage,
+                'calls': calls,
+                'errors': calls - metrics['outcomes'].get('success', 0),
+                'queue_p95_s': metrics['queue_wait_seconds']['p95'],
+                'ttft_p50_s': metrics['time_to_first_token_seconds']['p50'],
+                'ttft_p95_s': metrics['time_to_first_token_seconds']['p95'],
+                'total_p50_s': metrics['total_seconds']['p50'],
+                'total_p95_s': metrics['total_seconds']['p95'],
+                'avg_prompt_tokens': metrics['prompt_tokens_total'] / calls if calls else 0,
+                'avg_completion_tokens': metrics['completion_tokens_total'] / calls if calls else 0,
+                'cost_usd': metrics['cost_usd']
+            })
+        return rows
+
+    def export_json(self, path: str):
+        """Write the full metrics snapshot to a JSON file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as export_file:
+            json.dump(self.get_stats(), export_file, indent=2)
+
+    def reset(self):
+        """Drop all recorded calls"""
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+            self.started_at = datetime.now().isoformat()
+
+
+llm_metrics = LLMMetrics()
+
+# Optionally dump the metrics when the process exits, for offline analysis
+METRICS_EXPORT_PATH = settings_helper.env_str("BOOKVOYAGER_METRICS_PATH", "")
+if METRICS_EXPORT_PATH:
+    atexit.register(lambda: llm_metrics.export_json(METRICS_EXPORT_PATH))
+
+_callback_handler = None
+_callback_handler_lock = threading.Lock()
+
+
+def get_callback_handler():
+    """
+    Get the LangChain callback handler that feeds llm_metrics
+
+    The stage comes from the call's tags, the model from its metadata. LangChain
+    is only imported on first use so the metrics can be read without it.
+    """
+    global _callback_handler
+    with _callback_handler_lock:
+        if _callback_handler is None:
+            _callback_handler = _build_callback_handler(llm_metrics)
+        return _callback_handler
+
+
+def _build_callback_handler(metrics: LLMMetrics):
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class LLMMetricsCallbackHandler(BaseCallbackHandler):
+        """Times each chat model run and records it in LLMMetrics"""
+
+        def __init__(self):
+            self._runs = {}  # run_id -> in-progress call
+            self._lock = threading.Lock()
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, metadata=None, **kwargs):
+            stage = next((tag for tag in (tags or []) if not tag.startswith("seq:")), "other")
+            model = (metadata or {}).get("ls_model_name") or "unknown"
+            prompt_chars = sum(len(str(message.content)) for batch in messages for message in batch)
+            usage_listener = _pending_usage_listener.get()
+            if usage_listener is not None:
+                usage_listener.run_started()
+            with self._lock:
+                self._runs[run_id] = {
+                    'stage': stage,
+                    'model': model,
+                    'started': time.monotonic(),
+                    'first_token': None,
+                    'prompt_chars': prompt_chars,
+                    'streamed_chars': 0,
+                    'queue_wait': take_queue_wait(),
+                    'usage_listener': usage_listener
+                }
+
+        def on_llm_new_token(self, token, *, run_id, **kwargs):
+            with self._lock:
+                run = self._runs.get(run_id)
+                if run is None:
+                    return
+                if run['first_token'] is None:
+                    run['first_token'] = time.monotonic()
+                run['streamed_chars'] += len(token)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            with self._lock:
+                run = self._runs.pop(run_id, None)
+            if run is None:
+                return
+            prompt_tokens, completion_tokens = _token_usage(response)
+            if prompt_tokens is None:
+                prompt_tokens = run['prompt_chars'] // 4 + 1
+            if completion_tokens is None:
+                text = "".join(generation.text for batch in response.generations for generation in batch)
+                completion_tokens = max(len(text), run['streamed_chars']) // 4 + 1
+            self._finish(run, None, prompt_tokens, completion_tokens)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            with self._lock:
+                run = self._runs.pop(run_id, None)
+            if run is not None:
+                self._finish(run, error, run['prompt_chars'] // 4 + 1, run['streamed_chars'] // 4)
+
+        @staticmethod
+        def _finish(run, error, prompt_tokens, completion_tokens):
+            if run['usage_listener'] is not None:
+                try:
+                    run['usage_listener'].run_finished(prompt_tokens + completion_tokens)
+                except Exception as e:
+                    logger.warning(f"Token usage listener failed: {str(e)}")
+            finished = time.monotonic()
+            first_token = run['first_token']
+            # Non-streaming calls deliver everything at once: the first token arrives at the end
+            if first_token is None and error is None:
+                first_token = finished
+            metrics.record(
+                stage=run['stage'],
+                model=run['model'],
+                outcome=classify_outcome(error),
+                queue_wait=run['queue_wait'],
+                time_to_first_token=None if first_token is None else first_token - run['started'],
+                total=finished - run['started'],
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
+            )
+
+    return LLMMetricsCallbackHandler()
+
+
+def _token_usage(response):
+    """Read prompt/completion token counts reported by the provider, if any"""
+    for batch in response.generations:
+        for generation in batch:
+            message = getattr(generation, "message", None)
+            usage = getattr(message, "usage_metadata", None)
+            if usage:
+                return usage.get('input_tokens'), usage.get('output_tokens')
+            usage = (getattr(message, "response_metadata", None) or {}).get('token_usage')
+            if usage:
+                return usage.get('prompt_tokens'), usage.get('completion_tokens')
+    usage = (response.llm_output or {}).get('token_usage')
+    if usage:
+        return usage.get('prompt_tokens'), usage.get('completion_tokens')
+    return None, None
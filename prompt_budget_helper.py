@@ -0,0 +1,74 @@
+import logging
+from typing import Dict, Optional
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+# 'compact' spells the per-book format out once; 'full' is the original three-example template
+PROMPT_VARIANTS = ("compact", "full")
+STAGES = ("books", "journey", "structured")
+
+
+def count_tokens(text: str) -> int:
+    """Rough token count for budgeting (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class PromptBudget:
+    """Picks the books prompt variant and caps completion length to what num_books needs"""
+
+    def __init__(self, variant: Optional[str] = None, book_tokens: Optional[int] = None,
+                 journey_tokens: Optional[int] = None, overhead_tokens: Optional[int] = None):
+        if variant is None:
+            variant = settings_helper.env_str("BOOKVOYAGER_PROMPT_VARIANT", "compact")
+        if book_tokens is None:
+            book_tokens = settings_helper.env_int("BOOKVOYAGER_BOOK_TOKEN_CAP", 120)
+        if journey_tokens is None:
+            journey_tokens = settings_helper.env_int("BOOKVOYAGER_JOURNEY_TOKEN_CAP", 350)
+        if overhead_tokens is None:
+            overhead_tokens = settings_helper.env_int("BOOKVOYAGER_OVERHEAD_TOKEN_CAP", 40)
+
+        if variant not in PROMPT_VARIANTS:
+            logger.warning(f"Unknown prompt variant '{variant}', using 'compact'")
+            variant = "compact"
+
+        self.variant = variant
+        self.book_tokens = book_tokens
+        self.journey_tokens = journey_tokens
+        self.overhead_tokens = overhead_tokens
+
+    @property
+    def books_prompt_name(self) -> str:
+        """Chain registry name of the books prompt for this variant"""
+        return "books" if self.variant == "full" else f"books_{self.variant}"
+
+    @property
+    def cache_tag(self) -> str:
+        """Suffix for cache keys so answers from different templates are kept apart"""
+        return "" if self.variant == "full" else f"-{self.variant}"
+
+    def max_tokens(self, stage: str, num_books: int = 0) -> int:
+        """Completion cap for a stage: the expected answer size plus headroom, never unbounded"""
+        if stage == "books":
+            return self.overhead_tokens + num_books * self.book_tokens
+        if stage == "journey":
+            return self.journey_tokens
+        if stage == "structured":
+            # JSON repeats every key, so allow a little more per book
+            return self.overhead_tokens + num_books * (self.book_tokens + 30) + self.journey_tokens
+        raise ValueError(f"Stage must be one of: {', '.join(STAGES)}")
+
+    def plan(self, stage: str, prompt: str, num_books: int = 0) -> Dict:
+        """Report the prompt size and completion cap of a call before it is sent"""
+        plan = {
+            'stage': stage,
+            'variant': self.variant,
+            'prompt_tokens': count_tokens(prompt),
+            'max_tokens': self.max_tokens(stage, num_books)
+        }
+        plan['budget_tokens'] = plan['prompt_tokens'] + plan['max_tokens']
+        logger.info(
+            f"{stage} prompt: {plan['prompt_tokens']} tokens, completion capped at {plan['max_tokens']}"
+        )
+        return plan
@@ -0,0 +1,639 @@
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+# Substrings of upstream errors worth retrying: rate limits, overload and network trouble
+RETRYABLE_ERROR_MARKERS = (
+    "429", "rate limit", "500", "502", "503", "504", "service unavailable",
+    "overloaded", "timeout", "timed out", "connection"
+)
+
+# Reservations shrink towards the tokens calls actually use, but never below this share of the estimate
+USAGE_RATIO_FLOOR = 0.25
+USAGE_RATIO_SMOOTHING = 0.2
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller waited longer than allowed for rate limiter capacity"""
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Check whether an error looks transient (rate limit, overload, network) rather than permanent"""
+    if isinstance(error, (CircuitOpenError, RateLimitTimeout)):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    error_str = str(error).lower()
+    return any(marker in error_str for marker in RETRYABLE_ERROR_MARKERS)
+
+
+def _share(result: Any) -> Any:
+    """Give each waiter its own copy of dict results so callers can't mutate each other's"""
+    return dict(result) if isinstance(result, dict) else result
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key so only the first caller does the work"""
+
+    def __init__(self):
+        self._futures = {}  # key -> Future of the in-flight call
+        self._lock = threading.Lock()
+        self.stats = {
+            'leaders': 0,
+            'followers': 0
+        }
+
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Join the flight for a key
+
+        Returns:
+            tuple: (future, is_leader). The leader must call complete() exactly
+            once; followers wait on the future.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.stats['followers'] += 1
+                return future, False
+            future = Future()
+            self._futures[key] = future
+            self.stats['leaders'] += 1
+            return future, True
+
+    def complete(self, key: Hashable, result: Any = None, error: BaseException = None):
+        """Publish the leader's result (or error) to every waiter and close the flight"""
+        with self._lock:
+            future = self._futures.pop(key, None)
+        if future is None:
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn for the first caller of a key; concurrent callers share its outcome"""
+        future, leader = self.join(key)
+        if not leader:
+            logger.info("Waiting on in-flight request for the same key")
+            return _share(future.result())
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.complete(key, error=e)
+            raise
+        self.complete(key, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Async variant of do(); fn must return an awaitable. Shares flights with do()"""
+        future, leader = self.join(key)
+        if not leader:
+            logger.info("Waiting on in-flight request for the same key")
+            return _share(await asyncio.wrap_future(future))
+
+        try:
+            result = await fn(*args, **kwargs)
+        except BaseException as e:
+            self.complete(key, error=e)
+            raise
+        self.complete(key, result=result)
+        return result
+
+    def pending(self, key: Hashable) -> Optional[Future]:
+        """The future of the in-flight call for a key without joining it, or None"""
+        with self._lock:
+            return self._futures.get(key)
+
+    def in_flight(self, key: Hashable) -> bool:
+        """Check whether a call for the key is currently running"""
+        with self._lock:
+            return key in self._futures
+
+    def get_stats(self) -> Dict:
+        """Get leader/follower counters and the number of flights in progress"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['in_flight'] = len(self._futures)
+            return stats
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then lets a probe through after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: Optional[int] = None, recovery_timeout: Optional[float] = None):
+        if failure_threshold is None:
+            failure_threshold = settings_helper.env_int("BOOKVOYAGER_BREAKER_THRESHOLD", 5)
+        if recovery_timeout is None:
+            recovery_timeout = settings_helper.env_float("BOOKVOYAGER_BREAKER_RECOVERY", 30)
+
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'rejected': 0,
+            'times_opened': 0
+        }
+
+    def allow_request(self) -> bool:
+        """Check whether a call may go upstream; while half-open only one probe is allowed"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_timeout:
+                    self.stats['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.stats['rejected'] += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        with self._lock:
+            self.stats['successes'] += 1
+            self._failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker closed: upstream recovered")
+            self.state = self.CLOSED
+
+    def record_failure(self):
+        """Count a failed call, opening the circuit at the threshold or on a failed probe"""
+        with self._lock:
+            self.stats['failures'] += 1
+            self._failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.stats['times_opened'] += 1
+                    logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def _before_call(self):
+        """Reject the call if the circuit is open"""
+        if not self.allow_request():
+            raise CircuitOpenError(
+                "AI service unavailable: too many recent failures, not retrying for "
+                f"{self.recovery_timeout:.0f} seconds"
+            )
+
+    def _after_error(self, error: BaseException):
+        """Only transient errors say anything about upstream health"""
+        if is_retryable_error(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn through the breaker"""
+        self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._after_error(e)
+            raise
+        self.record_success()
+        return result
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """Async variant of call(); fn must return an awaitable"""
+        self._before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self._after_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def get_stats(self) -> Dict:
+        """Get the current state and call counters"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['state'] = self.state
+            stats['consecutive_failures'] = self._failures
+            return stats
+
+
+class RetryPolicy:
+    """Retries transient errors with full-jitter exponential backoff"""
+
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None):
+        if max_attempts is None:
+            max_attempts = settings_helper.env_int("BOOKVOYAGER_RETRY_ATTEMPTS", 3)
+        if base_delay is None:
+            base_delay = settings_helper.env_float("BOOKVOYAGER_RETRY_BASE_DELAY", 0.5)
+        if max_delay is None:
+            max_delay = settings_helper.env_float("BOOKVOYAGER_RETRY_MAX_DELAY", 8)
+
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {
+            'retries': 0,
+            'gave_up': 0
+        }
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before the given retry (1-based): uniform in [0, min(max_delay, base * 2^attempt))"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Decide whether to try again after a failed attempt"""
+        if not is_retryable_error(error):
+            return False
+        if attempt >= self.max_attempts:
+            self.stats['gave_up'] += 1
+            return False
+        self.stats['retries'] += 1
+        return True
+
+    def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run fn, retrying transient errors"""
+        attempt = 1
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"Attempt {attempt} failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    async def call_async(self, fn: Callable, *args, **kwargs) -> Any:
+        """Async variant of call(); fn must return an awaitable"""
+        attempt = 1
+        while True:
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(f"Attempt {attempt} failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+
+class _TokenBucket:
+    """Continuously refilling bucket; capacity is one minute's worth of budget"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = float(per_minute)
+        self._updated = time.monotonic()
+
+    def refill(self):
+        """Add the budget accrued since the last refill"""
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until the bucket holds the given amount (capped at capacity)"""
+        missing = min(amount, self.capacity) - self.available
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class TokenReservation:
+    """
+    Tokens reserved for one call, settled against what its LLM runs actually used
+
+    Once the call has returned and every run it started has reported its
+    usage, the limiter is credited the unused part (or charged the overrun).
+    Streams keep their run open after the call returns, so they settle when
+    they end.
+    """
+
+    def __init__(self, limiter: "RateLimiter", tokens: float, estimated_tokens: float,
+                 session_id: Hashable = "default"):
+        self.limiter = limiter
+        self.tokens = tokens  # actually reserved
+        self.estimated_tokens = estimated_tokens  # the caller's worst-case estimate
+        self.session_id = session_id
+        self.used = 0.0
+        self._runs = 0
+        self._open_runs = 0
+        self._call_done = False
+        self._settled = False
+        self._lock = threading.Lock()
+
+    @property
+    def reached_upstream(self) -> bool:
+        """Whether any LLM run was started for the call"""
+        return self._runs > 0
+
+    def run_started(self):
+        """Count an LLM run made for the call"""
+        with self._lock:
+            self._runs += 1
+            self._open_runs += 1
+
+    def run_finished(self, tokens: float):
+        """Charge a finished run's prompt + completion tokens"""
+        with self._lock:
+            self._open_runs = max(0, self._open_runs - 1)
+            self.used += tokens
+        self._settle()
+
+    def call_finished(self):
+        """Mark the call as returned (or failed); no further runs will start"""
+        with self._lock:
+            self._call_done = True
+        self._settle()
+
+    def _settle(self):
+        with self._lock:
+            if self._settled or not self._call_done or self._open_runs:
+                return
+            self._settled = True
+        self.limiter.settle(self)
+
+
+class RateLimiter:
+    """
+    Process-wide limiter for LLM calls with request-per-minute and token-per-minute budgets
+
+    Waiting callers are served round-robin across sessions, FIFO within a
+    session, so one session issuing many requests cannot starve the others.
+    Background sessions such as the cache warm-up are only served while no
+    interactive caller is waiting, and within background_share of the budgets.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_wait: Optional[float] = None, background_share: Optional[float] = None):
+        if requests_per_minute is None:
+            requests_per_minute = settings_helper.env_float("BOOKVOYAGER_GROQ_RPM", 30)
+        if tokens_per_minute is None:
+            tokens_per_minute = settings_helper.env_float("BOOKVOYAGER_GROQ_TPM", 6000)
+        if max_wait is None:
+            max_wait = settings_helper.env_float("BOOKVOYAGER_QUEUE_TIMEOUT", 60)
+        if background_share is None:
+            background_share = settings_helper.env_float("BOOKVOYAGER_BACKGROUND_SHARE", 0.25)
+        if not 0 < background_share <= 1:
+            raise ValueError("Background share must be above 0 and at most 1")
+
+        self.max_wait = max_wait
+        # Share of a worst-case token estimate that calls actually use, learned as they settle
+        self.usage_ratio = 1.0
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+        # Background calls also draw on these, so they never take more than their share
+        self._background_requests = _TokenBucket(requests_per_minute * background_share)
+        self._background_tokens = _TokenBucket(tokens_per_minute * background_share)
+        self._background_sessions = set()
+        self._queues = OrderedDict()  # session -> deque of tickets, in round-robin order
+        self._condition = threading.Condition()
+        self.stats = {
+            'granted': 0,
+            'queued': 0,
+            'timeouts': 0,
+            'total_wait': 0.0,
+            'max_wait': 0.0,
+            'credited_tokens': 0.0,
+            'background_granted': 0
+        }
+
+    def add_background_session(self, session_id: Hashable):
+        """Serve a session's calls only while no interactive call waits, within the background share"""
+        with self._condition:
+            self._background_sessions.add(session_id)
+
+    def _enqueue(self, session_id: Hashable) -> object:
+        """Add a ticket to the back of the session's queue"""
+        ticket = object()
+        if session_id not in self._queues:
+            self._queues[session_id] = deque()
+        self._queues[session_id].append(ticket)
+        return ticket
+
+    def _dequeue(self, session_id: Hashable, ticket: object, served: bool):
+        """Remove a ticket; a served session moves to the back of the rotation"""
+        queue = self._queues.get(session_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            pass
+        if not queue:
+            del self._queues[session_id]
+        elif served:
+            self._queues.move_to_end(session_id)
+
+    def _position(self, session_id: Hashable, ticket: object) -> int:
+        """1-based position of a ticket in the round-robin service order"""
+        # Each round serves one ticket per session, in rotation order; this ticket
+        # is served in round `index`, after every earlier round and after the
+        # sessions ahead of it in the rotation that still have a ticket that round
+        index = self._queues[session_id].index(ticket)
+        background = session_id in self._background_sessions
+        position = 1
+        ahead_in_rotation = True
+        for other_id, queue in self._queues.items():
+            if (other_id in self._background_sessions) != background:
+                # Background tickets wait for every interactive one
+                if background:
+                    position += len(queue)
+                continue
+            if other_id == session_id:
+                ahead_in_rotation = False
+            position += min(len(queue), index)
+            if ahead_in_rotation and len(queue) > index:
+                position += 1
+        return position
+
+    def _head_session(self) -> Hashable:
+        """The session served next: the first interactive one in rotation, else the first background one"""
+        for session_id in self._queues:
+            if session_id not in self._background_sessions:
+                return session_id
+        return next(iter(self._queues))
+
+    def _try_grant(self, session_id: Hashable, ticket: object, tokens: float, requests: float) -> float:
+        """Grant capacity if it is this ticket's turn; returns 0 when granted, else seconds to wait"""
+        buckets = [(self._requests, requests), (self._tokens, tokens)]
+        if session_id in self._background_sessions:
+            buckets += [(self._background_requests, requests), (self._background_tokens, tokens)]
+        for bucket, _ in buckets:
+            bucket.refill()
+        if self._head_session() != session_id or self._queues[session_id][0] is not ticket:
+            return 0.05  # not our turn yet; woken when the head is served
+        delay = max(bucket.time_until(amount) for bucket, amount in buckets)
+        if delay > 0:
+            return delay
+        for bucket, amount in buckets:
+            bucket.available -= min(amount, bucket.capacity)
+        return 0.0
+
+    def _record(self, waited: float, queued: bool):
+        """Update wait statistics for a granted request"""
+        self.stats['granted'] += 1
+        self.stats['total_wait'] += waited
+        self.stats['max_wait'] = max(self.stats['max_wait'], waited)
+        if queued:
+            self.stats['queued'] += 1
+
+    def _attempts(self, session_id: Hashable, tokens: float, requests: float,
+                  on_wait: Optional[Callable[[int, float], None]]):
+        """
+        Queue for capacity, yielding how long to sleep before the next attempt
+
+        Shared by acquire() and acquire_async(), which differ only in how they
+        sleep. Returns the seconds spent waiting once the call is granted.
+        """
+        started = time.monotonic()
+        last_position = None
+        with self._condition:
+            ticket = self._enqueue(session_id)
+            background = session_id in self._background_sessions
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_grant(session_id, ticket, tokens, requests)
+                    waited = time.monotonic() - started
+                    if delay == 0:
+                        self._dequeue(session_id, ticket, served=True)
+                        # Wait statistics describe what users experience
+                        if background:
+                            self.stats['background_granted'] += 1
+                        else:
+                            self._record(waited, last_position is not None)
+                        self._condition.notify_all()
+                        return waited
+                    # Background work has no user waiting on it, so it may wait out busy periods
+                    if waited >= self.max_wait and not background:
+                        self.stats['timeouts'] += 1
+                        raise RateLimitTimeout("Rate limit exceeded: the request queue is full, please try again shortly.")
+                    position = self._position(session_id, ticket)
+                # Report progress outside the lock so a slow callback can't stall other callers
+                if on_wait is not None and position != last_position:
+                    try:
+                        on_wait(position, waited)
+                    except Exception as e:
+                        logger.error(f"Error in rate limiter wait callback: {str(e)}")
+                last_position = position
+                yield delay if background else min(delay, max(self.max_wait - waited, 0.01))
+        except BaseException:
+            with self._condition:
+                self._dequeue(session_id, ticket, served=False)
+                self._condition.notify_all()
+            raise
+
+    def acquire(self, session_id: Hashable = "default", tokens: float = 0, requests: float = 1,
+                on_wait: Optional[Callable[[int, float], None]] = None) -> float:
+        """
+        Block until the call may proceed
+
+        Args:
+            session_id: Fairness key, e.g. the Streamlit session
+            tokens: Estimated prompt + completion tokens for the call
+            requests: Number of upstream requests the call makes
+            on_wait: Called with (queue position, seconds waited) while queued
+
+        Returns:
+            float: Seconds spent waiting
+
+        Raises:
+            RateLimitTimeout: If capacity was not available within max_wait
+        """
+        attempts = self._attempts(session_id, tokens, requests, on_wait)
+        try:
+            while True:
+                try:
+                    delay = next(attempts)
+                except StopIteration as granted:
+                    return granted.value
+                with self._condition:
+                    self._condition.wait(timeout=delay)
+        finally:
+            attempts.close()
+
+    async def acquire_async(self, session_id: Hashable = "default", tokens: float = 0, requests: float = 1,
+                            on_wait: Optional[Callable[[int, float], None]] = None) -> float:
+        """Async variant of acquire() that sleeps on the event loop instead of blocking it"""
+        attempts = self._attempts(session_id, tokens, requests, on_wait)
+        try:
+            while True:
+                try:
+                    delay = next(attempts)
+                except StopIteration as granted:
+                    return granted.value
+                await asyncio.sleep(delay)
+        finally:
+            attempts.close()
+
+    def expected_tokens(self, estimated_tokens: float) -> float:
+        """Tokens to reserve for a call whose worst case (prompt + completion caps) is estimated_tokens"""
+        return estimated_tokens * self.usage_ratio
+
+    def settle(self, reservation: TokenReservation):
+        """Credit back what a call didn't use of its reservation, or charge its overrun"""
+        with self._condition:
+            difference = reservation.tokens - reservation.used
+            buckets = [self._tokens]
+            if reservation.session_id in self._background_sessions:
+                buckets.append(self._background_tokens)
+            for bucket in buckets:
+                bucket.refill()
+                bucket.available = min(bucket.capacity, bucket.available + difference)
+            if difference > 0:
+                self.stats['credited_tokens'] += difference
+            # Calls that never reached upstream say nothing about typical usage
+            if reservation.reached_upstream and reservation.estimated_tokens > 0:
+                ratio = min(1.0, max(USAGE_RATIO_FLOOR, reservation.used / reservation.estimated_tokens))
+                self.usage_ratio += USAGE_RATIO_SMOOTHING * (ratio - self.usage_ratio)
+            self._condition.notify_all()
+
+    def queue_depth(self) -> int:
+        """Number of callers currently waiting"""
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def get_stats(self) -> Dict:
+        """Get queue depth, wait times and remaining budget"""
+        with self._condition:
+            self._requests.refill()
+            self._tokens.refill()
+            stats = dict(self.stats)
+            stats['queue_depth'] = sum(len(queue) for queue in self._queues.values())
+            stats['waiting_sessions'] = len(self._queues)
+            stats['avg_wait'] = stats['total_wait'] / stats['granted'] if stats['granted'] else 0.0
+            stats['requests_available'] = round(self._requests.available, 2)
+            stats['tokens_available'] = round(self._tokens.available, 2)
+            stats['usage_ratio'] = round(self.usage_ratio, 3)
+            return stats
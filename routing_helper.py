@@ -0,0 +1,208 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+# 'large' is the model every call used before routing; 'small' is the fast, cheap one
+TIERS = ("large", "small")
+DEFAULT_TIER_MODELS = {'large': "llama3-70b-8192", 'small': "llama3-8b-8192"}
+REQUEST_CLASSES = ("interactive", "background")
+
+
+def parse_routes(spec: str) -> Dict[str, str]:
+    """
+    Parse a route spec like 'journey=small,background.books=small,retry=small'
+
+    Keys are a stage, '<request class>.<stage>', 'retry' or 'retry.<stage>';
+    values are tiers.
+    """
+    routes = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        key, _, tier = item.partition("=")
+        key, tier = key.strip(), tier.strip()
+        if not key or tier not in TIERS:
+            logger.warning(f"Ignoring model route '{item.strip()}': tier must be one of {', '.join(TIERS)}")
+            continue
+        routes[key] = tier
+    return routes
+
+
+class _ModelWindow:
+    """Recent outcomes of one model, per stage for latency since answer sizes differ by stage"""
+
+    def __init__(self, size: int, max_age: float):
+        self.outcomes = deque(maxlen=size)  # (finished at, stage, seconds, ok)
+        self.max_age = max_age
+        self.calls = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+
+    def recent(self) -> List:
+        # Old samples expire so a model that lost its traffic to failover gets tried again
+        cutoff = time.monotonic() - self.max_age
+        return [outcome for outcome in self.outcomes if outcome[0] >= cutoff]
+
+    def error_rate(self) -> Optional[float]:
+        recent = self.recent()
+        if not recent:
+            return None
+        return sum(1 for _, _, _, ok in recent if not ok) / len(recent)
+
+    def median_latency(self, stage: Optional[str] = None) -> Optional[float]:
+        latencies = sorted(seconds for _, s, seconds, ok in self.recent() if ok and (stage is None or s == stage))
+        return latencies[len(latencies) // 2] if latencies else None
+
+
+class ModelRouter:
+    """
+    Assigns each LLM call to a model tier by stage and request class, failing over on bad health
+
+    Routes come from configuration; a routed model whose recent error rate or
+    median latency for the stage is over its limit is swapped for the other
+    tier's model while that one is healthy. Every decision is counted with its
+    reason so routing can be audited next to the per-model stats.
+    """
+
+    def __init__(self, tier_models: Optional[Dict[str, str]] = None, routes: Optional[Dict[str, str]] = None,
+                 failover: Optional[bool] = None, window: Optional[int] = None,
+                 max_error_rate: Optional[float] = None, max_latency: Optional[float] = None,
+                 min_samples: Optional[int] = None, recovery: Optional[float] = None):
+        if tier_models is None:
+            tier_models = {
+                'large': settings_helper.env_str("BOOKVOYAGER_LARGE_MODEL", DEFAULT_TIER_MODELS['large']),
+                'small': settings_helper.env_str("BOOKVOYAGER_SMALL_MODEL", DEFAULT_TIER_MODELS['small'])
+            }
+        if routes is None:
+            routes = parse_routes(settings_helper.env_str("BOOKVOYAGER_MODEL_ROUTES", ""))
+        if failover is None:
+            failover = settings_helper.env_bool("BOOKVOYAGER_MODEL_FAILOVER", True)
+        if window is None:
+            window = settings_helper.env_int("BOOKVOYAGER_ROUTE_WINDOW", 20)
+        if max_error_rate is None:
+            max_error_rate = settings_helper.env_float("BOOKVOYAGER_ROUTE_MAX_ERROR_RATE", 0.5)
+        if max_latency is None:
+            max_latency = settings_helper.env_float("BOOKVOYAGER_ROUTE_MAX_LATENCY", 15)
+        if min_samples is None:
+            min_samples = settings_helper.env_int("BOOKVOYAGER_ROUTE_MIN_SAMPLES", 5)
+        if recovery is None:
+            recovery = settings_helper.env_float("BOOKVOYAGER_ROUTE_RECOVERY", 120)
+
+        self.tier_models = tier_models
+        self.routes = routes
+        self.failover = failover
+        self.max_error_rate = max_error_rate
+        self.max_latency = max_latency
+        self.min_samples = min_samples
+        self._window_size = window
+        self._recovery = recovery
+        self._windows = {}
+        self._decisions = {}  # (request class, stage, model, reason) -> count
+        self._last_failover = None  # monotonic time of the latest failover decision
+        self._lock = threading.Lock()
+
+    @property
+    def cache_tag(self) -> str:
+        """Suffix for cache keys when answers may come from a model other than the large one"""
+        if not self.routes or all(tier == "large" for tier in self.routes.values()):
+            return ""
+        return "-routes:" + ",".join(f"{key}={tier}" for key, tier in sorted(self.routes.items()))
+
+    def tier_for(self, stage: str, request_class: str = "interactive", retry: bool = False) -> str:
+        """Configured tier for a call, the most specific route winning"""
+        keys = [f"{request_class}.{stage}", stage]
+        if retry:
+            keys = [f"retry.{stage}", "retry"] + keys
+        return next((self.routes[key] for key in keys if key in self.routes), "large")
+
+    def choose(self, stage: str, request_class: str = "interactive", retry: bool = False) -> str:
+        """Pick the model for a call and count the decision"""
+        tier = self.tier_for(stage, request_class, retry)
+        model = self.tier_models[tier]
+        reason = "retry" if retry and tier != self.tier_for(stage, request_class) else "route"
+
+        if self.failover:
+            problem = self._health_problem(model, stage)
+            if problem:
+                other = self.tier_models["small" if tier == "large" else "large"]
+                if other != model and not self._health_problem(other, stage):
+                    logger.warning(f"Routing {stage} from {model} to {other}: {problem}")
+                    model, reason = other, f"failover ({problem})"
+
+        with self._lock:
+            if reason.startswith("failover"):
+                self._last_failover = time.monotonic()
+            key = (request_class, stage, model, reason)
+            self._decisions[key] = self._decisions.get(key, 0) + 1
+        return model
+
+    def failed_over_recently(self) -> bool:
+        """
+        Whether a call was failed over within the recovery window
+
+        Answers produced meanwhile may come from a model the cache key doesn't
+        name, so they shouldn't be cached.
+        """
+        with self._lock:
+            return self._last_failover is not None and time.monotonic() - self._last_failover < self._recovery
+
+    def _health_problem(self, model: str, stage: str) -> Optional[str]:
+        """Why a model should not take a stage's calls right now, or None while it looks healthy"""
+        with self._lock:
+            window = self._windows.get(model)
+            if window is None or len(window.recent()) < self.min_samples:
+                return None
+            error_rate = window.error_rate()
+            latency = window.median_latency(stage)
+        if error_rate > self.max_error_rate:
+            return f"error rate {error_rate:.0%}"
+        if latency is not None and latency > self.max_latency:
+            return f"median {stage} latency {latency:.1f}s"
+        return None
+
+    def observe(self, call: Dict):
+        """Record a finished call (an LLMMetrics call record: stage, model, outcome, total)"""
+        with self._lock:
+            window = self._windows.setdefault(call['model'], _ModelWindow(self._window_size, self._recovery))
+            ok = call['outcome'] == "success"
+            window.outcomes.append((time.monotonic(), call['stage'], call['total'], ok))
+            window.calls += 1
+            window.total_seconds += call['total']
+            if not ok:
+                window.failures += 1
+
+    def get_stats(self) -> Dict:
+        """Get the routes, per-model health and decision counts"""
+        with self._lock:
+            models = {
+                model: {
+                    'calls': window.calls,
+                    'failures': window.failures,
+                    'avg_latency': round(window.total_seconds / window.calls, 4) if window.calls else 0.0,
+                    'recent_error_rate': window.error_rate(),
+                    'recent_median_latency': window.median_latency()
+                }
+                for model, window in self._windows.items()
+            }
+            decisions = [
+                {'request_class': request_class, 'stage': stage, 'model': model, 'reason': reason, 'count': count}
+                for (request_class, stage, model, reason), count in sorted(self._decisions.items())
+            ]
+        return {
+            'tiers': dict(self.tier_models),
+            'routes': dict(self.routes),
+            'failover': self.failover,
+            'failed_over_recently': self.failed_over_recently(),
+            'models': models,
+            'decisions': decisions
+        }
+
+    def get_summary(self) -> List[Dict]:
+        """One row per routing decision kind, for tables"""
+        return self.get_stats()['decisions']
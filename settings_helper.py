@@ -0,0 +1,46 @@
+import os
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+FALSE_VALUES = ("0", "false", "no", "off")
+
+
+def env_str(name: str, default: str = "") -> str:
+    """A string setting; an empty value is kept, since some settings use it to turn a feature off"""
+    return os.getenv(name, default)
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """A true/false setting, falling back to the default when unset, empty or unrecognized"""
+    value = os.getenv(name, "").strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    if value:
+        logger.warning(f"Ignoring {name}={value!r}: expected one of {', '.join(TRUE_VALUES + FALSE_VALUES)}")
+    return default
+
+
+def _env_number(name: str, default, parse):
+    value = os.getenv(name, "").strip()
+    if not value:
+        return default
+    try:
+        return parse(value)
+    except ValueError:
+        logger.warning(f"Ignoring {name}={value!r}: expected a number, using {default}")
+        return default
+
+
+def env_int(name: str, default: Optional[int]) -> Optional[int]:
+    """An integer setting, falling back to the default when unset, empty or malformed"""
+    return _env_number(name, default, int)
+
+
+def env_float(name: str, default: Optional[float]) -> Optional[float]:
+    """A numeric setting, falling back to the default when unset, empty or malformed"""
+    return _env_number(name, default, float)
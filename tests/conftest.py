@@ -0,0 +1,82 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Offline and in-memory: tests never reach Groq or write the on-disk cache
+os.environ.setdefault("BOOKVOYAGER_LLM_BACKEND", "fake")
+os.environ.setdefault("BOOKVOYAGER_FAKE_LATENCY", "0")
+os.environ.setdefault("BOOKVOYAGER_CACHE_PATH", "")
+os.environ.setdefault("BOOKVOYAGER_WARMUP", "false")
+os.environ.setdefault("BOOKVOYAGER_QUERY_STATS_PATH", "")
+os.environ.setdefault("BOOKVOYAGER_GROQ_RPM", "1000")
+os.environ.setdefault("BOOKVOYAGER_GROQ_TPM", "10000000")
+
+
+class FakeClock:
+    """Stands in for time.monotonic so time-based state changes can be stepped through"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    import resilience_helper
+    fake = FakeClock()
+    monkeypatch.setattr(resilience_helper.time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture
+def wait_until():
+    """Poll a condition from another thread's point of view, failing after a timeout"""
+    def wait(condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "condition not reached"
+            time.sleep(0.005)
+    return wait
+
+
+def join_superset_drains():
+    """Wait for streams that are reading the rest of a superset in the background"""
+    for thread in threading.enumerate():
+        if thread.name == "superset-drain":
+            thread.join(5)
+
+
+@pytest.fixture
+def recommender(monkeypatch):
+    """langchain_helper on the fake backend with empty caches and metrics"""
+    import cache_helper
+    import langchain_helper
+    import metrics_helper
+    langchain_helper.recommendation_cache.clear()
+    monkeypatch.setattr(langchain_helper, "semantic_cache", cache_helper.SemanticCache())
+    metrics_helper.llm_metrics.reset()
+    yield langchain_helper
+    # Don't let a stream still reading a superset leak into the next test
+    join_superset_drains()
+
+
+@pytest.fixture
+def llm_calls():
+    """Upstream LLM calls recorded so far, per stage"""
+    import metrics_helper
+
+    def calls():
+        # A books stream is recorded once the rest of its superset has been read
+        join_superset_drains()
+        return {stage: stats['calls'] for stage, stats in metrics_helper.llm_metrics.get_stats()['stages'].items()}
+    return calls
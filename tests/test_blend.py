@@ -0,0 +1,67 @@
+import pytest
+
+from langchain_helper import blend_books, blend_label, validate_blend_seeds
+
+
+def book(title, author=None, **fields):
+    return dict({'title': title, 'author': f"Author of {title}" if author is None else author, 'year': "1970",
+                 'description': f"About {title}", 'reason': f"Because of {title}"}, **fields)
+
+
+def seed(*books):
+    return {'books': list(books)}
+
+
+def test_books_recommended_by_more_seeds_rank_first():
+    blended = blend_books({
+        "Dune": seed(book("Foundation"), book("Hyperion"), book("Solaris")),
+        "Neuromancer": seed(book("Snow Crash"), book("Hyperion"))
+    }, 4)
+    assert [entry['title'] for entry in blended] == ["Hyperion", "Foundation", "Snow Crash", "Solaris"]
+    assert blended[0]['seeds'] == ["Dune", "Neuromancer"]
+    assert blended[0]['reason'].startswith("Recommended for readers of Dune and Neuromancer.")
+    assert blended[1]['seeds'] == ["Dune"]
+
+
+def test_seeds_are_left_out_and_the_list_is_cut():
+    blended = blend_books({
+        "Dune": seed(book("Neuromancer"), book("Foundation")),
+        "Neuromancer": seed(book("Dune"), book("Hyperion"))
+    }, 1)
+    assert [entry['title'] for entry in blended] == ["Foundation"]
+
+
+def test_same_title_by_different_authors_stays_apart():
+    blended = blend_books({
+        "Dune": seed(book("Kindred", author="Octavia E. Butler")),
+        "Beloved": seed(book("Kindred", author="Someone Else"))
+    }, 5)
+    assert len(blended) == 2
+
+
+def test_empty_fields_are_filled_from_another_seed():
+    blended = blend_books({
+        "Dune": seed(book("Hyperion", author="", year="")),
+        "Neuromancer": seed(book("Hyperion", author="Dan Simmons", year="1989"))
+    }, 5)
+    assert len(blended) == 1
+    assert (blended[0]['author'], blended[0]['year']) == ("Dan Simmons", "1989")
+
+
+def test_validate_blend_seeds_drops_repeats():
+    assert validate_blend_seeds(["Dune", " dune ", "Hyperion"]) == ["Dune", "Hyperion"]
+    with pytest.raises(ValueError):
+        validate_blend_seeds(["Dune", "DUNE"])
+    assert blend_label(["Dune", "Hyperion", "Solaris"]) == "Dune, Hyperion and Solaris"
+
+
+def test_blend_makes_one_journey_and_ignores_seed_order(recommender, llm_calls):
+    result = recommender.generate_blended_recommendations(["Dune", "Hyperion"], 4, mode="chain")
+    assert len(result['books']) == 4
+    assert result['reading_journey']
+    assert result['seed_errors'] == {}
+    assert llm_calls() == {'books': 2, 'journey': 1}
+
+    again = recommender.generate_blended_recommendations(["Hyperion", "Dune"], 4, mode="chain")
+    assert again['book_recommendations'] == result['book_recommendations']
+    assert llm_calls() == {'books': 2, 'journey': 1}
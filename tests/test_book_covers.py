@@ -0,0 +1,73 @@
+import time
+import threading
+from collections import OrderedDict
+
+import pytest
+import requests
+
+import cassette_helper
+import enhanced_features
+
+
+class FakeGoogleBooks:
+    """Answers cover lookups after a per-title delay, counting requests"""
+
+    def __init__(self, delays=None):
+        self.delays = delays or {}
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        with self._lock:
+            self.queries.append(params['q'])
+        title = next((title for title in self.delays if params['q'].startswith(title)), None)
+        time.sleep(self.delays.get(title, 0))
+        response = requests.Response()
+        response.status_code = 200
+        response._content = (
+            b'{"items": [{"volumeInfo": {"imageLinks": {"thumbnail": "http://covers/%s"}}}]}'
+            % params['q'].split()[0].encode()
+        )
+        return response
+
+
+@pytest.fixture
+def google_books(monkeypatch):
+    monkeypatch.setattr(enhanced_features, "_cover_cache", OrderedDict())
+
+    def install(delays=None):
+        fake = FakeGoogleBooks(delays)
+        monkeypatch.setattr(cassette_helper.cassette, "get", fake.get)
+        return fake
+    return install
+
+
+def books(*titles):
+    return [{'title': title, 'author': "Someone"} for title in titles]
+
+
+def test_covers_are_fetched_concurrently(google_books):
+    google_books({"Dune": 0.3, "Hyperion": 0.3, "Solaris": 0.3})
+    started = time.monotonic()
+    covers = enhanced_features.EnhancedFeatures().get_book_covers(books("Dune", "Hyperion", "Solaris"), deadline=5)
+    assert covers == ["http://covers/Dune", "http://covers/Hyperion", "http://covers/Solaris"]
+    assert time.monotonic() - started < 0.8
+
+
+def test_slow_covers_miss_the_deadline_and_are_remembered(google_books, wait_until):
+    google_books({"Hyperion": 0.5})
+    features = enhanced_features.EnhancedFeatures()
+    assert features.get_book_covers(books("Dune", "Hyperion"), deadline=0.2) == ["http://covers/Dune", None]
+
+    # The slow lookup finishes in the background and serves the next page
+    wait_until(lambda: ("hyperion", "someone") in enhanced_features._cover_cache)
+    fake = google_books()
+    assert features.get_book_covers(books("Hyperion"), deadline=0.2) == ["http://covers/Hyperion"]
+    assert fake.queries == []
+
+
+def test_each_book_is_looked_up_once(google_books):
+    fake = google_books()
+    covers = enhanced_features.EnhancedFeatures().get_book_covers(books("Dune", "Dune", "Hyperion"), deadline=5)
+    assert covers == ["http://covers/Dune", "http://covers/Dune", "http://covers/Hyperion"]
+    assert len(fake.queries) == 2
@@ -0,0 +1,61 @@
+import json
+from argparse import Namespace
+
+import bulk_generate
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def generate_args(input_path, output_path):
+    return Namespace(input=input_path, output=output_path, workers=2, mode="chain", progress_every=10)
+
+
+def records(path):
+    return list(bulk_generate.read_output(path))
+
+
+def test_read_requests_parses_csv_and_skips_bad_rows(tmp_path):
+    path = write(tmp_path / "titles.csv", "book_title,num_books,genres\nDune,4,Fiction; Sci-Fi\n,5,\nHyperion,,\n")
+    assert bulk_generate.read_requests(path) == [
+        {'book_title': "Dune", 'num_books': 4, 'genres': ["Fiction", "Sci-Fi"]},
+        {'book_title': "Hyperion"}
+    ]
+
+
+def test_read_requests_accepts_jsonl_objects_and_bare_titles(tmp_path):
+    path = write(tmp_path / "titles.jsonl", '# seeds\n{"book_title": "Dune", "era": "Modern"}\nHyperion\n')
+    assert bulk_generate.read_requests(path) == [{'book_title': "Dune", 'era': "Modern"}, {'book_title': "Hyperion"}]
+
+
+def test_rerun_only_generates_what_is_missing(recommender, llm_calls, tmp_path):
+    input_path = write(tmp_path / "titles.jsonl", "Dune\nHyperion\nDune\n")
+    output_path = str(tmp_path / "out.jsonl")
+    assert bulk_generate.run_generate(generate_args(input_path, output_path)) == 0
+    assert sorted(record['request']['book_title'] for record in records(output_path)) == ["Dune", "Hyperion"]
+
+    # A crash left the last record half-written
+    with open(output_path, encoding="utf-8") as output_file:
+        lines = output_file.read().splitlines()
+    write(tmp_path / "out.jsonl", lines[0] + "\n" + lines[1][:40])
+    recommender.recommendation_cache.clear()
+
+    assert bulk_generate.run_generate(generate_args(input_path, output_path)) == 0
+    done = [record for record in records(output_path) if record.get('result')]
+    assert sorted(record['request']['book_title'] for record in done) == ["Dune", "Hyperion"]
+
+
+def test_loaded_results_are_served_from_the_cache(recommender, llm_calls, tmp_path):
+    input_path = write(tmp_path / "titles.jsonl", json.dumps({'book_title': "Dune", 'num_books': 3}) + "\n")
+    output_path = str(tmp_path / "out.jsonl")
+    bulk_generate.run_generate(generate_args(input_path, output_path))
+    generated = records(output_path)[0]['result']
+
+    recommender.recommendation_cache.clear()
+    calls = llm_calls()
+    assert bulk_generate.run_load(Namespace(input=output_path)) == 0
+    served = recommender.generate_book_recommendations("Dune", 3, mode="chain")
+    assert served['book_recommendations'] == generated['book_recommendations']
+    assert llm_calls() == calls
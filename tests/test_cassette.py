@@ -0,0 +1,57 @@
+import pytest
+
+from cassette_helper import Cassette, CassetteMiss, RecordedError, create_cassette_chat_model
+from fake_llm_helper import FakeChatModel
+
+PROMPT = 'Recommend 3 books related to the book or topic "Dune".'
+
+
+def recorder(path, **fake_options):
+    inner = FakeChatModel(latency=0, **fake_options)
+    return create_cassette_chat_model(inner, "fake", Cassette(str(path), mode="record"))
+
+
+def player(path):
+    return create_cassette_chat_model(None, "fake", Cassette(str(path), mode="replay", latency="zero"))
+
+
+def test_replay_returns_the_recorded_answer_without_the_model(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorded = recorder(path).invoke(PROMPT).content
+    model = player(path)
+    assert model.invoke(PROMPT).content == recorded
+    assert model.cassette.get_stats()['replayed'] == 1
+
+
+def test_streamed_answer_replays_chunk_by_chunk(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorded = [chunk.content for chunk in recorder(path, tokens_per_second=1000).stream(PROMPT)]
+    assert len(recorded) > 1
+    assert [chunk.content for chunk in player(path).stream(PROMPT)] == recorded
+
+
+def test_upstream_errors_replay_with_their_message(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    with pytest.raises(Exception) as recorded:
+        recorder(path, error_rate=1.0, error_kinds=["503"]).invoke(PROMPT)
+    with pytest.raises(RecordedError, match="503") as replayed:
+        player(path).invoke(PROMPT)
+    assert str(replayed.value) == str(recorded.value)
+
+
+def test_unrecorded_request_is_a_miss(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    recorder(path).invoke(PROMPT)
+    model = player(path)
+    with pytest.raises(CassetteMiss):
+        model.invoke('Recommend 3 books related to the book or topic "Hyperion".')
+    assert model.cassette.get_stats()['misses'] == 1
+
+
+def test_identical_requests_replay_in_order_and_the_last_repeats(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    recording = Cassette(path, mode="record")
+    for content in ("first", "second"):
+        recording.record("llm", {'prompt': "same"}, {'latency': 0, 'content': content})
+    replay = Cassette(path, mode="replay")
+    assert [replay.replay("llm", {'prompt': "same"})['content'] for _ in range(3)] == ["first", "second", "second"]
@@ -0,0 +1,68 @@
+import pytest
+
+from resilience_helper import CircuitBreaker, CircuitOpenError
+
+
+def fail_with(error):
+    def call():
+        raise error
+    return call
+
+
+def test_breaker_opens_after_consecutive_transient_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breaker.call(fail_with(ConnectionError("connection reset")))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(ConnectionError):
+        breaker.call(fail_with(ConnectionError("connection reset")))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
+    assert breaker.get_stats()['rejected'] == 1
+
+
+def test_breaker_ignores_permanent_errors_and_resets_on_success(clock):
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=30)
+    for _ in range(5):
+        with pytest.raises(ValueError):
+            breaker.call(fail_with(ValueError("bad request")))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(TimeoutError):
+        breaker.call(fail_with(TimeoutError()))
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.get_stats()['consecutive_failures'] == 0
+
+
+def test_breaker_lets_one_probe_through_after_recovery_timeout(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail_with(ConnectionError()))
+    clock.advance(29)
+    assert not breaker.allow_request()
+
+    clock.advance(2)
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+
+
+def test_breaker_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail_with(ConnectionError()))
+    clock.advance(31)
+    with pytest.raises(ConnectionError):
+        breaker.call(fail_with(ConnectionError()))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()['times_opened'] == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: "not called")
@@ -0,0 +1,76 @@
+import pytest
+
+from journey_helper import JOURNEY_STAGES, LocalJourneyBuilder, parse_year
+
+
+def book(title, year, description):
+    return {'title': title, 'author': "Someone", 'year': year, 'description': description, 'reason': ""}
+
+
+SEED = "Dune"
+# Listed in the order the LLM ranked them
+BOOKS = [
+    book("Children of Dune", "1976", "The twins of Paul Atreides inherit the desert empire."),
+    book("Dune Messiah", "1969", "Paul Atreides rules the desert planet Dune as emperor."),
+    book("Foundation", "1951", "A mathematician plans for the fall of a galactic empire."),
+    book("The Left Hand of Darkness", "1969", "An envoy learns the politics of an ice planet."),
+    book("Wolf Hall", "2009", "Thomas Cromwell rises at the court of Henry VIII."),
+]
+
+
+def journey_titles(journey):
+    return [step['title'] for step in journey['steps']]
+
+
+def test_parse_year_reads_the_first_year():
+    assert parse_year("1818 (revised 1831)") == 1818
+    assert parse_year("c. 1600") == 1600
+    assert parse_year("unknown") is None
+
+
+def test_journey_starts_closest_to_the_seed_and_ends_furthest_from_it():
+    journey = LocalJourneyBuilder().build(BOOKS, SEED)
+    assert [step['stage'] for step in journey['steps']] == JOURNEY_STAGES
+    titles = journey_titles(journey)
+    assert titles[0] == "Dune Messiah"
+    # Foundation is as far from the seed, but ranked higher
+    assert titles[-1] == "The Left Hand of Darkness"
+    # The books between are read in publication order
+    assert titles[1:-1] == ["Foundation", "Children of Dune", "Wolf Hall"]
+
+
+def test_journey_is_deterministic():
+    assert LocalJourneyBuilder().build(BOOKS, SEED) == LocalJourneyBuilder().build([dict(b) for b in BOOKS], SEED)
+
+
+def test_reasons_are_specific_to_each_step():
+    journey = LocalJourneyBuilder().build(BOOKS, SEED)
+    reasons = [step['reason'] for step in journey['steps']]
+    assert len(set(reasons)) == len(reasons)
+    assert reasons[0] == "The closest match to Dune, an easy way in (1969)."
+    assert reasons[-1] == "Travels furthest from Dune (1969), to finish on."
+    assert "1951" in reasons[1]
+    # No reading time is claimed: the parsed books don't say how long they are
+    assert not any("about" in reason for reason in reasons)
+    assert journey['theme'] == (
+        "From Dune Messiah to The Left Hand of Darkness, a path for readers of Dune spanning 1951 to 2009."
+    )
+
+
+def test_more_books_than_steps_keeps_the_closest_five():
+    far_off = book("A Field Guide to Mushrooms", "2015", "Identifying fungi in temperate woodland.")
+    journey = LocalJourneyBuilder().build(BOOKS + [far_off], SEED)
+    assert "A Field Guide to Mushrooms" not in journey_titles(journey)
+    assert len(journey['steps']) == len(JOURNEY_STAGES)
+
+
+def test_fewer_books_than_steps_always_finish():
+    journey = LocalJourneyBuilder().build(BOOKS[:3], SEED)
+    assert [step['stage'] for step in journey['steps']] == ["Start with", "Continue with", "Finish with"]
+    single = LocalJourneyBuilder().build(BOOKS[1:2], SEED)
+    assert [step['stage'] for step in single['steps']] == ["Start with"]
+
+
+def test_books_without_a_title_are_skipped():
+    with pytest.raises(ValueError):
+        LocalJourneyBuilder().build([book("", "2000", "No title")], SEED)
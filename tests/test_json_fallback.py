@@ -0,0 +1,37 @@
+import httpx
+import pytest
+from groq import BadRequestError
+
+import fake_llm_helper
+from langchain_helper import split_book_entries
+
+
+def json_validate_failed(*args, **kwargs):
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    body = {'error': {
+        'message': "Failed to generate JSON. Please adjust your prompt.",
+        'type': "invalid_request_error",
+        'code': "json_validate_failed",
+        'failed_generation': '{"books": [{"title": "Dune Messiah"'
+    }}
+    raise BadRequestError(f"Error code: 400 - {body}", response=httpx.Response(400, request=request), body=body)
+
+
+def test_groq_json_validation_error_falls_back_to_chain(recommender, llm_calls, monkeypatch):
+    monkeypatch.setattr(fake_llm_helper.FakeChatModel, "_structured_answer", json_validate_failed)
+    result = recommender.generate_book_recommendations("Dune", 3, mode="json")
+    assert len(split_book_entries(result['book_recommendations'])) == 3
+    assert result['reading_journey']
+    assert llm_calls() == {'structured': 1, 'books': 1, 'journey': 1}
+
+
+def test_other_bad_requests_are_not_retried_through_the_chain(recommender, llm_calls, monkeypatch):
+    def context_too_long(*args, **kwargs):
+        request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+        body = {'error': {'message': "Please reduce the length of the messages.", 'code': "context_length_exceeded"}}
+        raise BadRequestError(f"Error code: 400 - {body}", response=httpx.Response(400, request=request), body=body)
+
+    monkeypatch.setattr(fake_llm_helper.FakeChatModel, "_structured_answer", context_too_long)
+    with pytest.raises(Exception, match="context_length_exceeded"):
+        recommender.generate_book_recommendations("Dune", 3, mode="json")
+    assert llm_calls() == {'structured': 1}
@@ -0,0 +1,51 @@
+from langchain_helper import split_book_entries
+
+
+def titles(recommender, result):
+    return [recommender.parse_book_entry(entry)['title'] for entry in split_book_entries(result['book_recommendations'])]
+
+
+def test_load_more_appends_unseen_books(recommender):
+    shown = recommender.generate_book_recommendations("Dune", 5)
+    more = recommender.load_more_recommendations("Dune", shown, 3)
+
+    assert titles(recommender, more)[:5] == titles(recommender, shown)
+    assert len(set(titles(recommender, more))) == 8
+    assert more['loaded_more'] == 3
+    assert more['reading_journey'] == shown['reading_journey']
+
+
+def test_load_more_takes_books_from_the_superset_before_asking_the_llm(recommender, llm_calls):
+    shown = recommender.generate_book_recommendations("Dune", 5)
+    # Right away, while the stream may still be reading the rest of the superset
+    recommender.load_more_recommendations("Dune", shown, 3)
+    assert llm_calls() == {'books': 1, 'journey': 1}
+
+
+def test_load_more_beyond_the_superset_asks_only_for_the_rest(recommender, llm_calls):
+    shown = recommender.generate_book_recommendations("Dune", 8)
+    more = recommender.load_more_recommendations("Dune", shown, 5)
+    assert len(set(titles(recommender, more))) == 13
+    assert llm_calls().get('books_more') == 1
+
+
+def test_plain_request_for_the_loaded_total_is_not_served_the_extended_list(recommender, llm_calls):
+    shown = recommender.generate_book_recommendations("Dune", 5)
+    recommender.load_more_recommendations("Dune", shown, 3)
+    before = llm_calls()
+
+    plain = recommender.generate_book_recommendations("Dune", 8)
+    assert 'loaded_more' not in plain
+    assert len(split_book_entries(plain['book_recommendations'])) == 8
+    books = [recommender.parse_book_entry(entry) for entry in split_book_entries(plain['book_recommendations'])]
+    assert recommender.find_incomplete_books(books, 8) == ({}, 0)
+    # Still served from the superset: no repair or extra generation
+    assert llm_calls() == before
+
+
+def test_repeated_load_more_is_served_from_cache(recommender, llm_calls):
+    shown = recommender.generate_book_recommendations("Dune", 8)
+    first = recommender.load_more_recommendations("Dune", shown, 5)
+    before = llm_calls()
+    assert recommender.load_more_recommendations("Dune", shown, 5) == first
+    assert llm_calls() == before
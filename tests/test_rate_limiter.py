@@ -0,0 +1,189 @@
+import asyncio
+import threading
+
+import pytest
+
+from resilience_helper import RateLimiter, RateLimitTimeout, TokenReservation, _TokenBucket
+
+
+def test_token_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = _TokenBucket(60)
+    bucket.available = 0
+    clock.advance(10)
+    bucket.refill()
+    assert bucket.available == pytest.approx(10)
+    assert bucket.time_until(25) == pytest.approx(15)
+    clock.advance(600)
+    bucket.refill()
+    assert bucket.available == 60
+    # Requests larger than the bucket only wait for a full bucket
+    assert bucket.time_until(100) == 0
+
+
+def test_rate_limiter_grants_within_budget_without_queueing():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_wait=1)
+    assert limiter.acquire("a", tokens=2000) < 0.05
+    assert limiter.acquire("b", tokens=2000) < 0.05
+    stats = limiter.get_stats()
+    assert stats['granted'] == 2
+    assert stats['queued'] == 0
+    assert stats['tokens_available'] == pytest.approx(2000, abs=5)
+
+
+def test_rate_limiter_times_out_and_leaves_the_queue():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_wait=0.2)
+    limiter.acquire("a", tokens=1000)
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire("a", tokens=1000)
+    assert limiter.queue_depth() == 0
+    assert limiter.get_stats()['timeouts'] == 1
+
+
+def test_rate_limiter_serves_sessions_round_robin(wait_until):
+    # 20 requests per second once the initial budget is gone
+    limiter = RateLimiter(requests_per_minute=1200, tokens_per_minute=100000, max_wait=5)
+    limiter._requests.available = 0
+    served = []
+    positions = {}
+
+    def request(name, session):
+        def on_wait(position, waited):
+            positions.setdefault(name, position)
+        limiter.acquire(session, requests=1, on_wait=on_wait)
+        served.append(name)
+
+    threads = []
+    for name, session in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b")]:
+        thread = threading.Thread(target=request, args=(name, session))
+        thread.start()
+        threads.append(thread)
+        # Fix the queue order before the next request arrives
+        wait_until(lambda: limiter.queue_depth() == len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    # One busy session can't make the other wait behind all of its requests
+    assert served == ["a1", "b1", "a2", "a3"]
+    assert positions["b1"] == 2
+    assert limiter.get_stats()['queued'] == 4
+
+
+def test_rate_limiter_async_acquire_cancelled_while_queued_leaves_the_queue():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=10, max_wait=5)
+
+    async def scenario():
+        await limiter.acquire_async("a", tokens=10)
+        waiting = asyncio.create_task(limiter.acquire_async("b", tokens=10))
+        await asyncio.sleep(0.05)
+        assert limiter.queue_depth() == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    assert limiter.queue_depth() == 0
+
+
+def test_settled_reservation_credits_unused_tokens_and_shrinks_later_reservations():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_wait=1)
+    limiter.acquire("a", tokens=3000)
+    reservation = TokenReservation(limiter, 3000, 3000)
+    reservation.run_started()
+    reservation.call_finished()
+    # A stream still running keeps its reservation
+    assert limiter.get_stats()['credited_tokens'] == 0
+    reservation.run_finished(1000)
+
+    stats = limiter.get_stats()
+    assert stats['credited_tokens'] == pytest.approx(2000)
+    assert stats['tokens_available'] == pytest.approx(5000, abs=5)
+    assert limiter.expected_tokens(3000) < 3000
+
+
+def test_reservation_of_a_call_that_never_reached_upstream_is_returned_in_full():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_wait=1)
+    limiter.acquire("a", tokens=3000)
+    TokenReservation(limiter, 3000, 3000).call_finished()
+    assert limiter.get_stats()['credited_tokens'] == pytest.approx(3000)
+    assert limiter.usage_ratio == 1.0
+
+
+def test_overrun_is_charged_to_the_budget():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000, max_wait=1)
+    limiter.acquire("a", tokens=1000)
+    reservation = TokenReservation(limiter, 1000, 1000)
+    reservation.run_started()
+    reservation.run_finished(1500)
+    reservation.call_finished()
+    assert limiter.get_stats()['tokens_available'] == pytest.approx(4500, abs=5)
+
+
+def test_background_calls_wait_for_interactive_ones(wait_until):
+    limiter = RateLimiter(requests_per_minute=1200, tokens_per_minute=100000, max_wait=5)
+    limiter.add_background_session("warmup")
+    limiter._requests.available = 0
+    served = []
+    positions = {}
+
+    def request(session):
+        def on_wait(position, waited):
+            positions.setdefault(session, position)
+        limiter.acquire(session, requests=1, on_wait=on_wait)
+        served.append(session)
+
+    threads = []
+    for session in ["warmup", "user"]:
+        thread = threading.Thread(target=request, args=(session,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: limiter.queue_depth() == len(threads))
+    for thread in threads:
+        thread.join(5)
+
+    assert served == ["user", "warmup"]
+    assert positions == {'warmup': 1, 'user': 1}
+    stats = limiter.get_stats()
+    assert stats['background_granted'] == 1
+    # Wait statistics only describe interactive callers
+    assert stats['granted'] == 1
+
+
+def test_background_calls_are_held_to_their_share_of_the_budget():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_wait=1, background_share=0.25)
+    limiter.add_background_session("warmup")
+    limiter.acquire("warmup", tokens=250)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(limiter.acquire_async("warmup", tokens=250), 0.2)
+
+    asyncio.run(scenario())
+    # The rest of the budget is still there for users
+    assert limiter.acquire("user", tokens=700) < 0.05
+    assert limiter.queue_depth() == 0
+
+
+def test_background_calls_are_not_bound_by_the_queue_timeout():
+    # 200 requests per minute: the next request is 0.3s away
+    limiter = RateLimiter(requests_per_minute=200, tokens_per_minute=100000, max_wait=0.1)
+    limiter.add_background_session("warmup")
+    limiter._requests.available = 0
+    assert limiter.acquire("warmup") >= 0.1
+    assert limiter.get_stats()['timeouts'] == 0
+
+
+def test_background_share_must_be_a_fraction():
+    with pytest.raises(ValueError):
+        RateLimiter(background_share=0)
+
+
+def test_settled_background_reservation_credits_the_background_share():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=1000, max_wait=1, background_share=0.25)
+    limiter.add_background_session("warmup")
+    limiter.acquire("warmup", tokens=250)
+    reservation = TokenReservation(limiter, 250, 250, "warmup")
+    reservation.run_started()
+    reservation.run_finished(50)
+    reservation.call_finished()
+    # 200 of the share are back, so the next warm-up call fits right away
+    assert limiter.acquire("warmup", tokens=150) < 0.05
@@ -0,0 +1,77 @@
+import langchain_helper
+
+JOURNEY = "## 🌟 Your Reading Journey\n\n**Start with**: Dune Messiah - why"
+
+
+def book(title, **fields):
+    return dict({'title': title, 'author': f"Author of {title}", 'year': "1969",
+                 'description': f"About {title}", 'reason': f"Because of {title}"}, **fields)
+
+
+def shown(books):
+    return {
+        'book_title': "Dune",
+        'book_recommendations': langchain_helper.render_books_markdown(books),
+        'reading_journey': JOURNEY
+    }
+
+
+def test_find_incomplete_books_lists_missing_fields_and_books():
+    books = [book("Dune Messiah"), book("Foundation", year="", reason=""), book("", author="Nobody")]
+    incomplete, missing_books = langchain_helper.find_incomplete_books(books, 4)
+    assert incomplete == {1: ['year', 'reason']}
+    # The untitled entry can't be repaired, so it counts as missing
+    assert missing_books == 2
+
+
+def test_complete_list_is_left_alone(recommender, llm_calls):
+    books = [book("Dune Messiah"), book("Foundation"), book("Hyperion")]
+    recommendations = shown(books)
+    assert recommender.repair_recommendations("Dune", recommendations, books, 3) is recommendations
+    assert llm_calls() == {}
+
+
+def test_only_missing_fields_are_asked_for(recommender, llm_calls):
+    books = [book("Dune Messiah"), book("Foundation", author="Isaac Asimov", year="", description=""), book("Hyperion")]
+    result = recommender.repair_recommendations("Dune", shown(books), books, 3)
+
+    assert llm_calls() == {'books_repair': 1}
+    assert result['repaired'] == 1
+    assert result['reading_journey'] == JOURNEY
+    repaired = result['books'][1]
+    assert repaired['title'] == "Foundation"
+    assert repaired['author'] == "Isaac Asimov"
+    assert repaired['year'] and repaired['description']
+    assert result['books'][0] == book("Dune Messiah")
+
+
+def test_missing_books_are_generated_without_repeats(recommender, llm_calls):
+    books = [book("Dune Messiah"), book("Foundation")]
+    result = recommender.repair_recommendations("Dune", shown(books), books, 4)
+
+    assert llm_calls() == {'books_more': 1}
+    assert result['repaired'] == 2
+    titles = [entry['title'] for entry in result['books']]
+    assert titles[:2] == ["Dune Messiah", "Foundation"]
+    assert len(titles) == len(set(titles)) == 4
+    assert recommender.find_incomplete_books(result['books'], 4) == ({}, 0)
+
+
+def test_repaired_list_replaces_the_cached_one(recommender, llm_calls):
+    books = [book("Dune Messiah"), book("Foundation", reason=""), book("Hyperion")]
+    repaired = recommender.repair_recommendations("Dune", shown(books), books, 3)
+    assert llm_calls() == {'books_repair': 1}
+
+    cached = recommender.generate_book_recommendations("Dune", 3)
+    assert cached['book_recommendations'] == repaired['book_recommendations']
+    assert llm_calls() == {'books_repair': 1}
+
+
+def test_failed_repair_returns_the_list_as_shown(recommender, llm_calls, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise Exception("Error code: 400 - bad request")
+
+    monkeypatch.setattr(langchain_helper, "_call_llm", unavailable)
+    books = [book("Dune Messiah", year="")]
+    recommendations = shown(books)
+    assert recommender.repair_recommendations("Dune", recommendations, books, 1) is recommendations
@@ -0,0 +1,115 @@
+import pytest
+
+from cache_helper import DEFAULT_SEMANTIC_THRESHOLD, SemanticCache, canonical_title, numeric_tokens, series_name
+
+# Spellings of the same book a reader might type
+SAME_BOOK = [
+    ("The Great Gatsby", "great gatsby"),
+    ("Pride and Prejudice", "pride & prejudice"),
+    ("The Girl with the Dragon Tattoo", "girl with the dragon tatoo"),
+    ("The Lord of the Rings", "lord of the ring"),
+    ("The Count of Monte Cristo", "count of monte christo"),
+    ("To Kill a Mockingbird", "to kill a mocking bird"),
+    ("Kafka on the Shore", "Kafka on the Shore novel"),
+]
+
+# Different books whose titles look alike
+DIFFERENT_BOOKS = [
+    ("Dark Matter", "Dark Matters"),
+    ("The Shining", "The Shining Girls"),
+    ("Little Women", "Little Men"),
+    ("Brave New World", "New World"),
+    ("Dune", "Dune Messiah"),
+    ("Ender's Game", "Ender's Shadow"),
+]
+
+# Books of a series only differ by their number
+SERIES_BOOKS = [
+    ("Harry Potter 1", "Harry Potter 7"),
+    ("Harry Potter book two", "Harry Potter book three"),
+    ("Rocky II", "Rocky III"),
+    ("Harry Potter 2", "Harry Potter and the Sorcerer's Stone 1"),
+]
+
+# What readers type for the same series, each of which missed the exact-key cache
+HARRY_POTTER = ["harry potter", "Harry Potter 1", "harry potter and the sorcerers stone"]
+
+# Other books of the same series still differ by their own title
+SERIES_SIBLINGS = [
+    ("Harry Potter and the Sorcerer's Stone", "Harry Potter and the Chamber of Secrets"),
+    ("Percy Jackson and the Lightning Thief", "Percy Jackson and the Sea of Monsters"),
+]
+
+
+def lookup_after_indexing(indexed, query):
+    cache = SemanticCache(threshold=DEFAULT_SEMANTIC_THRESHOLD)
+    cache.add(indexed, "fiction", "cache-key")
+    return cache.lookup(query, "fiction")
+
+
+@pytest.mark.parametrize("indexed, query", SAME_BOOK)
+def test_variants_of_a_title_match(indexed, query):
+    match = lookup_after_indexing(indexed, query)
+    assert match is not None
+    assert match[:2] == ("cache-key", indexed)
+
+
+@pytest.mark.parametrize("indexed, query", DIFFERENT_BOOKS + SERIES_BOOKS + SERIES_SIBLINGS)
+def test_different_books_do_not_match(indexed, query):
+    assert lookup_after_indexing(indexed, query) is None
+    assert lookup_after_indexing(query, indexed) is None
+
+
+def test_same_series_number_matches():
+    assert lookup_after_indexing("The Witcher 3", "the witcher 3") is not None
+    assert lookup_after_indexing("Harry Potter Book 2", "harry potter, book #2") is not None
+
+
+@pytest.mark.parametrize("indexed", HARRY_POTTER)
+@pytest.mark.parametrize("query", HARRY_POTTER)
+def test_ways_of_asking_for_a_series_match(indexed, query):
+    match = lookup_after_indexing(indexed, query)
+    assert match is not None
+    assert match[:2] == ("cache-key", indexed)
+
+
+def test_a_title_without_a_number_matches_any_volume():
+    assert lookup_after_indexing("The Witcher", "The Witcher 3") is not None
+    assert lookup_after_indexing("The Witcher 3", "the witcher") is not None
+
+
+def test_conflicting_volume_is_skipped_for_a_matching_one():
+    cache = SemanticCache(threshold=DEFAULT_SEMANTIC_THRESHOLD)
+    cache.add("Harry Potter 7", "fiction", "seventh")
+    cache.add("harry potter", "fiction", "series")
+    assert cache.lookup("Harry Potter 1", "fiction")[:2] == ("series", "harry potter")
+
+
+def test_numeric_tokens_normalize_words_and_roman_numerals():
+    assert numeric_tokens("Harry Potter Book Two") == ("2",)
+    assert numeric_tokens("Rocky III") == ("3",)
+    assert numeric_tokens("Catch-22") == ("22",)
+    assert numeric_tokens("Dune") == ()
+
+
+def test_series_name_is_the_part_before_the_subtitle():
+    assert series_name("Harry Potter and the Sorcerer's Stone") == "harry potter"
+    assert series_name("The Expanse: Leviathan Wakes") == "expanse"
+    assert series_name("Dune Messiah") == ""
+
+
+def test_canonical_title_drops_articles_and_punctuation():
+    assert canonical_title("The Hitchhiker's Guide") == "hitchhikers guide"
+    assert canonical_title("Pride & Prejudice") == "pride and prejudice"
+    # Series numbers are compared by numeric_tokens instead
+    assert canonical_title("Harry Potter Book 1") == "harry potter"
+    assert canonical_title("1984") == "1984"
+    # A title that is only an article keeps it
+    assert canonical_title("The") == "the"
+
+
+def test_lookup_only_searches_its_partition():
+    cache = SemanticCache(threshold=DEFAULT_SEMANTIC_THRESHOLD)
+    cache.add("The Great Gatsby", "fiction", "cache-key")
+    assert cache.lookup("The Great Gatsby", "poetry") is None
+    assert cache.get_stats()['misses'] == 1
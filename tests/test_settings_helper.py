@@ -0,0 +1,40 @@
+import pytest
+
+import settings_helper
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1", True), ("true", True), ("Yes", True), (" on ", True),
+    ("0", False), ("FALSE", False), ("no", False), ("off", False),
+])
+def test_env_bool_parses_common_spellings(monkeypatch, value, expected):
+    monkeypatch.setenv("BOOKVOYAGER_TEST_FLAG", value)
+    assert settings_helper.env_bool("BOOKVOYAGER_TEST_FLAG", not expected) is expected
+
+
+@pytest.mark.parametrize("value", [None, "", "maybe"])
+def test_env_bool_falls_back_to_default(monkeypatch, value):
+    if value is None:
+        monkeypatch.delenv("BOOKVOYAGER_TEST_FLAG", raising=False)
+    else:
+        monkeypatch.setenv("BOOKVOYAGER_TEST_FLAG", value)
+    assert settings_helper.env_bool("BOOKVOYAGER_TEST_FLAG", True) is True
+    assert settings_helper.env_bool("BOOKVOYAGER_TEST_FLAG", False) is False
+
+
+def test_env_numbers_parse_or_fall_back(monkeypatch):
+    monkeypatch.setenv("BOOKVOYAGER_TEST_NUMBER", "12")
+    assert settings_helper.env_int("BOOKVOYAGER_TEST_NUMBER", 3) == 12
+    assert settings_helper.env_float("BOOKVOYAGER_TEST_NUMBER", 3.0) == 12.0
+    monkeypatch.setenv("BOOKVOYAGER_TEST_NUMBER", "2.5")
+    assert settings_helper.env_float("BOOKVOYAGER_TEST_NUMBER", 3.0) == 2.5
+    assert settings_helper.env_int("BOOKVOYAGER_TEST_NUMBER", 3) == 3
+    monkeypatch.setenv("BOOKVOYAGER_TEST_NUMBER", "")
+    assert settings_helper.env_int("BOOKVOYAGER_TEST_NUMBER", 3) == 3
+
+
+def test_env_str_keeps_an_empty_value(monkeypatch):
+    monkeypatch.setenv("BOOKVOYAGER_TEST_PATH", "")
+    assert settings_helper.env_str("BOOKVOYAGER_TEST_PATH", "default.db") == ""
+    monkeypatch.delenv("BOOKVOYAGER_TEST_PATH")
+    assert settings_helper.env_str("BOOKVOYAGER_TEST_PATH", "default.db") == "default.db"
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+from resilience_helper import SingleFlight
+
+
+def test_single_flight_coalesces_concurrent_calls(wait_until):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return {'value': 42}
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(5)]
+    threads[0].start()
+    wait_until(lambda: flight.in_flight("key"))
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.get_stats()['followers'] == 4)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert results == [{'value': 42}] * 5
+    # Every caller gets its own copy to mutate
+    assert len({id(result) for result in results}) == 5
+    assert not flight.in_flight("key")
+
+
+def test_single_flight_propagates_errors_to_every_waiter_then_retries(wait_until):
+    flight = SingleFlight()
+    release = threading.Event()
+    errors = []
+
+    def failing():
+        release.wait(2)
+        raise ValueError("upstream failed")
+
+    def caller():
+        try:
+            flight.do("key", failing)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    threads[0].start()
+    wait_until(lambda: flight.in_flight("key"))
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: flight.get_stats()['followers'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert errors == ["upstream failed"] * 3
+    # A failed flight is closed, so the next caller tries again
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+def test_single_flight_async_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do_async("key", work) for _ in range(4)))
+
+    assert asyncio.run(scenario()) == ["done"] * 4
+    assert len(calls) == 1
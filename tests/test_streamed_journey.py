@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import langchain_helper
+
+BOOKS = [
+    {'title': f"Book {i}", 'author': f"Author {i}", 'year': "2000", 'description': "About it", 'reason': "Because"}
+    for i in range(1, 11)
+]
+BOOKS_MARKDOWN = langchain_helper.render_books_markdown(BOOKS)
+
+
+def test_streamed_journey_does_not_join_a_generate_flight(recommender):
+    # A generate call for the full superset is in flight under the same cache key
+    superset_key = recommender.make_recommendation_cache_key("Dune", langchain_helper.SUPERSET_SIZE, mode="chain")
+    future, leader = recommender.recommendation_flight.join(superset_key)
+    assert leader
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        result = executor.submit(
+            recommender.complete_streamed_recommendations, "Dune", BOOKS_MARKDOWN,
+            langchain_helper.SUPERSET_SIZE, mode="chain"
+        ).result(timeout=10)
+        assert result['book_recommendations'] == BOOKS_MARKDOWN
+        assert result['reading_journey']
+        assert not future.done()
+    finally:
+        recommender.recommendation_flight.complete(superset_key, result=None)
+        executor.shutdown()
@@ -0,0 +1,115 @@
+import pytest
+
+import langchain_helper
+from langchain_helper import _visible_books_text, slice_books_markdown, slice_recommendations, split_book_entries
+
+TITLES = ["Dune", "Hyperion", "Foundation", "Solaris", "Neuromancer", "Ubik"]
+
+
+def book(title):
+    return {
+        'title': title,
+        'author': f"Author of {title}",
+        'year': "1965",
+        'description': f"About {title}",
+        'reason': f"Because of {title}"
+    }
+
+
+BOOKS = [book(title) for title in TITLES]
+BOOKS_MARKDOWN = langchain_helper.render_books_markdown(BOOKS)
+
+
+def journey_mentioning(*titles):
+    return "## 🌟 Your Reading Journey\n\n" + "\n".join(f"**Next**: {title} - why" for title in titles)
+
+
+def test_slice_books_markdown_keeps_the_first_entries():
+    sliced = slice_books_markdown(BOOKS_MARKDOWN, 3)
+    assert langchain_helper.extract_streamed_titles(sliced + "\n") == TITLES[:3]
+    assert sliced == "\n".join(split_book_entries(BOOKS_MARKDOWN)[:3])
+
+
+def test_slice_books_markdown_leaves_shorter_text_alone():
+    assert slice_books_markdown(BOOKS_MARKDOWN, 6) == BOOKS_MARKDOWN
+    assert slice_books_markdown(BOOKS_MARKDOWN, 10) == BOOKS_MARKDOWN
+
+
+def test_slice_markdown_result_keeps_journey_of_kept_books():
+    superset = {'book_recommendations': BOOKS_MARKDOWN, 'reading_journey': journey_mentioning("Dune", "Solaris")}
+    sliced, journey_outdated = slice_recommendations(superset, 4)
+    assert not journey_outdated
+    assert len(split_book_entries(sliced['book_recommendations'])) == 4
+    assert sliced['reading_journey'] == superset['reading_journey']
+    # The cached superset itself is untouched
+    assert superset['book_recommendations'] == BOOKS_MARKDOWN
+
+
+def test_slice_markdown_result_flags_journey_of_dropped_books():
+    superset = {'book_recommendations': BOOKS_MARKDOWN, 'reading_journey': journey_mentioning("Dune", "Ubik")}
+    _, journey_outdated = slice_recommendations(superset, 4)
+    assert journey_outdated
+
+
+def test_slice_structured_result_rerenders_kept_books():
+    superset = {
+        'book_recommendations': BOOKS_MARKDOWN,
+        'books': BOOKS,
+        'reading_journey': journey_mentioning("Hyperion", "Neuromancer")
+    }
+    sliced, journey_outdated = slice_recommendations(superset, 2)
+    assert sliced['books'] == BOOKS[:2]
+    assert sliced['book_recommendations'] == langchain_helper.render_books_markdown(BOOKS[:2])
+    assert journey_outdated
+    assert len(superset['books']) == 6
+
+
+def test_slice_result_no_larger_than_requested_is_a_copy():
+    superset = {'book_recommendations': BOOKS_MARKDOWN, 'books': BOOKS, 'reading_journey': ""}
+    sliced, journey_outdated = slice_recommendations(superset, 6)
+    assert sliced == superset and sliced is not superset
+    assert not journey_outdated
+
+
+def test_visible_books_text_stops_at_the_next_entry():
+    entries = split_book_entries(BOOKS_MARKDOWN)
+    streamed = "\n".join(entries[:3]) + "\n4. **Tit"
+    visible, complete = _visible_books_text(streamed, 3)
+    # "4." may still be the start of the hidden fourth entry
+    assert visible == "\n".join(entries[:3]) + "\n"
+    assert not complete
+
+    visible, complete = _visible_books_text("\n".join(entries[:4]), 3)
+    assert complete
+    assert langchain_helper.extract_streamed_titles(visible) == TITLES[:3]
+
+
+def test_visible_books_text_shows_everything_before_the_last_entry():
+    streamed = "\n".join(split_book_entries(BOOKS_MARKDOWN)[:2]) + "\n   **Au"
+    assert _visible_books_text(streamed, 3) == (streamed, False)
+
+
+@pytest.mark.parametrize("mode", ["chain", "pipelined"])
+def test_small_request_streams_the_superset_and_generates_one_journey(recommender, llm_calls, mode):
+    result = recommender.generate_book_recommendations("Dune", 3, mode=mode)
+    assert len(split_book_entries(result['book_recommendations'])) == 3
+    assert result['reading_journey']
+    assert sum(llm_calls().values()) == 2
+
+    # Other sizes are sliced from the superset the stream cached
+    larger = recommender.generate_book_recommendations("Dune", 8, mode=mode)
+    assert split_book_entries(larger['book_recommendations'])[:3] == split_book_entries(result['book_recommendations'])
+    assert llm_calls().get('books') == 1
+
+
+def test_small_json_request_makes_a_single_structured_call(recommender, llm_calls):
+    result = recommender.generate_book_recommendations("Dune", 3, mode="json")
+    assert len(result['books']) == 3
+    assert llm_calls() == {'structured': 1}
+
+
+def test_json_request_is_sliced_from_a_cached_superset(recommender, llm_calls):
+    recommender.generate_book_recommendations("Dune", 10, mode="json")
+    result = recommender.generate_book_recommendations("Dune", 4, mode="json")
+    assert len(result['books']) == 4
+    assert llm_calls().get('structured') == 1
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import analytics_helper
+import langchain_helper
+import settings_helper
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEED_PATH = "warmup_seeds.jsonl"
+WARMUP_SESSION_ID = "cache-warmup"
+REQUEST_FIELDS = ("book_title", "num_books", "genres", "era", "reading_level", "book_length")
+
+
+def load_seed_requests(path: str) -> List[Dict]:
+    """Load warm-up requests from a JSONL file (one request object or bare title per line)"""
+    requests = []
+    if not path or not os.path.exists(path):
+        return requests
+
+    with open(path, encoding="utf-8") as seed_file:
+        for line_number, line in enumerate(seed_file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                entry = line  # a bare title
+            if isinstance(entry, str):
+                entry = {'book_title': entry}
+            if not isinstance(entry, dict) or not entry.get('book_title'):
+                logger.warning(f"Skipping invalid warm-up seed on line {line_number}")
+                continue
+            requests.append({field: entry[field] for field in REQUEST_FIELDS if entry.get(field) is not None})
+    return requests
+
+
+class CacheWarmer:
+    """Pre-populates the recommendation cache in a background thread under its own rate budget"""
+
+    def __init__(self, seed_path: Optional[str] = None, top_queries: Optional[int] = None,
+                 requests_per_minute: Optional[float] = None):
+        if seed_path is None:
+            seed_path = settings_helper.env_str("BOOKVOYAGER_WARMUP_SEED", DEFAULT_SEED_PATH)
+        if top_queries is None:
+            top_queries = settings_helper.env_int("BOOKVOYAGER_WARMUP_TOP", 50)
+        if requests_per_minute is None:
+            requests_per_minute = settings_helper.env_float("BOOKVOYAGER_WARMUP_RPM", 4)
+
+        self.seed_path = seed_path
+        self.top_queries = top_queries
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.progress = {
+            'running': False,
+            'total': 0,
+            'done': 0,
+            'warmed': 0,
+            'already_cached': 0,
+            'failed': 0,
+            'started_at': None,
+            'finished_at': None
+        }
+
+    def collect_requests(self) -> List[Dict]:
+        """Combine seed requests with the most popular recorded queries, without duplicates"""
+        requests = load_seed_requests(self.seed_path)
+        if self.top_queries > 0:
+            for query in analytics_helper.get_popular_queries().top(self.top_queries):
+                requests.append({field: query[field] for field in REQUEST_FIELDS if query.get(field) is not None})
+
+        unique, seen = [], set()
+        for request in requests:
+            key = langchain_helper.make_recommendation_cache_key(
+                request['book_title'], request.get('num_books', 5), request.get('genres'),
+                request.get('era'), request.get('reading_level'), request.get('book_length'),
+                mode=langchain_helper.GENERATION_MODE
+            )
+            if key not in seen:
+                seen.add(key)
+                unique.append(dict(request, cache_key=key))
+        return unique
+
+    def start(self):
+        """Start warming in a daemon thread; does nothing if already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            # Warm-up calls only get the background share of the Groq budget, after interactive callers
+            langchain_helper.rate_limiter.add_background_session(WARMUP_SESSION_ID)
+            self._thread = threading.Thread(target=self._run, name="cache-warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Ask the warm-up thread to stop after the current request"""
+        self._stop.set()
+
+    def _update(self, **changes):
+        with self._lock:
+            self.progress.update(changes)
+
+    def _increment(self, *counters):
+        with self._lock:
+            for counter in counters:
+                self.progress[counter] += 1
+
+    def _wait_for_idle(self):
+        """Hold back while interactive requests are queued for Groq capacity"""
+        # Calls of a generation already under way yield to interactive callers in the rate limiter
+        while not self._stop.is_set() and langchain_helper.rate_limiter.queue_depth() > 0:
+            self._stop.wait(1.0)
+
+    def _run(self):
+        requests = self.collect_requests()
+        self._update(running=True, total=len(requests), done=0, warmed=0, already_cached=0, failed=0,
+                     started_at=datetime.now().isoformat(), finished_at=None)
+        logger.info(f"Cache warm-up started for {len(requests)} requests")
+
+        for request in requests:
+            if self._stop.is_set():
+                break
+            cache_key = request.pop('cache_key')
+            cached = langchain_helper.recommendation_cache.get(cache_key)
+            if cached and cached.get('reading_journey'):
+                self._increment('already_cached', 'done')
+                continue
+
+            self._wait_for_idle()
+            started = time.monotonic()
+            try:
+                langchain_helper.generate_book_recommendations(session_id=WARMUP_SESSION_ID, **request)
+                self._increment('warmed', 'done')
+            except Exception as e:
+                logger.warning(f"Cache warm-up failed for '{request['book_title']}': {str(e)}")
+                self._increment('failed', 'done')
+
+            # Spend at most the warm-up budget, leaving the rest for interactive traffic
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+        self._update(running=False, finished_at=datetime.now().isoformat())
+        progress = self.get_progress()
+        logger.info(
+            f"Cache warm-up finished: {progress['warmed']} warmed, "
+            f"{progress['already_cached']} already cached, {progress['failed']} failed"
+        )
+
+    def get_progress(self) -> Dict:
+        """Get warm-up progress counters"""
+        with self._lock:
+            return dict(self.progress)
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+def start_cache_warmup() -> Optional[CacheWarmer]:
+    """Start the process-wide cache warm-up once; returns None when disabled"""
+    global _warmer
+    if not settings_helper.env_bool("BOOKVOYAGER_WARMUP", True):
+        return None
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = CacheWarmer()
+            _warmer.start()
+        return _warmer